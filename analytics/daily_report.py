@@ -0,0 +1,272 @@
+# coding: utf-8
+"""
+Инкрементальное ведение дневного отчёта (DailySalesReport).
+
+Раньше каждая оплата пересобирала отчёт дня целиком: агрегаты по всем
+продажам, позициям, возвратам и платежам за день - чем больше продаж,
+тем дороже каждая следующая. Теперь оплата, офлайн выгрузка и возврат
+прибавляют к строке дня только свой вклад:
+
+1. В транзакции продажи/возврата - одним INSERT ... ON CONFLICT (date)
+   DO UPDATE: количество, сумма, скидка, налог, товары, суммы по способам
+   оплаты; средний чек считается в том же UPDATE (как record_cashier_sales
+   для сводки кассиров).
+2. После коммита - уникальные товары, клиенты и новые клиенты дня по
+   HyperLogLog в Redis (PFADD + PFCOUNT, analytics:hll:<schema>:<день>:<вид>),
+   отдельным UPDATE. Значения приблизительные (погрешность ~1%) и только
+   растут: возврат их не уменьшает. Если Redis недоступен - пропускаются.
+
+Счётчики смен (sessions_opened/closed) и точные уникальные значения
+даёт пересборка _update_daily_sales_report: задача rebuild_daily_sales_reports
+каждую ночь пересобирает вчерашний день и исправляет накопленное расхождение.
+
+Режим включается ANALYTICS_DAILY_REPORT_INCREMENTAL (по умолчанию включён);
+если выключен, отчёт пересобирается очередью analytics.queue, как раньше.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from analytics.models import DailySalesReport
+from core.schema_utils import SchemaManager
+from sales.models import round_money
+
+logger = logging.getLogger(__name__)
+
+# Поля строки дня, к которым прибавляется вклад продажи/возврата
+DELTA_FIELDS = (
+    'total_sales_count', 'total_sales', 'cash_sales', 'card_sales', 'credit_sales',
+    'total_discount', 'total_tax', 'total_items_sold',
+)
+
+PAYMENT_FIELDS = {
+    'cash': 'cash_sales',
+    'card': 'card_sales',
+    'credit': 'credit_sales',
+}
+
+# Вид HLL -> поле отчёта
+HLL_FIELDS = {
+    'products': 'unique_products_sold',
+    'customers': 'unique_customers',
+    'new_customers': 'new_customers',
+}
+
+# Ключи HLL нужны, пока день ещё могут дополнить (выгрузка офлайн продаж)
+HLL_TTL = int(timedelta(days=3).total_seconds())
+
+
+def is_enabled():
+    return settings.ANALYTICS_DAILY_REPORT_INCREMENTAL
+
+
+def sale_day(sale):
+    """День отчёта продажи - локальная дата завершения (как completed_at__date)"""
+    return timezone.localdate(sale.completed_at)
+
+
+def sale_delta(sale, payment_totals, quantity, product_ids):
+    """
+    Вклад завершённой продажи в отчёт её дня.
+
+    Args:
+        sale: завершённая продажа (completed_at заполнен)
+        payment_totals: {способ оплаты: сумма}
+        quantity: количество товаров в чеке
+        product_ids: товары чека
+    """
+    delta = {
+        'day': sale_day(sale),
+        'total_sales_count': 1,
+        'total_sales': sale.total_amount,
+        'total_discount': sale.discount_amount,
+        'total_tax': sale.tax_amount,
+        'total_items_sold': quantity,
+        'products': set(product_ids),
+        'customers': {sale.customer_id} if sale.customer_id else set(),
+    }
+    for method, field in PAYMENT_FIELDS.items():
+        delta[field] = payment_totals.get(method, Decimal('0.00'))
+    return delta
+
+
+def refund_delta(sale, amount, quantity, payments, fully_refunded=False,
+                 refunded_before=Decimal('0.00'), net_payments=None):
+    """
+    Вклад возврата (со знаком минус) в отчёт дня продажи.
+
+    Частичный возврат уменьшает сумму, товары и платежи на сумму возврата.
+    После полного возврата продажа перестаёт быть completed, и пересборка
+    её не видит - поэтому убирается весь оставшийся вклад продажи.
+
+    Args:
+        amount: сумма этого возврата
+        quantity: количество товаров этого возврата (для полного - всё, что оставалось в чеке)
+        payments: {способ оплаты: сумма} возврата денег (положительные)
+        fully_refunded: после возврата в чеке ничего не осталось
+        refunded_before: сумма прошлых возвратов по чеку
+        net_payments: {способ оплаты: сумма} платежей чека до этого возврата (для полного)
+    """
+    delta = {'day': sale_day(sale), 'products': set(), 'customers': set()}
+    if fully_refunded:
+        delta.update({
+            'total_sales_count': -1,
+            'total_sales': -(sale.total_amount - refunded_before),
+            'total_discount': -sale.discount_amount,
+            'total_tax': -sale.tax_amount,
+            'total_items_sold': -quantity,
+        })
+        payments = net_payments or {}
+    else:
+        delta.update({
+            'total_sales_count': 0,
+            'total_sales': -amount,
+            'total_discount': Decimal('0.00'),
+            'total_tax': Decimal('0.00'),
+            'total_items_sold': -quantity,
+        })
+    for method, field in PAYMENT_FIELDS.items():
+        delta[field] = -payments.get(method, Decimal('0.00'))
+    return delta
+
+
+def record_daily_report(deltas):
+    """
+    Прибавить вклады продаж/возвратов к отчётам их дней.
+
+    Вызывается в транзакции продажи или возврата: суммы пишутся одним
+    INSERT ... ON CONFLICT DO UPDATE, уникальные значения - после коммита
+    (см. docstring модуля). Ничего не делает, если режим выключен.
+    """
+    if not deltas or not is_enabled():
+        return
+
+    totals = defaultdict(lambda: dict.fromkeys(DELTA_FIELDS, Decimal('0')))
+    distinct = defaultdict(lambda: {'products': set(), 'customers': set()})
+    for delta in deltas:
+        day = delta['day']
+        for field in DELTA_FIELDS:
+            totals[day][field] += Decimal(str(delta[field]))
+        distinct[day]['products'].update(delta['products'])
+        distinct[day]['customers'].update(delta['customers'])
+
+    table = connection.ops.quote_name(DailySalesReport._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    params = []
+    for day, values in totals.items():
+        count = int(values['total_sales_count'])
+        params.extend([
+            connection.ops.adapt_datefield_value(day),
+            count,
+            values['total_sales'],
+            # Средний чек новой строки; для существующей считается в UPDATE
+            round_money(values['total_sales'] / count) if count > 0 else Decimal('0.00'),
+            values['cash_sales'],
+            values['card_sales'],
+            values['credit_sales'],
+            values['total_discount'],
+            values['total_tax'],
+            int(values['total_items_sold']),
+            now,
+            now,
+        ])
+    values_sql = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 0, 0, 0, 0, 0)'] * len(totals))
+
+    count = f'({table}.total_sales_count + EXCLUDED.total_sales_count)'
+    total = f'({table}.total_sales + EXCLUDED.total_sales)'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table}
+                (date, total_sales_count, total_sales, avg_sale_amount, cash_sales, card_sales, credit_sales,
+                 total_discount, total_tax, total_items_sold, created_at, updated_at,
+                 unique_products_sold, unique_customers, new_customers, sessions_opened, sessions_closed)
+            VALUES {values_sql}
+            ON CONFLICT (date)
+            DO UPDATE SET
+                total_sales_count = {count},
+                total_sales = {total},
+                avg_sale_amount = CASE WHEN {count} > 0 THEN ROUND({total} * 1.0 / {count}, 2) ELSE 0 END,
+                cash_sales = {table}.cash_sales + EXCLUDED.cash_sales,
+                card_sales = {table}.card_sales + EXCLUDED.card_sales,
+                credit_sales = {table}.credit_sales + EXCLUDED.credit_sales,
+                total_discount = {table}.total_discount + EXCLUDED.total_discount,
+                total_tax = {table}.total_tax + EXCLUDED.total_tax,
+                total_items_sold = {table}.total_items_sold + EXCLUDED.total_items_sold,
+                updated_at = EXCLUDED.updated_at
+            """,
+            params
+        )
+
+    distinct = {day: values for day, values in distinct.items() if values['products'] or values['customers']}
+    if distinct:
+        transaction.on_commit(lambda: _record_distinct(distinct))
+
+
+def _hll_key(schema_name, day, kind):
+    return f'analytics:hll:{schema_name}:{day.isoformat()}:{kind}'
+
+
+def _record_distinct(distinct):
+    """PFADD/PFCOUNT уникальных значений дней и UPDATE отчёта (после коммита)"""
+    from analytics.queue import _redis
+    from customers.models import Customer
+
+    customer_ids = {customer_id for values in distinct.values() for customer_id in values['customers']}
+    created_on = {}
+    if customer_ids:
+        created_on = {
+            customer_id: timezone.localdate(created_at)
+            for customer_id, created_at in Customer.objects.filter(pk__in=customer_ids).values_list('id', 'created_at')
+        }
+
+    schema_name = SchemaManager.get_current_schema()
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        counted = []
+        for day, values in distinct.items():
+            members = {
+                'products': values['products'],
+                'customers': values['customers'],
+                'new_customers': {
+                    customer_id for customer_id in values['customers']
+                    if created_on.get(customer_id) == day
+                },
+            }
+            for kind, ids in members.items():
+                if not ids:
+                    continue
+                key = _hll_key(schema_name, day, kind)
+                pipe.pfadd(key, *ids)
+                pipe.expire(key, HLL_TTL)
+                pipe.pfcount(key)
+                counted.append((day, kind))
+        results = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"HyperLogLog дневного отчёта недоступен ({schema_name}): {e}")
+        return
+
+    counts = defaultdict(dict)
+    for (day, kind), value in zip(counted, results[2::3]):
+        counts[day][HLL_FIELDS[kind]] = value
+
+    table = connection.ops.quote_name(DailySalesReport._meta.db_table)
+    with connection.cursor() as cursor:
+        for day, fields in counts.items():
+            # Оценка HLL не уменьшает значение, записанное пересборкой
+            assignments = ', '.join(
+                f'{field} = CASE WHEN {field} > %s THEN {field} ELSE %s END'
+                for field in fields
+            )
+            params = [value for value in fields.values() for _ in range(2)]
+            cursor.execute(
+                f'UPDATE {table} SET {assignments} WHERE date = %s',
+                params + [connection.ops.adapt_datefield_value(day)]
+            )
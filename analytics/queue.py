@@ -0,0 +1,145 @@
+# coding: utf-8
+"""
+Очередь пересчёта аналитики с объединением событий (coalescing).
+
+Раньше post_save продажи пересчитывал дневной отчёт, товары и клиента
+прямо в запросе оплаты, и время оплаты росло вместе с числом продаж за день.
+Теперь сигналы только кладут ключи в Redis множества магазина:
+
+    analytics:pending:<schema>:sales      - ID продаж (день, товары и клиент - по ним)
+    analytics:pending:<schema>:days       - дни для DailySalesReport
+    analytics:pending:<schema>:products   - "<product_id>:<день>" для ProductPerformance
+    analytics:pending:<schema>:customers  - ID клиентов для CustomerAnalytics
+
+Первое событие окна ставит задачу flush_analytics с задержкой
+ANALYTICS_COALESCE_SECONDS (флаг analytics:scheduled:<schema>, SET NX).
+Задача забирает множества целиком (MULTI: SMEMBERS + DEL) и пересчитывает
+каждый ключ один раз, сколько бы продаж ни пришло за окно.
+
+Ключи публикуются после коммита транзакции. Если Redis или брокер недоступны,
+или ANALYTICS_COALESCE_SECONDS = 0, пересчёт выполняется сразу, как раньше.
+"""
+
+import logging
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from core.schema_utils import SchemaManager
+
+logger = logging.getLogger(__name__)
+
+PENDING_KINDS = ('sales', 'days', 'products', 'customers')
+
+_client = None
+
+
+def _redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.ANALYTICS_QUEUE_REDIS_URL,
+            socket_connect_timeout=1,
+            socket_timeout=1,
+            decode_responses=True,
+        )
+    return _client
+
+
+def _pending_key(schema_name, kind):
+    return f'analytics:pending:{schema_name}:{kind}'
+
+
+def _scheduled_key(schema_name):
+    return f'analytics:scheduled:{schema_name}'
+
+
+def enqueue_analytics(sale_ids=(), days=(), product_days=(), customer_ids=()):
+    """
+    Запланировать пересчёт аналитики после коммита текущей транзакции.
+
+    Args:
+        sale_ids: продажи, по которым пересчитать день, товары и клиента
+        days: дни (date) для дневного отчёта
+        product_days: пары (product_id, date)
+        customer_ids: клиенты
+    """
+    members = {
+        'sales': {str(sale_id) for sale_id in sale_ids},
+        'days': {day.isoformat() for day in days},
+        'products': {f'{product_id}:{day.isoformat()}' for product_id, day in product_days},
+        'customers': {str(customer_id) for customer_id in customer_ids},
+    }
+    if any(members.values()):
+        transaction.on_commit(lambda: _enqueue(members))
+
+
+def _enqueue(members):
+    from analytics.tasks import flush_analytics
+
+    window = settings.ANALYTICS_COALESCE_SECONDS
+    if window <= 0:
+        recompute_members(members)
+        return
+
+    schema_name = SchemaManager.get_current_schema()
+    scheduled_key = _scheduled_key(schema_name)
+    client = None
+    try:
+        client = _redis()
+        pipe = client.pipeline()
+        for kind, values in members.items():
+            if values:
+                pipe.sadd(_pending_key(schema_name, kind), *values)
+        # Флаг живёт дольше окна: если задача потерялась, следующее окно поставит новую
+        pipe.set(scheduled_key, 1, nx=True, ex=window * 10)
+        if pipe.execute()[-1]:
+            flush_analytics.apply_async(args=[schema_name], countdown=window)
+    except Exception as e:
+        logger.warning(f"Очередь аналитики недоступна ({schema_name}), пересчёт сразу: {e}")
+        if client is not None:
+            try:
+                client.delete(scheduled_key)
+            except redis.RedisError:
+                pass
+        recompute_members(members)
+
+
+def pop_pending(schema_name):
+    """
+    Забрать накопленные ключи магазина.
+
+    Флаг снимается до чтения: событие, пришедшее во время пересчёта,
+    поставит следующую задачу, а не потеряется.
+
+    Returns:
+        dict: kind -> set строк
+    """
+    client = _redis()
+    client.delete(_scheduled_key(schema_name))
+    pipe = client.pipeline()
+    for kind in PENDING_KINDS:
+        pipe.smembers(_pending_key(schema_name, kind))
+        pipe.delete(_pending_key(schema_name, kind))
+    results = pipe.execute()
+    return {kind: results[index * 2] for index, kind in enumerate(PENDING_KINDS)}
+
+
+def recompute_members(members):
+    """Пересчёт по строковым ключам очереди (см. enqueue_analytics)"""
+    from datetime import date
+
+    from analytics.signals import recompute_analytics
+
+    product_days = set()
+    for value in members.get('products', ()):
+        product_id, day = value.split(':', 1)
+        product_days.add((int(product_id), date.fromisoformat(day)))
+
+    return recompute_analytics(
+        sale_ids={int(value) for value in members.get('sales', ())},
+        days={date.fromisoformat(value) for value in members.get('days', ())},
+        product_days=product_days,
+        customer_ids={int(value) for value in members.get('customers', ())},
+    )
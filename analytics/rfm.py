@@ -0,0 +1,257 @@
+# coding: utf-8
+"""
+RFM сегментация клиентов пачкой (NumPy).
+
+Раньше каждый клиент пересчитывался отдельно (~6 запросов), а баллы R/F/M
+ставились по жёстким порогам (7/30/60/90 дней, 20/10/5/2 покупки,
+5/2/1/0.5 млн сумм), одинаковым для ларька и гипермаркета. Теперь:
+
+1. Один GROUP BY по продажам периода: последняя покупка, количество,
+   сумма и средний чек каждого клиента; второй - по кредитным платежам.
+2. Баллы 1-5 - по квантилям распределения магазина
+   (ANALYTICS_RFM_QUANTILES, по умолчанию 20/40/60/80%), массивами NumPy.
+   Свежесть: чем меньше дней с последней покупки, тем выше балл.
+3. Сегмент - теми же правилами, что раньше (np.select по массивам баллов).
+4. INSERT ... ON CONFLICT (customer, period_start, period_end) DO UPDATE
+   (bulk_create) и один DELETE строк клиентов без покупок за период.
+
+Пересчёт отдельных клиентов (очередь analytics.queue) берёт пороги
+последнего полного пересчёта из кеша, чтобы баллы были сопоставимы;
+если их нет - считает пороги по всем клиентам магазина.
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.schema_utils import SchemaManager
+
+# Период анализа - последние 90 дней
+PERIOD_DAYS = 90
+
+# Пороги полного пересчёта живут до следующего ночного
+THRESHOLDS_TTL = int(timedelta(days=2).total_seconds())
+
+WRITE_BATCH_SIZE = 2000
+
+UPDATE_FIELDS = [
+    'recency_days', 'frequency', 'monetary', 'rfm_score', 'segment',
+    'purchases_count', 'total_spent', 'avg_purchase_amount',
+    'credit_purchases', 'total_credit_amount', 'avg_payment_delay_days', 'updated_at',
+]
+
+
+def rfm_period(today=None):
+    """(period_start, period_end) - последние PERIOD_DAYS дней по сегодня"""
+    today = today or timezone.localdate()
+    return today - timedelta(days=PERIOD_DAYS), today
+
+
+def _period_sales(period_start, period_end):
+    from sales.models import Sale
+
+    start = timezone.make_aware(datetime.combine(period_start, time.min))
+    end = timezone.make_aware(datetime.combine(period_end + timedelta(days=1), time.min))
+    return Sale.objects.filter(
+        status='completed',
+        customer__isnull=False,
+        completed_at__gte=start,
+        completed_at__lt=end
+    )
+
+
+def _metrics(sales):
+    """
+    Показатели клиентов одним GROUP BY.
+
+    Returns:
+        (ids, last_purchase, frequency, monetary, avg_purchase) - списки по клиенту
+    """
+    rows = sales.values('customer_id').annotate(
+        last_purchase=Max(TruncDate('completed_at', tzinfo=timezone.get_current_timezone())),
+        frequency=Count('id'),
+        monetary=Sum('total_amount'),
+        avg_purchase=Avg('total_amount'),
+    ).order_by().values_list('customer_id', 'last_purchase', 'frequency', 'monetary', 'avg_purchase')
+    columns = tuple(zip(*rows.iterator(chunk_size=WRITE_BATCH_SIZE)))
+    return columns or ((), (), (), (), ())
+
+
+def _recency_days(last_purchase, today):
+    return np.array([(today - day).days for day in last_purchase], dtype=np.int64)
+
+
+def quantiles():
+    """Квантили границ баллов - четыре числа из ANALYTICS_RFM_QUANTILES"""
+    values = tuple(float(value) for value in settings.ANALYTICS_RFM_QUANTILES)
+    if len(values) != 4 or list(values) != sorted(values) or not all(0 < value < 1 for value in values):
+        raise ValueError('ANALYTICS_RFM_QUANTILES: нужны четыре возрастающие доли между 0 и 1')
+    return values
+
+
+def compute_thresholds(recency, frequency, monetary):
+    """Границы баллов R, F, M по распределению клиентов (списки по 4 числа)"""
+    if not len(recency):
+        return None
+    points = quantiles()
+    return {
+        'recency': np.quantile(recency, points).tolist(),
+        'frequency': np.quantile(frequency, points).tolist(),
+        'monetary': np.quantile(monetary, points).tolist(),
+    }
+
+
+def score(values, thresholds, lower_is_better=False):
+    """
+    Баллы 1-5: сколько границ значение превышает.
+
+    Одинаковые значения получают одинаковый балл; если большинство клиентов
+    купили один раз, их F = 1, а не размазывается по нескольким баллам.
+    """
+    above = np.searchsorted(np.asarray(thresholds, dtype=np.float64), values, side='left')
+    return 5 - above if lower_is_better else 1 + above
+
+
+def segments(r_score, f_score, m_score):
+    """Сегменты клиентов по массивам баллов (правила проверяются по порядку)"""
+    high_r, low_r = r_score >= 4, r_score <= 2
+    rules = [
+        # Champions: высокие R, F, M
+        ('Champions', high_r & (f_score >= 4) & (m_score >= 4)),
+        # Loyal Customers: высокие F и M, средний R
+        ('Loyal Customers', (f_score >= 4) & (m_score >= 4)),
+        # Potential Loyalists: высокий R, средние F и M
+        ('Potential Loyalists', high_r & (f_score >= 3) & (m_score >= 3)),
+        # New Customers: высокий R, низкие F и M
+        ('New Customers', high_r & (f_score <= 2) & (m_score <= 2)),
+        # Promising: средний R, низкие F и M
+        ('Promising', (r_score >= 3) & (f_score <= 2)),
+        # Need Attention: средние R, F, M
+        ('Need Attention', (r_score >= 3) & (f_score >= 3)),
+        # At Risk: низкий R, высокие F и M
+        ('At Risk', low_r & (f_score >= 4) & (m_score >= 4)),
+        # Can't Lose Them: низкий R, очень высокие F и M
+        ("Can't Lose Them", low_r & (f_score >= 5) & (m_score >= 5)),
+        # Hibernating: низкий R, средние F и M
+        ('Hibernating', low_r & (f_score >= 2)),
+    ]
+    # Lost: все низкие
+    return np.select([condition for _, condition in rules], [name for name, _ in rules], default='Lost')
+
+
+def _thresholds_key(period_end):
+    return f'analytics:rfm:{SchemaManager.get_current_schema()}:{period_end.isoformat()}'
+
+
+def _population_thresholds(period_start, period_end):
+    """Пороги из кеша или по всем клиентам магазина за период"""
+    key = _thresholds_key(period_end)
+    thresholds = cache.get(key)
+    if thresholds is None:
+        _, last_purchase, frequency, monetary, _ = _metrics(_period_sales(period_start, period_end))
+        thresholds = compute_thresholds(
+            _recency_days(last_purchase, period_end),
+            np.array(frequency, dtype=np.float64),
+            np.array(monetary, dtype=np.float64),
+        )
+        if thresholds is not None:
+            cache.set(key, thresholds, THRESHOLDS_TTL)
+    return thresholds
+
+
+def update_customer_analytics(customer_ids=None, today=None):
+    """
+    Пересчитывает RFM аналитику клиентов за последние PERIOD_DAYS дней.
+
+    Args:
+        customer_ids: только эти клиенты (по умолчанию - все, пороги
+                      пересчитываются и кешируются)
+        today: последний день периода
+
+    Returns:
+        int: количество записанных строк
+    """
+    from analytics.models import CustomerAnalytics
+    from sales.models import Payment
+
+    period_start, period_end = rfm_period(today)
+    sales = _period_sales(period_start, period_end)
+    if customer_ids is not None:
+        customer_ids = list(customer_ids)
+        sales = sales.filter(customer_id__in=customer_ids)
+
+    ids, last_purchase, frequency, monetary, avg_purchase = _metrics(sales)
+    recency = _recency_days(last_purchase, period_end)
+    frequency_values = np.array(frequency, dtype=np.float64)
+    monetary_values = np.array(monetary, dtype=np.float64)
+
+    if customer_ids is None:
+        thresholds = compute_thresholds(recency, frequency_values, monetary_values)
+        if thresholds is not None:
+            cache.set(_thresholds_key(period_end), thresholds, THRESHOLDS_TTL)
+    elif ids:
+        thresholds = _population_thresholds(period_start, period_end)
+
+    rows = []
+    if ids:
+        r_score = score(recency, thresholds['recency'], lower_is_better=True)
+        f_score = score(frequency_values, thresholds['frequency'])
+        m_score = score(monetary_values, thresholds['monetary'])
+        rfm_score = (r_score + f_score + m_score) // 3
+        segment = segments(r_score, f_score, m_score)
+
+        # Кредитные покупки
+        credit = {
+            customer_id: (count, amount)
+            for customer_id, count, amount in Payment.objects.filter(
+                payment_method='credit',
+                sale__in=sales
+            ).values('sale__customer_id').annotate(
+                credit_count=Count('sale', distinct=True),
+                credit_amount=Sum('amount'),
+            ).order_by().values_list('sale__customer_id', 'credit_count', 'credit_amount')
+        }
+
+        for index, customer_id in enumerate(ids):
+            credit_count, credit_amount = credit.get(customer_id, (0, None))
+            rows.append(CustomerAnalytics(
+                customer_id=customer_id,
+                period_start=period_start,
+                period_end=period_end,
+                recency_days=int(recency[index]),
+                frequency=frequency[index],
+                monetary=monetary[index] or Decimal('0.00'),
+                rfm_score=int(rfm_score[index]),
+                segment=str(segment[index]),
+                purchases_count=frequency[index],
+                total_spent=monetary[index] or Decimal('0.00'),
+                avg_purchase_amount=avg_purchase[index] or Decimal('0.00'),
+                credit_purchases=credit_count,
+                total_credit_amount=credit_amount or Decimal('0.00'),
+                # Средняя задержка платежа (для кредитов) пока не считается
+                avg_payment_delay_days=0,
+            ))
+
+    CustomerAnalytics.objects.bulk_create(
+        rows,
+        batch_size=WRITE_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['customer', 'period_start', 'period_end'],
+        update_fields=UPDATE_FIELDS,
+    )
+
+    # Удаляем записи клиентов без покупок за период
+    stale = CustomerAnalytics.objects.filter(period_start=period_start, period_end=period_end)
+    if customer_ids is not None:
+        stale = stale.filter(customer_id__in=customer_ids).exclude(customer_id__in=ids)
+    else:
+        stale = stale.exclude(customer_id__in=sales.values('customer_id'))
+    stale.delete()
+
+    return len(rows)
@@ -3,8 +3,12 @@
 Signals для автоматического обновления аналитики.
 
 Обновляют агрегированные данные при изменениях в продажах, товарах и клиентах.
+Продажи не пересчитываются в запросе: ключи уходят в очередь analytics.queue,
+задача flush_analytics пересчитывает их пачкой (recompute_analytics).
 """
 
+from collections import defaultdict
+
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.db.models import Sum, Avg, Count, F
@@ -15,54 +19,114 @@ from decimal import Decimal
 @receiver(post_save, sender='sales.Sale')
 def update_analytics_on_sale(sender, instance, created, **kwargs):
     """
-    Обновляет аналитику при создании или изменении продажи.
+    Ставит пересчёт аналитики по завершённой продаже в очередь (analytics.queue).
 
-    - DailySalesReport: обновляется при завершении продажи
-    - ProductPerformance: обновляется для каждого товара в продаже
-    - CustomerAnalytics: обновляется если продажа с клиентом
-    """
-    import logging
-    from analytics.models import DailySalesReport, ProductPerformance
+    Сам пересчёт (DailySalesReport, ProductPerformance, CustomerAnalytics)
+    выполняет задача flush_analytics после коммита, один раз на ключ
+    за окно ANALYTICS_COALESCE_SECONDS, а не в запросе оплаты.
 
-    logger = logging.getLogger(__name__)
+    Оплата (sales.checkout) сама прибавляет продажу к дневному отчёту
+    (analytics.daily_report); продажу, изменённую мимо неё (админка, API),
+    отчёт дня пересобирает.
+    """
+    from analytics.queue import enqueue_analytics
 
     # Обновляем только для завершённых продаж
     if instance.status != 'completed' or not instance.completed_at:
         return
 
-    sale_date = instance.completed_at.date()
+    days = []
+    if not getattr(instance, '_daily_report_recorded', False):
+        days = [timezone.localdate(instance.completed_at)]
+    enqueue_analytics(sale_ids=[instance.pk], days=days)
+
+
+@receiver(post_delete, sender='sales.Sale')
+def recalculate_on_sale_delete(sender, instance, **kwargs):
+    """Пересчитывает аналитику при удалении продажи."""
+    from analytics.queue import enqueue_analytics
+
+    if instance.status == 'completed' and instance.completed_at:
+        sale_date = timezone.localdate(instance.completed_at)
+        enqueue_analytics(
+            days=[sale_date],
+            product_days=[(product_id, sale_date) for product_id in instance.items.values_list('product_id', flat=True)],
+            customer_ids=[instance.customer_id] if instance.customer_id else [],
+        )
+
+
+def refresh_sales_analytics(sale_ids):
+    """
+    Обновляет аналитику по продажам, созданным через bulk_create (без post_save),
+    и по продажам после возврата (sales.refunds) - через ту же очередь.
+    """
+    from analytics.queue import enqueue_analytics
+
+    enqueue_analytics(sale_ids=sale_ids)
+
+
+def recompute_analytics(sale_ids=(), days=(), product_days=(), customer_ids=()):
+    """
+    Пересчитывает аналитику по набору ключей.
+
+    Продажи дополняют набор своим днём, товарами за день и клиентом.
+    День продажи не пересобирается, если дневной отчёт ведётся
+    приращениями (ANALYTICS_DAILY_REPORT_INCREMENTAL): его уже обновили
+    оплата, выгрузка или возврат.
+    Каждый день, товар за день и клиент пересчитываются один раз на весь набор,
+    а не по разу на продажу.
+
+    Returns:
+        dict: сколько дней, товаров за день и клиентов пересчитано
+    """
+    import logging
+    from analytics.daily_report import is_enabled as daily_report_incremental
+    from analytics.rfm import update_customer_analytics
+    from sales.models import Sale, SaleItem
+
+    logger = logging.getLogger(__name__)
+
+    days = set(days)
+    product_days = set(product_days)
+    customer_ids = set(customer_ids)
+
+    if sale_ids:
+        for completed_at, customer_id in Sale.objects.filter(
+            pk__in=sale_ids, status__in=('completed', 'refunded'), completed_at__isnull=False
+        ).values_list('completed_at', 'customer_id'):
+            if not daily_report_incremental():
+                days.add(timezone.localdate(completed_at))
+            if customer_id:
+                customer_ids.add(customer_id)
+        product_days.update(
+            (product_id, timezone.localdate(completed_at))
+            for product_id, completed_at in SaleItem.objects.filter(
+                sale_id__in=sale_ids, sale__completed_at__isnull=False
+            ).values_list('product_id', 'sale__completed_at')
+        )
 
-    # Обновляем дневной отчёт (с обработкой ошибок)
     try:
-        _update_daily_sales_report(sale_date)
+        for sale_date in days:
+            _update_daily_sales_report(sale_date)
     except Exception as e:
         logger.error(f"Error updating daily sales report: {e}", exc_info=True)
 
-    # Обновляем производительность товаров
     try:
-        for item in instance.items.all():
-            _update_product_performance(item.product, sale_date)
+        products_by_day = defaultdict(set)
+        for product_id, sale_date in product_days:
+            products_by_day[sale_date].add(product_id)
+        for sale_date, product_ids in products_by_day.items():
+            update_product_performance(sale_date, product_ids)
     except Exception as e:
         logger.error(f"Error updating product performance: {e}", exc_info=True)
 
-    # Обновляем аналитику клиента если есть
-    if instance.customer:
-        try:
-            _update_customer_analytics(instance.customer)
-        except Exception as e:
-            logger.error(f"Error updating customer analytics: {e}", exc_info=True)
-
-
-@receiver(post_delete, sender='sales.Sale')
-def recalculate_on_sale_delete(sender, instance, **kwargs):
-    """Пересчитывает аналитику при удалении продажи."""
-    if instance.status == 'completed' and instance.completed_at:
-        sale_date = instance.completed_at.date()
-        _update_daily_sales_report(sale_date)
+    try:
+        if customer_ids:
+            update_customer_analytics(customer_ids)
+    except Exception as e:
+        logger.error(f"Error updating customer analytics: {e}", exc_info=True)
 
-        # Пересчитываем товары
-        for item in instance.items.all():
-            _update_product_performance(item.product, sale_date)
+    return {'days': len(days), 'products': len(product_days), 'customers': len(customer_ids)}
 
 
 def _update_daily_sales_report(date):
@@ -72,7 +136,7 @@ def _update_daily_sales_report(date):
     Агрегирует данные из всех завершённых продаж за день.
     """
     from analytics.models import DailySalesReport
-    from sales.models import Sale, Payment, CashierSession
+    from sales.models import Sale, SaleItem, Payment, CashierSession, Refund, RefundItem
     from customers.models import Customer
     
     # Получаем все завершённые продажи за день
@@ -86,20 +150,29 @@ def _update_daily_sales_report(date):
         DailySalesReport.objects.filter(date=date).delete()
         return
     
-    # Агрегируем данные
+    # Агрегируем данные (позиции - отдельным агрегатом: JOIN с позициями
+    # умножил бы суммы чеков на число их позиций)
     sales_stats = sales.aggregate(
         total_sales=Sum('total_amount'),
         total_count=Count('id'),
         total_discount=Sum('discount_amount'),
         total_tax=Sum('tax_amount'),
-        total_items=Sum('items__quantity'),
-        unique_products=Count('items__product', distinct=True),
     )
-    
+    sales_stats.update(SaleItem.objects.filter(sale__in=sales).aggregate(
+        total_items=Sum('quantity'),
+        unique_products=Count('product', distinct=True),
+    ))
+    
+    # Частичные возвраты по этим продажам (полностью возвращённые уже не completed)
+    refunded_amount = Refund.objects.filter(sale__in=sales).aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
+    refunded_items = RefundItem.objects.filter(refund__sale__in=sales).aggregate(total=Sum('quantity'))['total'] or 0
+    sales_stats['total_sales'] = (sales_stats['total_sales'] or Decimal('0.00')) - refunded_amount
+    sales_stats['total_items'] = (sales_stats['total_items'] or 0) - refunded_items
+
     # Средний чек
     avg_sale = sales_stats['total_sales'] / sales_stats['total_count'] if sales_stats['total_count'] else Decimal('0.00')
     
-    # Платежи по типам
+    # Платежи по типам (возвраты денег - платежи с отрицательной суммой)
     payments = Payment.objects.filter(
         sale__in=sales
     )
@@ -147,263 +220,248 @@ def _update_daily_sales_report(date):
 
 
 def _update_product_performance(product, date):
+    """Обновляет производительность одного товара за день (см. update_product_performance)."""
+    update_product_performance(date, product_ids=[product.pk])
+
+
+def update_product_performance(date, product_ids=None):
     """
-    Обновляет производительность товара за день.
-    
-    Агрегирует данные из позиций продаж за день.
+    Пересчитывает производительность товаров за день набором запросов.
+
+    Раньше каждый товар пересчитывался отдельно (exists, агрегаты,
+    update_or_create) - ночная задача делала ~4 запроса на каждый активный
+    товар, в основном на непроданные. Теперь на весь день:
+
+    1. GROUP BY product_id по позициям завершённых продаж дня
+       (с себестоимостью из ProductPricing через JOIN)
+    2. GROUP BY product_id по возвратам этих позиций
+    3. INSERT ... ON CONFLICT (product, date) DO UPDATE всех строк (bulk_create)
+    4. DELETE строк дня по товарам, которые больше не проданы
+
+    Args:
+        date: день
+        product_ids: пересчитать только эти товары (по умолчанию - все)
+
+    Returns:
+        int: количество записанных строк
     """
+    from datetime import datetime, time, timedelta
     from analytics.models import ProductPerformance
-    from sales.models import SaleItem
-    
-    # Получаем все позиции товара за день
+    from sales.models import RefundItem, SaleItem
+
+    # Границы локального дня вместо completed_at__date: индекс по дате продажи работает
+    start = timezone.make_aware(datetime.combine(date, time.min))
+    end = timezone.make_aware(datetime.combine(date + timedelta(days=1), time.min))
+
     items = SaleItem.objects.filter(
-        product=product,
         sale__status='completed',
-        sale__completed_at__date=date
+        sale__completed_at__gte=start,
+        sale__completed_at__lt=end
     )
-    
-    if not items.exists():
-        # Удаляем запись если нет продаж
-        ProductPerformance.objects.filter(product=product, date=date).delete()
-        return
-    
-    # Агрегируем данные
-    stats = items.aggregate(
+    if product_ids is not None:
+        items = items.filter(product_id__in=product_ids)
+
+    stats = items.values('product_id', 'product__pricing__cost_price').annotate(
         quantity_sold=Sum('quantity'),
         total_revenue=Sum('line_total'),
         sales_count=Count('sale', distinct=True),
         avg_price=Avg('unit_price'),
-    )
-    
-    # Считаем себестоимость и прибыль
-    total_revenue = stats['total_revenue'] or Decimal('0.00')
-    quantity_sold = stats['quantity_sold'] or Decimal('0.000')
-
-    # Получаем себестоимость товара
-    cost_price = Decimal('0.00')
-    if hasattr(product, 'pricing') and product.pricing:
-        cost_price = product.pricing.cost_price or Decimal('0.00')
-
-    total_cost = quantity_sold * cost_price
-    total_profit = total_revenue - total_cost
-    profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else Decimal('0.00')
-
-    # Средняя скидка - вычисляем из данных
-    avg_discount = Decimal('0.00')
-    if stats['sales_count'] and stats['avg_price']:
+    ).order_by()
+
+    # Частичные возвраты: количество и доля суммы позиции
+    refunded = {
+        row['sale_item__product_id']: row
+        for row in RefundItem.objects.filter(sale_item__in=items).values('sale_item__product_id').annotate(
+            refunded_quantity=Sum('quantity'),
+            refunded_revenue=Sum(F('sale_item__line_total') * F('quantity') / F('sale_item__quantity')),
+        ).order_by()
+    }
+
+    rows = []
+    for stat in stats:
+        refund = refunded.get(stat['product_id'], {})
+        total_revenue = (stat['total_revenue'] or Decimal('0.00')) - (refund.get('refunded_revenue') or Decimal('0.00'))
+        quantity_sold = (stat['quantity_sold'] or Decimal('0.000')) - (refund.get('refunded_quantity') or Decimal('0.000'))
+
+        # Считаем себестоимость и прибыль
+        cost_price = stat['product__pricing__cost_price'] or Decimal('0.00')
+        total_cost = quantity_sold * cost_price
+        total_profit = total_revenue - total_cost
+        profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else Decimal('0.00')
+
         # Средняя скидка = (avg_price - (total_revenue / quantity_sold)) / avg_price * 100
-        avg_sale_price = total_revenue / quantity_sold if quantity_sold > 0 else Decimal('0.00')
-        if stats['avg_price'] > 0:
-            avg_discount = ((stats['avg_price'] - avg_sale_price) / stats['avg_price'] * 100)
-            avg_discount = max(Decimal('0.00'), avg_discount)  # Не может быть отрицательной
-
-    # Создаём или обновляем запись
-    ProductPerformance.objects.update_or_create(
-        product=product,
-        date=date,
-        defaults={
-            'quantity_sold': quantity_sold,
-            'total_revenue': total_revenue,
-            'sales_count': stats['sales_count'] or 0,
-            'avg_price': stats['avg_price'] or Decimal('0.00'),
-            'avg_discount': avg_discount,
-            'total_cost': total_cost,
-            'total_profit': total_profit,
-            'profit_margin': profit_margin,
-        }
+        avg_price = stat['avg_price'] or Decimal('0.00')
+        avg_discount = Decimal('0.00')
+        if stat['sales_count'] and avg_price > 0:
+            avg_sale_price = total_revenue / quantity_sold if quantity_sold > 0 else Decimal('0.00')
+            avg_discount = max(Decimal('0.00'), (avg_price - avg_sale_price) / avg_price * 100)  # Не может быть отрицательной
+
+        rows.append(ProductPerformance(
+            product_id=stat['product_id'],
+            date=date,
+            quantity_sold=quantity_sold,
+            total_revenue=total_revenue,
+            sales_count=stat['sales_count'] or 0,
+            avg_price=avg_price,
+            avg_discount=avg_discount,
+            total_cost=total_cost,
+            total_profit=total_profit,
+            profit_margin=profit_margin,
+        ))
+
+    ProductPerformance.objects.bulk_create(
+        rows,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['product', 'date'],
+        update_fields=[
+            'quantity_sold', 'total_revenue', 'sales_count', 'avg_price', 'avg_discount',
+            'total_cost', 'total_profit', 'profit_margin', 'updated_at',
+        ],
     )
 
+    # Удаляем записи товаров, у которых за день не осталось продаж
+    stale = ProductPerformance.objects.filter(date=date).exclude(product_id__in=items.values('product_id'))
+    if product_ids is not None:
+        stale = stale.filter(product_id__in=product_ids)
+    stale.delete()
+
+    return len(rows)
+
 
 def _update_customer_analytics(customer):
-    """
-    Обновляет аналитику клиента.
-    
-    Пересчитывает RFM метрики и сегментацию.
-    """
-    from analytics.models import CustomerAnalytics
-    from sales.models import Sale
-    from django.db.models import Sum, Count, Avg
-    from datetime import timedelta
-    
-    today = timezone.now().date()
-    
-    # Период - последние 90 дней
-    period_start = today - timedelta(days=90)
-    period_end = today
-    
-    # Получаем продажи клиента за период
-    sales = Sale.objects.filter(
-        customer=customer,
-        status='completed',
-        completed_at__date__gte=period_start,
-        completed_at__date__lte=period_end
-    )
-    
-    if not sales.exists():
-        # Удаляем запись если нет активности
-        CustomerAnalytics.objects.filter(
-            customer=customer,
-            period_start=period_start,
-            period_end=period_end
-        ).delete()
-        return
-    
-    # RFM метрики
-    last_purchase = sales.order_by('-completed_at').first()
-    recency_days = (today - last_purchase.completed_at.date()).days if last_purchase else 999
-    
-    stats = sales.aggregate(
-        frequency=Count('id'),
-        monetary=Sum('total_amount'),
-        avg_purchase=Avg('total_amount'),
-    )
-    
-    # Кредитные покупки
-    credit_stats = sales.filter(payment_method='credit').aggregate(
-        credit_count=Count('id'),
-        credit_amount=Sum('total_amount'),
-    )
-    
-    # Средняя задержка платежа (для кредитов)
-    avg_payment_delay = 0
-    
-    # RFM Score (1-5)
-    r_score = 5 if recency_days <= 7 else 4 if recency_days <= 30 else 3 if recency_days <= 60 else 2 if recency_days <= 90 else 1
-    f_score = 5 if stats['frequency'] >= 20 else 4 if stats['frequency'] >= 10 else 3 if stats['frequency'] >= 5 else 2 if stats['frequency'] >= 2 else 1
-    m_score = 5 if stats['monetary'] >= 5000000 else 4 if stats['monetary'] >= 2000000 else 3 if stats['monetary'] >= 1000000 else 2 if stats['monetary'] >= 500000 else 1
-    
-    rfm_score = (r_score + f_score + m_score) // 3
-    
-    # Сегментация
-    segment = _determine_customer_segment(r_score, f_score, m_score)
-    
-    # Создаём или обновляем аналитику
-    CustomerAnalytics.objects.update_or_create(
-        customer=customer,
-        period_start=period_start,
-        period_end=period_end,
-        defaults={
-            'recency_days': recency_days,
-            'frequency': stats['frequency'] or 0,
-            'monetary': stats['monetary'] or Decimal('0.00'),
-            'rfm_score': rfm_score,
-            'segment': segment,
-            'purchases_count': stats['frequency'] or 0,
-            'total_spent': stats['monetary'] or Decimal('0.00'),
-            'avg_purchase_amount': stats['avg_purchase'] or Decimal('0.00'),
-            'credit_purchases': credit_stats['credit_count'] or 0,
-            'total_credit_amount': credit_stats['credit_amount'] or Decimal('0.00'),
-            'avg_payment_delay_days': avg_payment_delay,
-        }
-    )
+    """Обновляет RFM аналитику одного клиента (см. analytics.rfm)."""
+    from analytics.rfm import update_customer_analytics
+
+    update_customer_analytics(customer_ids=[customer.pk])
 
 
 def _update_inventory_snapshot(product, date):
+    """Обновляет снимок остатков одного товара (см. update_inventory_snapshots)."""
+    update_inventory_snapshots(date, product_ids=[product.pk])
+
+
+# Окно оборачиваемости: продажи за столько дней по дату снимка включительно
+TURNOVER_DAYS = 30
+
+# Предел turnover_rate (DecimalField max_digits=5, decimal_places=2)
+MAX_TURNOVER_RATE = Decimal('999.99')
+
+
+def update_inventory_snapshots(date, product_ids=None):
     """
-    Обновляет снимок остатков товара.
-    
-    Считает оборачиваемость и дни до исчерпания запасов.
+    Снимки остатков активных товаров с учётом остатков за дату.
+
+    Остатки - сумма активных партий (ProductBatch), резерв - активные
+    StockReservation. Всё считается набором запросов на все товары:
+
+    1. товары с ценами и настройками учёта (JOIN ProductPricing, ProductInventory)
+    2. GROUP BY партий: остаток и стоимость по цене закупки партий
+    3. GROUP BY активных резервов
+    4. GROUP BY продаж за TURNOVER_DAYS дней и возвратов по ним
+    5. INSERT ... ON CONFLICT (product, date) DO UPDATE (bulk_create)
+       и DELETE снимков товаров, которые больше не учитываются
+
+    Товары с выключенным учётом остатков (track_inventory=False) пропускаются.
+
+    Args:
+        date: дата снимка
+        product_ids: только эти товары (по умолчанию - все активные)
+
+    Returns:
+        int: количество записанных снимков
     """
+    from datetime import datetime, time, timedelta
     from analytics.models import InventorySnapshot
-    from products.models import Stock
-    from sales.models import SaleItem
-    from datetime import timedelta
-    
-    # Получаем текущие остатки
-    stock = Stock.objects.filter(product=product).first()
-    
-    if not stock:
-        return
-    
-    # Продажи за последние 30 дней
-    days_ago_30 = date - timedelta(days=30)
-    sales_30d = SaleItem.objects.filter(
-        product=product,
+    from products.models import Product, ProductBatch, StockReservation
+    from sales.models import RefundItem, SaleItem
+
+    tracked = Product.objects.filter(is_active=True).exclude(inventory__track_inventory=False)
+    if product_ids is not None:
+        tracked = tracked.filter(pk__in=product_ids)
+    products = list(tracked.values_list(
+        'id', 'pricing__sale_price', 'inventory__min_quantity', 'inventory__max_quantity'
+    ))
+    # Подзапрос, а не список ID: товаров могут быть десятки тысяч
+    scope = tracked.values('id')
+
+    stock = {
+        row['product_id']: row
+        for row in ProductBatch.objects.filter(product_id__in=scope, is_active=True).values('product_id').annotate(
+            on_hand=Sum('quantity'),
+            cost=Sum(F('quantity') * F('purchase_price')),
+        ).order_by()
+    }
+    reserved = dict(
+        StockReservation.objects.filter(product_id__in=scope, status='active')
+        .values('product_id')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+        .values_list('product_id', 'total')
+    )
+
+    # Продано за окно (с вычетом частичных возвратов)
+    start = timezone.make_aware(datetime.combine(date - timedelta(days=TURNOVER_DAYS - 1), time.min))
+    end = timezone.make_aware(datetime.combine(date + timedelta(days=1), time.min))
+    items = SaleItem.objects.filter(
+        product_id__in=scope,
         sale__status='completed',
-        sale__completed_at__date__gte=days_ago_30,
-        sale__completed_at__date__lte=date
-    ).aggregate(total_sold=Sum('quantity'))
-    
-    total_sold_30d = sales_30d['total_sold'] or Decimal('0.000')
-    
-    # Оборачиваемость (раз в 30 дней)
-    turnover_rate = Decimal('0.00')
-    if stock.quantity > 0 and total_sold_30d > 0:
-        turnover_rate = total_sold_30d / stock.quantity
-    
-    # Дни до исчерпания запасов
-    days_of_stock = 0
-    if total_sold_30d > 0:
-        daily_sales = total_sold_30d / 30
-        if daily_sales > 0:
-            days_of_stock = int(stock.quantity / daily_sales)
-    
-    # Флаги
-    is_out_of_stock = stock.quantity <= 0
-    is_low_stock = stock.quantity <= (product.min_stock_level or 0)
-    is_overstock = stock.quantity >= (product.max_stock_level or 999999) if product.max_stock_level else False
-    
-    # Создаём или обновляем снимок
-    InventorySnapshot.objects.update_or_create(
-        product=product,
-        date=date,
-        defaults={
-            'quantity_on_hand': stock.quantity,
-            'reserved_quantity': stock.reserved_quantity,
-            'available_quantity': stock.available_quantity,
-            'total_cost': stock.quantity * (product.cost_price or Decimal('0.00')),
-            'total_value': stock.quantity * (product.price or Decimal('0.00')),
-            'turnover_rate': turnover_rate,
-            'days_of_stock': days_of_stock,
-            'is_out_of_stock': is_out_of_stock,
-            'is_low_stock': is_low_stock,
-            'is_overstock': is_overstock,
-        }
+        sale__completed_at__gte=start,
+        sale__completed_at__lt=end
     )
+    sold = defaultdict(Decimal)
+    for product_id, quantity in items.values('product_id').annotate(total=Sum('quantity')).order_by().values_list('product_id', 'total'):
+        sold[product_id] += quantity or Decimal('0')
+    for product_id, quantity in RefundItem.objects.filter(sale_item__in=items).values(
+        'sale_item__product_id'
+    ).annotate(total=Sum('quantity')).order_by().values_list('sale_item__product_id', 'total'):
+        sold[product_id] -= quantity or Decimal('0')
 
+    snapshots = []
+    for product_id, sale_price, min_quantity, max_quantity in products:
+        product_stock = stock.get(product_id, {})
+        on_hand = product_stock.get('on_hand') or Decimal('0.000')
+        reserved_quantity = reserved.get(product_id) or Decimal('0.000')
+        sold_30d = max(sold.get(product_id, Decimal('0')), Decimal('0'))
 
-def _determine_customer_segment(r_score, f_score, m_score):
-    """
-    Определяет сегмент клиента на основе RFM scores.
-    
-    Returns:
-        str: Название сегмента
-    """
-    # Champions: высокие R, F, M
-    if r_score >= 4 and f_score >= 4 and m_score >= 4:
-        return "Champions"
-    
-    # Loyal Customers: высокие F и M, средний R
-    if f_score >= 4 and m_score >= 4:
-        return "Loyal Customers"
-    
-    # Potential Loyalists: высокий R, средние F и M
-    if r_score >= 4 and f_score >= 3 and m_score >= 3:
-        return "Potential Loyalists"
-    
-    # New Customers: высокий R, низкие F и M
-    if r_score >= 4 and f_score <= 2 and m_score <= 2:
-        return "New Customers"
-    
-    # Promising: средний R, низкие F и M
-    if r_score >= 3 and f_score <= 2:
-        return "Promising"
-    
-    # Need Attention: средние R, F, M
-    if r_score >= 3 and f_score >= 3:
-        return "Need Attention"
-    
-    # At Risk: низкий R, высокие F и M
-    if r_score <= 2 and f_score >= 4 and m_score >= 4:
-        return "At Risk"
-    
-    # Can't Lose Them: низкий R, очень высокие F и M
-    if r_score <= 2 and f_score >= 5 and m_score >= 5:
-        return "Can't Lose Them"
-    
-    # Hibernating: низкий R, средние F и M
-    if r_score <= 2 and f_score >= 2:
-        return "Hibernating"
-    
-    # Lost: все низкие
-    return "Lost"
+        # Оборачиваемость (раз за окно) и дни до исчерпания запасов
+        turnover_rate = Decimal('0.00')
+        days_of_stock = 0
+        if sold_30d > 0:
+            if on_hand > 0:
+                turnover_rate = min(sold_30d / on_hand, MAX_TURNOVER_RATE)
+            days_of_stock = int(max(on_hand, Decimal('0')) / (sold_30d / TURNOVER_DAYS))
+
+        snapshots.append(InventorySnapshot(
+            product_id=product_id,
+            date=date,
+            quantity_on_hand=on_hand,
+            reserved_quantity=reserved_quantity,
+            available_quantity=max(on_hand - reserved_quantity, Decimal('0.000')),
+            total_cost=product_stock.get('cost') or Decimal('0.00'),
+            total_value=on_hand * (sale_price or Decimal('0.00')),
+            turnover_rate=turnover_rate,
+            days_of_stock=days_of_stock,
+            is_out_of_stock=on_hand <= 0,
+            is_low_stock=on_hand <= (min_quantity or 0),
+            is_overstock=max_quantity is not None and max_quantity > 0 and on_hand >= max_quantity,
+        ))
+
+    InventorySnapshot.objects.bulk_create(
+        snapshots,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['product', 'date'],
+        update_fields=[
+            'quantity_on_hand', 'reserved_quantity', 'available_quantity', 'total_cost', 'total_value',
+            'turnover_rate', 'days_of_stock', 'is_out_of_stock', 'is_low_stock', 'is_overstock',
+        ],
+    )
+
+    # Товары, выключенные или без учёта остатков, - снимок за дату больше не нужен
+    stale = InventorySnapshot.objects.filter(date=date).exclude(product_id__in=scope)
+    if product_ids is not None:
+        stale = stale.filter(product_id__in=product_ids)
+    stale.delete()
+
+    return len(snapshots)
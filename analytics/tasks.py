@@ -8,14 +8,29 @@ Celery tasks для аналитики.
 from celery import shared_task
 from django.utils import timezone
 from datetime import timedelta
+from analytics.rfm import update_customer_analytics
+from core.schema_utils import iter_tenant_schemas, schema_context
 from analytics.signals import (
     _update_daily_sales_report,
-    _update_product_performance,
-    _update_customer_analytics,
-    _update_inventory_snapshot
+    update_product_performance,
+    update_inventory_snapshots
 )
 
 
+@shared_task
+def flush_analytics(schema_name):
+    """
+    Пересчитывает аналитику по ключам, накопленным за окно (analytics.queue).
+
+    Ставится первым событием окна с задержкой ANALYTICS_COALESCE_SECONDS.
+    """
+    from analytics.queue import pop_pending, recompute_members
+
+    with schema_context(schema_name):
+        members = pop_pending(schema_name)
+        return recompute_members(members)
+
+
 @shared_task
 def generate_daily_sales_report():
     """
@@ -28,22 +43,43 @@ def generate_daily_sales_report():
     return f"Отчёт за {yesterday} сгенерирован"
 
 
+@shared_task
+def rebuild_daily_sales_reports(days=2):
+    """
+    Точная пересборка дневных отчётов за последние days дней во всех магазинах.
+
+    Днём отчёт ведётся приращениями (analytics.daily_report), уникальные
+    значения в нём - оценка HyperLogLog, счётчики смен не обновляются.
+    Пересборка исправляет это. Запускается каждый день в 00:30
+    (CELERY_BEAT_SCHEDULE): вчерашний день уже закрыт, сегодняшний -
+    на случай офлайн продаж, выгруженных после полуночи.
+    """
+    import logging
+
+    logger = logging.getLogger(__name__)
+    today = timezone.localdate()
+    results = {}
+    for schema_name in iter_tenant_schemas():
+        try:
+            for offset in range(days):
+                _update_daily_sales_report(today - timedelta(days=offset))
+            results[schema_name] = days
+        except Exception as e:
+            logger.error(f"Ошибка пересборки дневного отчёта в {schema_name}: {e}")
+            results[schema_name] = str(e)
+    return results
+
+
 @shared_task
 def generate_product_performance_reports():
     """
     Генерирует отчёты по производительности товаров за вчера.
     
-    Запускается каждый день в 01:00.
+    Запускается каждый день в 01:00. Считаются только проданные товары -
+    одним GROUP BY по позициям дня (update_product_performance).
     """
-    from products.models import Product
-    
-    yesterday = (timezone.now() - timedelta(days=1)).date()
-    products = Product.objects.filter(is_active=True)
-    
-    count = 0
-    for product in products:
-        _update_product_performance(product, yesterday)
-        count += 1
+    yesterday = timezone.localdate() - timedelta(days=1)
+    count = update_product_performance(yesterday)
     
     return f"Обновлено {count} товаров за {yesterday}"
 
@@ -51,18 +87,12 @@ def generate_product_performance_reports():
 @shared_task
 def generate_customer_analytics():
     """
-    Обновляет RFM аналитику для всех активных клиентов.
+    Обновляет RFM аналитику всех клиентов с покупками за период.
     
-    Запускается раз в неделю (воскресенье в 02:00).
+    Запускается раз в неделю (воскресенье в 02:00). Один GROUP BY по продажам,
+    баллы по квантилям магазина (analytics.rfm).
     """
-    from customers.models import Customer
-    
-    customers = Customer.objects.filter(is_active=True)
-    
-    count = 0
-    for customer in customers:
-        _update_customer_analytics(customer)
-        count += 1
+    count = update_customer_analytics()
     
     return f"Обновлена аналитика для {count} клиентов"
 
@@ -72,17 +102,11 @@ def generate_inventory_snapshots():
     """
     Создаёт снимки остатков для всех товаров.
     
-    Запускается каждый день в 23:50.
+    Запускается каждый день в 23:50. Все товары - несколькими
+    группирующими запросами (update_inventory_snapshots).
     """
-    from products.models import Product
-    
-    today = timezone.now().date()
-    products = Product.objects.filter(is_active=True)
-    
-    count = 0
-    for product in products:
-        _update_inventory_snapshot(product, today)
-        count += 1
+    today = timezone.localdate()
+    count = update_inventory_snapshots(today)
     
     return f"Создано {count} снимков остатков за {today}"
 
@@ -129,8 +153,6 @@ def recalculate_analytics_for_date(date_str):
     Используется для ручного пересчёта или исправления данных.
     """
     from datetime import datetime
-    from products.models import Product
-    from customers.models import Customer
     
     date = datetime.strptime(date_str, '%Y-%m-%d').date()
     
@@ -138,17 +160,12 @@ def recalculate_analytics_for_date(date_str):
     _update_daily_sales_report(date)
     
     # Пересчитываем товары
-    products = Product.objects.filter(is_active=True)
-    for product in products:
-        _update_product_performance(product, date)
+    update_product_performance(date)
     
     # Пересчитываем снимки остатков
-    for product in products:
-        _update_inventory_snapshot(product, date)
+    update_inventory_snapshots(date)
     
     # Обновляем клиентов
-    customers = Customer.objects.filter(is_active=True)
-    for customer in customers:
-        _update_customer_analytics(customer)
+    update_customer_analytics()
     
     return f"Аналитика пересчитана для {date}"
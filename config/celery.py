@@ -0,0 +1,20 @@
+"""
+Celery приложение проекта.
+
+Настройки берутся из settings.py (префикс CELERY_),
+задачи ищутся в tasks.py каждого приложения.
+
+Запуск воркера:
+    celery -A config worker -l info
+    celery -A config beat -l info
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+app = Celery('config')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -232,6 +232,10 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
     'x-tenant-key',  # Ключ магазина для schema-based multitenancy
+    'idempotency-key',  # Повтор POS запроса без повторного выполнения (core.idempotency)
+]
+CORS_EXPOSE_HEADERS = [
+    'idempotent-replayed',
 ]
 
 # ============================================
@@ -245,6 +249,24 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_ENABLE_UTC = True
 
+# Периодические задачи (дополнительно можно настроить в админке django_celery_beat)
+from celery.schedules import crontab
+
+CELERY_BEAT_SCHEDULE = {
+    'refresh-expiry-buckets': {
+        'task': 'products.tasks.refresh_expiry_buckets',
+        'schedule': crontab(hour=0, minute=5),
+    },
+    'ensure-sales-partitions': {
+        'task': 'sales.tasks.ensure_sales_partitions',
+        'schedule': crontab(hour=0, minute=15),
+    },
+    'rebuild-daily-sales-reports': {
+        'task': 'analytics.tasks.rebuild_daily_sales_reports',
+        'schedule': crontab(hour=0, minute=30),
+    },
+}
+
 # ============================================
 # CACHING
 # ============================================
@@ -260,6 +282,44 @@ CACHES = {
     }
 }
 
+# Черновики чеков кассы в кеше (sales.drafts): время жизни брошенного черновика
+# и подсказки цены/остатка товара для сканирования (секунды)
+POS_DRAFT_CART_TTL = int(os.getenv('POS_DRAFT_CART_TTL', 12 * 60 * 60))
+POS_PRODUCT_HINT_TTL = int(os.getenv('POS_PRODUCT_HINT_TTL', 30))
+
+# Idempotency-Key для POS запросов (core.idempotency): сколько хранить ответ,
+# сколько держать ключ занятым выполняющимся запросом и сколько ждать его повтору (секунды)
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+IDEMPOTENCY_WAIT = int(os.getenv('IDEMPOTENCY_WAIT', 10))
+
+# Помесячное секционирование sales_sale / sales_sale_item / sales_payment
+# (core.partitioning, только PostgreSQL): включать ли для новых магазинов
+# и при migrate_tenant_schemas, на сколько месяцев вперёд создавать секции
+SALES_PARTITIONING = os.getenv('SALES_PARTITIONING', 'False') == 'True'
+SALES_PARTITION_MONTHS_AHEAD = int(os.getenv('SALES_PARTITION_MONTHS_AHEAD', 3))
+
+# Живая лента продаж для дашбордов (sales.live, SSE через Redis pub/sub):
+# публиковать ли события оплаты/возврата, Redis для каналов, интервал
+# keepalive и максимальная длительность одного подключения (секунды)
+SALES_LIVE_ENABLED = os.getenv('SALES_LIVE_ENABLED', 'True') == 'True'
+SALES_LIVE_REDIS_URL = os.getenv('SALES_LIVE_REDIS_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+SALES_LIVE_KEEPALIVE = int(os.getenv('SALES_LIVE_KEEPALIVE', 15))
+SALES_LIVE_MAX_AGE = int(os.getenv('SALES_LIVE_MAX_AGE', 30 * 60))
+
+# Пересчёт аналитики после продаж (analytics.queue): окно объединения событий
+# в секундах (0 - пересчитывать сразу после коммита) и Redis для очереди ключей
+ANALYTICS_COALESCE_SECONDS = int(os.getenv('ANALYTICS_COALESCE_SECONDS', 5))
+ANALYTICS_QUEUE_REDIS_URL = os.getenv('ANALYTICS_QUEUE_REDIS_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+
+# Дневной отчёт (analytics.daily_report): приращениями в транзакции оплаты/возврата
+# с ночной пересборкой; False - пересборка дня очередью после каждой продажи
+ANALYTICS_DAILY_REPORT_INCREMENTAL = os.getenv('ANALYTICS_DAILY_REPORT_INCREMENTAL', 'True') == 'True'
+
+# RFM сегментация (analytics.rfm): квантили распределения клиентов магазина -
+# границы баллов 2, 3, 4 и 5
+ANALYTICS_RFM_QUANTILES = os.getenv('ANALYTICS_RFM_QUANTILES', '0.2,0.4,0.6,0.8').split(',')
+
 # ============================================
 # LOGGING
 # ============================================
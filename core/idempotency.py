@@ -0,0 +1,126 @@
+"""
+Идемпотентность POS запросов по заголовку Idempotency-Key.
+
+Касса при плохом Wi-Fi повторяет запрос, не дождавшись ответа. С одним
+и тем же Idempotency-Key повтор не выполняет действие ещё раз
+(не добавляет позицию, не пишет второй платёж), а получает сохранённый
+ответ первого запроса с заголовком Idempotent-Replayed: true.
+
+Ответы хранятся в кеше (Redis) по ключу магазина (схемы), пользователя,
+пути и ключа запроса, время жизни - IDEMPOTENCY_KEY_TTL. Пока первый
+запрос выполняется, ключ занят маркером (cache.add - атомарно в Redis):
+параллельный повтор ждёт его ответ до IDEMPOTENCY_WAIT секунд,
+потом получает 409.
+
+Ответы 5xx и исключения не сохраняются - такой запрос можно повторить
+с тем же ключом. Тот же ключ с другим телом запроса - 422.
+
+Использование:
+    @action(detail=True, methods=['post'])
+    @idempotent
+    def checkout(self, request, pk=None):
+        ...
+"""
+
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+MAX_KEY_LENGTH = 255
+
+# Маркер "запрос выполняется" в кеше
+_IN_PROGRESS = 'in-progress'
+
+_POLL_INTERVAL = 0.05
+
+
+def _cache_key(request, key):
+    user_id = getattr(request.user, 'pk', None) or 'anonymous'
+    schema_name = getattr(request, 'schema_name', 'public')
+    scope = hashlib.sha256(f'{request.method}:{request.path}:{key}'.encode()).hexdigest()
+    return f'idempotency:{schema_name}:{user_id}:{scope}'
+
+
+def _fingerprint(request):
+    return hashlib.sha256(request.body or b'').hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        return Response(
+            {'error': f'{IDEMPOTENCY_HEADER} уже использован с другим телом запроса'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    return Response(stored['data'], status=stored['status'], headers={REPLAYED_HEADER: 'true'})
+
+
+def _wait_for_response(cache_key, fingerprint):
+    """Ответ параллельного запроса с тем же ключом (или None, если не дождались)"""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(_POLL_INTERVAL)
+        stored = cache.get(cache_key)
+        if stored is None:
+            # Первый запрос завершился ошибкой и освободил ключ
+            return None
+        if stored != _IN_PROGRESS:
+            return _replay(stored, fingerprint)
+    return Response(
+        {'error': 'Запрос с этим ключом ещё выполняется, повторите позже'},
+        status=status.HTTP_409_CONFLICT
+    )
+
+
+def idempotent(view_method):
+    """Декоратор действия DRF: повтор с тем же Idempotency-Key возвращает сохранённый ответ"""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} длиннее {MAX_KEY_LENGTH} символов'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache_key = _cache_key(request, key)
+        fingerprint = _fingerprint(request)
+
+        while not cache.add(cache_key, _IN_PROGRESS, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            stored = cache.get(cache_key)
+            if stored is None:
+                # Ключ освободился между add и get - пробуем занять ещё раз
+                continue
+            if stored != _IN_PROGRESS:
+                return _replay(stored, fingerprint)
+            replayed = _wait_for_response(cache_key, fingerprint)
+            if replayed is not None:
+                return replayed
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+
+        if response.status_code >= 500 or not hasattr(response, 'data'):
+            cache.delete(cache_key)
+        else:
+            cache.set(cache_key, {
+                'fingerprint': fingerprint,
+                'status': response.status_code,
+                'data': response.data,
+            }, settings.IDEMPOTENCY_KEY_TTL)
+        return response
+
+    return wrapper
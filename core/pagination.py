@@ -0,0 +1,75 @@
+"""
+Пагинация для больших списков.
+
+По умолчанию работает как обычная PageNumberPagination (?page=N).
+Курсорный режим включается параметром ?pagination=cursor или наличием ?cursor=...:
+вместо COUNT(*) и OFFSET используется условие по (created_at, id),
+поэтому время ответа не растёт при прокрутке вглубь списка.
+
+Ответ в курсорном режиме:
+    {"next": "...?cursor=cD0y...", "previous": null, "results": [...]}
+"""
+
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """Курсорная пагинация по (created_at, id)"""
+
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    # Допустимые порядки сортировки (ordering=created_at / -created_at)
+    ORDERINGS = {
+        'created_at': ('created_at', 'id'),
+        '-created_at': ('-created_at', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Курсор требует уникального и стабильного порядка,
+        поэтому поддерживаем только сортировку по дате создания с id.
+        """
+        requested = request.query_params.get('ordering', '').strip()
+        return self.ORDERINGS.get(requested, self.ordering)
+
+
+class CursorOrPageNumberPagination(PageNumberPagination):
+    """
+    Пагинация с выбором режима (opt-in курсор).
+
+    - ?page=2                 -> PageNumberPagination (как раньше, с count)
+    - ?pagination=cursor      -> первая страница курсорного режима
+    - ?cursor=<token>         -> следующие страницы курсорного режима
+    """
+
+    mode_query_param = 'pagination'
+    cursor_class = CreatedAtCursorPagination
+
+    _cursor_paginator = None
+
+    def is_cursor_mode(self, request):
+        params = request.query_params
+        return (
+            self.cursor_class.cursor_query_param in params
+            or params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_cursor_mode(request):
+            self._cursor_paginator = self.cursor_class()
+            page = self._cursor_paginator.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self._cursor_paginator.display_page_controls
+            return page
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self._cursor_paginator is not None:
+            return self._cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self._cursor_paginator is not None:
+            return self._cursor_paginator.to_html()
+        return super().to_html()
@@ -0,0 +1,320 @@
+"""
+Помесячное секционирование таблиц продаж в схеме магазина (PostgreSQL).
+
+sales_sale, sales_sale_item и sales_payment растут бесконечно: индексы
+вроде (status, created_at) разбухают, а выборки за период идут по всё
+большим B-деревьям. После секционирования по created_at (PARTITION BY
+RANGE) запрос за период читает только секции своих месяцев, а старые
+месяцы можно отсоединить и вынести в архив.
+
+Секционирование включается явно (SALES_PARTITIONING или команда
+partition_sales_tables --convert). Переход для существующей таблицы:
+
+1. Внешние ключи на таблицу снимаются - PostgreSQL не даёт ссылаться
+   на секционированную таблицу без ключа секционирования в FK.
+   Каскадное удаление Django всё равно делает сам.
+2. Таблица переименовывается в <table>_legacy и становится первой секцией
+   (все строки до начала следующего месяца) - данные не копируются.
+3. Новая родительская таблица: те же колонки, первичный ключ (id, created_at),
+   своя последовательность id, те же индексы. Уникальные индексы
+   (receipt_number, client_uuid) становятся обычными, хотя модель Sale
+   по-прежнему объявляет unique=True. Уникальность внутри магазина
+   обеспечивает код: номера чеков выдаёт ReceiptCounter, а client_uuid
+   проверяется под блокировкой UUID (pg_advisory_xact_lock) в
+   sales.offline - единственном месте, где он записывается.
+4. Секции <table>_pYYYYMM на months_ahead месяцев вперёд и секция
+   <table>_default для строк вне созданных диапазонов.
+
+Миграции в секционированной схеме:
+- добавление, удаление и изменение колонок и обычных индексов работают
+  (ALTER TABLE / CREATE INDEX родителя применяются к секциям);
+- уникальное ограничение без created_at (unique=True, UniqueConstraint)
+  на этих таблицах создать нельзя - миграция упадёт;
+- ForeignKey на Sale, SaleItem или Payment с ограничением в БД создать
+  нельзя: его нужно объявлять с db_constraint=False, иначе миграция упадёт.
+Такие миграции проверяйте на схеме с секционированием до выката.
+
+На SQLite всё это не выполняется (is_supported() == False).
+"""
+
+import logging
+import re
+from datetime import date, datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+# Таблица -> колонка ключа секционирования. Порядок важен: sales_sale
+# переводится первой, и FK позиций и платежей на неё снимаются до их перевода
+PARTITIONED_TABLES = {
+    'sales_sale': 'created_at',
+    'sales_sale_item': 'created_at',
+    'sales_payment': 'created_at',
+}
+
+DEFAULT_MONTHS_AHEAD = 3
+
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+class PartitioningError(Exception):
+    """Секционирование недоступно или таблица в неожиданном состоянии"""
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def month_start(day):
+    """Первое число месяца даты"""
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    """Первое число месяца через months месяцев от day"""
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _month_bound(day):
+    """Начало месяца в локальном времени магазина - граница секции"""
+    return timezone.make_aware(datetime(day.year, day.month, day.day))
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _current_schema(cursor):
+    cursor.execute('SELECT current_schema()')
+    return cursor.fetchone()[0]
+
+
+def partitioned_tables():
+    """Таблицы из PARTITIONED_TABLES, уже секционированные в текущей схеме"""
+    if not is_supported():
+        return set()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname
+            FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relnamespace = current_schema()::text::regnamespace
+              AND c.relname = ANY(%s)
+            """,
+            [list(PARTITIONED_TABLES)]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def _partitions(cursor, table):
+    """[(имя секции, верхняя граница или None для default)] таблицы"""
+    cursor.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY c.relname
+        """,
+        [table]
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = _UPPER_BOUND.search(bound or '')
+        partitions.append((name, parse_datetime(match.group(1)) if match else None))
+    return partitions
+
+
+def _convert_table(cursor, table, column, first_month):
+    """Превращает обычную таблицу в секционированную (см. docstring модуля)"""
+    legacy = f'{table}_legacy'
+
+    # 1. Внешние ключи на таблицу
+    cursor.execute(
+        """
+        SELECT conname, conrelid::regclass::text
+        FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = %s::regclass
+        """,
+        [table]
+    )
+    for constraint, referencing_table in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {referencing_table} DROP CONSTRAINT {_quote(constraint)}')
+
+    # Собственные FK и индексы - до переименования, чтобы их определения
+    # ссылались на имя, которое получит родительская таблица
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE contype = 'f' AND conrelid = %s::regclass
+        """,
+        [table]
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute(
+        """
+        SELECT i.relname, pg_get_indexdef(x.indexrelid), x.indisprimary
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = %s::regclass
+        """,
+        [table]
+    )
+    indexes = cursor.fetchall()
+
+    cursor.execute(
+        """
+        SELECT attidentity
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attname = 'id'
+        """,
+        [table]
+    )
+    is_identity = cursor.fetchone()[0] != ''
+    cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {_quote(table)}')
+    last_id = cursor.fetchone()[0]
+
+    # 2. Старая таблица - будущая первая секция
+    cursor.execute(f'ALTER TABLE {_quote(table)} RENAME TO {_quote(legacy)}')
+    for index_name, _, _ in indexes:
+        cursor.execute(f'ALTER INDEX {_quote(index_name)} RENAME TO {_quote(index_name[:56] + "_legacy")}')
+    if is_identity:
+        cursor.execute(f'ALTER TABLE {_quote(legacy)} ALTER COLUMN id DROP IDENTITY')
+    else:
+        cursor.execute(f'ALTER TABLE {_quote(legacy)} ALTER COLUMN id DROP DEFAULT')
+
+    # 3. Родительская таблица
+    cursor.execute(
+        f'CREATE TABLE {_quote(table)} '
+        f'(LIKE {_quote(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS) '
+        f'PARTITION BY RANGE ({_quote(column)})'
+    )
+    sequence = f'{table}_id_seq'
+    cursor.execute(f'DROP SEQUENCE IF EXISTS {_quote(sequence)}')
+    cursor.execute(f'CREATE SEQUENCE {_quote(sequence)} OWNED BY {_quote(table)}.id')
+    cursor.execute('SELECT setval(%s, %s, false)', [sequence, last_id + 1])
+    cursor.execute(f"ALTER TABLE {_quote(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}'::regclass)")
+    cursor.execute(f'ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(table + "_pkey")} PRIMARY KEY (id, {_quote(column)})')
+
+    for index_name, definition, is_primary in indexes:
+        if is_primary:
+            continue
+        # Уникальный индекс без ключа секционирования невозможен
+        cursor.execute(definition.replace('CREATE UNIQUE INDEX', 'CREATE INDEX', 1))
+
+    for constraint, definition in foreign_keys:
+        if any(f'REFERENCES {target}(' in definition for target in PARTITIONED_TABLES):
+            continue
+        cursor.execute(f'ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(constraint)} {definition}')
+
+    # 4. Старые строки - секция до начала следующего месяца
+    cursor.execute(
+        f'ALTER TABLE {_quote(table)} ATTACH PARTITION {_quote(legacy)} '
+        f'FOR VALUES FROM (MINVALUE) TO (%s)',
+        [_month_bound(first_month)]
+    )
+    cursor.execute(f'CREATE TABLE {_quote(table + "_default")} PARTITION OF {_quote(table)} DEFAULT')
+
+
+def partition_sales_tables(months_ahead=DEFAULT_MONTHS_AHEAD):
+    """
+    Переводит таблицы продаж текущей схемы на помесячные секции.
+
+    Уже секционированные таблицы пропускаются, для всех создаются
+    секции на months_ahead месяцев вперёд. Всё выполняется одной
+    транзакцией (ALTER TABLE блокирует таблицы продаж на время перевода).
+
+    Returns:
+        list: переведённые таблицы
+    """
+    if not is_supported():
+        raise PartitioningError('Секционирование таблиц продаж доступно только на PostgreSQL')
+
+    first_month = add_months(month_start(timezone.localdate()), 1)
+    converted = []
+    with transaction.atomic():
+        already_partitioned = partitioned_tables()
+        with connection.cursor() as cursor:
+            for table, column in PARTITIONED_TABLES.items():
+                if table in already_partitioned:
+                    continue
+                _convert_table(cursor, table, column, first_month)
+                converted.append(table)
+                logger.info(f"{_current_schema(cursor)}.{table}: секционирование по {column} включено")
+        ensure_partitions(months_ahead)
+    return converted
+
+
+def ensure_partitions(months_ahead=DEFAULT_MONTHS_AHEAD):
+    """
+    Создаёт недостающие месячные секции с текущего месяца на months_ahead вперёд.
+
+    Месяцы, уже покрытые секцией _legacy, пропускаются. Таблицы, которые ещё
+    не секционированы, не трогает.
+
+    Returns:
+        list: имена созданных секций
+    """
+    tables = partitioned_tables()
+    if not tables:
+        return []
+
+    this_month = month_start(timezone.localdate())
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table in PARTITIONED_TABLES:
+            if table not in tables:
+                continue
+            partitions = _partitions(cursor, table)
+            existing = {name for name, _ in partitions}
+            covered_until = dict(partitions).get(f'{table}_legacy')
+
+            for offset in range(months_ahead + 1):
+                month = add_months(this_month, offset)
+                name = f'{table}_p{month:%Y%m}'
+                if name in existing:
+                    continue
+                if covered_until and _month_bound(month) < covered_until:
+                    continue
+                cursor.execute(
+                    f'CREATE TABLE {_quote(name)} PARTITION OF {_quote(table)} '
+                    f'FOR VALUES FROM (%s) TO (%s)',
+                    [_month_bound(month), _month_bound(add_months(month, 1))]
+                )
+                created.append(name)
+    return created
+
+
+def detach_partitions(before_month):
+    """
+    Отсоединяет секции, целиком лежащие до before_month.
+
+    Отсоединённые секции остаются обычными таблицами в схеме магазина:
+    их можно выгрузить (pg_dump -t) и удалить. Продажи из них пропадают
+    из API, отчётов и выгрузок.
+
+    Returns:
+        list: имена отсоединённых секций
+    """
+    tables = partitioned_tables()
+    if not tables:
+        return []
+
+    boundary = _month_bound(month_start(before_month))
+    detached = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table in PARTITIONED_TABLES:
+            if table not in tables:
+                continue
+            for name, upper_bound in _partitions(cursor, table):
+                if upper_bound is None or upper_bound > boundary:
+                    continue
+                cursor.execute(f'ALTER TABLE {_quote(table)} DETACH PARTITION {_quote(name)}')
+                detached.append(name)
+    return detached
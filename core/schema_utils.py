@@ -130,6 +130,14 @@ class SchemaManager:
                         ON CONFLICT DO NOTHING
                     """)
 
+            # Таблицы продаж сразу с помесячными секциями (пустые - перевод мгновенный)
+            if getattr(settings, 'SALES_PARTITIONING', False):
+                try:
+                    from core.partitioning import partition_sales_tables
+                    partition_sales_tables(settings.SALES_PARTITION_MONTHS_AHEAD)
+                except Exception as e:
+                    logger.warning(f"Sales tables in {schema_name} are not partitioned: {e}")
+
             # Возвращаем search_path обратно
             with connection.cursor() as cursor:
                 cursor.execute('SET search_path TO public')
@@ -242,6 +250,32 @@ class SchemaManager:
         except Exception as e:
             logger.error(f"Error resetting search_path: {e}")
 
+    @staticmethod
+    def get_current_schema():
+        """
+        Возвращает схему, на которую сейчас указывает search_path.
+
+        Нужна сигналам и фоновым задачам, которые должны знать,
+        в каком магазине произошло событие.
+
+        Returns:
+            str: Имя схемы ('public' для SQLite или при ошибке)
+        """
+        if 'sqlite' in settings.DATABASES['default']['ENGINE']:
+            return 'public'
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SHOW search_path')
+                search_path = cursor.fetchone()[0]
+
+            # "tenant_shop, public" или '"tenant_shop", public'
+            return search_path.split(',')[0].strip().strip('"') or 'public'
+
+        except Exception as e:
+            logger.error(f"Error getting current schema: {e}")
+            return 'public'
+
     @staticmethod
     def list_schemas():
         """
@@ -354,3 +388,25 @@ class schema_context:
                     cursor.execute(f'SET search_path TO {self.original_path}')
                 else:
                     cursor.execute('SET search_path TO public')
+
+
+def iter_tenant_schemas():
+    """
+    Перебирает схемы всех активных магазинов.
+
+    Внутри каждой итерации search_path уже переключён на схему магазина,
+    поэтому периодические задачи могут работать с ORM как обычно.
+
+    Использование:
+        for schema_name in iter_tenant_schemas():
+            ProductBatch.refresh_expiry_buckets()
+    """
+    from users.models import Store
+
+    schema_names = list(
+        Store.objects.filter(is_active=True).order_by('created_at').values_list('schema_name', flat=True)
+    )
+
+    for schema_name in schema_names:
+        with schema_context(schema_name):
+            yield schema_name
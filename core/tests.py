@@ -1,3 +1,126 @@
-from django.test import TestCase
+import threading
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from core.idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER, idempotent
+
+
+class CounterView(APIView):
+    """Действие, которое считает вызовы (повтор не должен выполнять его снова)"""
+
+    authentication_classes = []
+    permission_classes = []
+
+    calls = 0
+    status_code = 201
+    entered = None
+    release = None
+
+    @idempotent
+    def post(self, request):
+        type(self).calls += 1
+        if self.entered is not None:
+            self.entered.set()
+            self.release.wait(5)
+        return Response({'call': self.calls}, status=self.status_code)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'idempotency-tests'}},
+    IDEMPOTENCY_KEY_TTL=60,
+    IDEMPOTENCY_LOCK_TIMEOUT=60,
+    IDEMPOTENCY_WAIT=0,
+)
+class IdempotentTests(SimpleTestCase):
+    """Декоратор core.idempotency.idempotent"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        CounterView.calls = 0
+        CounterView.status_code = 201
+        CounterView.entered = CounterView.release = None
+        self.view = CounterView.as_view()
+
+    def post(self, body, key='key-1'):
+        headers = {f'HTTP_{IDEMPOTENCY_HEADER.upper().replace("-", "_")}': key} if key else {}
+        request = APIRequestFactory().post('/pos/scan/', body, format='json', **headers)
+        return self.view(request)
+
+    def test_replay_returns_stored_response(self):
+        first = self.post({'product': 1})
+        second = self.post({'product': 1})
+
+        self.assertEqual(CounterView.calls, 1)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second[REPLAYED_HEADER], 'true')
+        self.assertFalse(first.has_header(REPLAYED_HEADER))
+
+    def test_other_key_or_no_key_runs_again(self):
+        self.post({'product': 1})
+        self.post({'product': 1}, key='key-2')
+        self.post({'product': 1}, key=None)
+
+        self.assertEqual(CounterView.calls, 3)
+
+    def test_same_key_different_body_returns_422(self):
+        self.post({'product': 1})
+        response = self.post({'product': 2})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(CounterView.calls, 1)
+
+    def test_server_error_releases_key(self):
+        CounterView.status_code = 503
+        self.assertEqual(self.post({'product': 1}).status_code, 503)
+
+        CounterView.status_code = 201
+        response = self.post({'product': 1})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CounterView.calls, 2)
+        self.assertFalse(response.has_header(REPLAYED_HEADER))
+
+    def _start_in_flight(self):
+        """Первый запрос в другом потоке, остановленный внутри действия"""
+        CounterView.entered = threading.Event()
+        CounterView.release = threading.Event()
+        results = {}
+        thread = threading.Thread(target=lambda: results.update(first=self.post({'product': 1})))
+        thread.start()
+        self.assertTrue(CounterView.entered.wait(5))
+        return thread, results
+
+    def test_concurrent_request_gets_409(self):
+        thread, results = self._start_in_flight()
+        try:
+            response = self.post({'product': 1})
+        finally:
+            CounterView.release.set()
+            thread.join()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(results['first'].status_code, 201)
+        self.assertEqual(CounterView.calls, 1)
+
+    @override_settings(IDEMPOTENCY_WAIT=5)
+    def test_concurrent_request_waits_for_first_response(self):
+        thread, results = self._start_in_flight()
+        timer = threading.Timer(0.2, CounterView.release.set)
+        timer.start()
+        try:
+            response = self.post({'product': 1})
+        finally:
+            CounterView.release.set()
+            thread.join()
+            timer.cancel()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, results['first'].data)
+        self.assertEqual(response[REPLAYED_HEADER], 'true')
+        self.assertEqual(CounterView.calls, 1)
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customers", "0002_alter_customertransaction_performed_by"),
+        ("sales", "0008_add_cashier_db_constraint_false"),
+        ("users", "0005_add_staff_role"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customertransaction",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="customers_t_created_09c9a2_idx"
+            ),
+        ),
+    ]
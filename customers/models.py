@@ -190,6 +190,7 @@ class CustomerTransaction(models.Model):
             models.Index(fields=['transaction_type']),
             models.Index(fields=['sale']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['-created_at', '-id']),  # Курсорная пагинация
         ]
 
     def __str__(self):
@@ -16,6 +16,7 @@ from customers.serializers import (
     CustomerDetailSerializer, CustomerCreateUpdateSerializer,
     CustomerTransactionSerializer
 )
+from core.pagination import CursorOrPageNumberPagination
 from core.permissions import IsTenantUser
 
 
@@ -192,3 +193,4 @@ class CustomerTransactionViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ['customer', 'transaction_type', 'sale']
     ordering_fields = ['created_at', 'amount']
     ordering = ['-created_at']
+    pagination_class = CursorOrPageNumberPagination  # ?pagination=cursor для больших списков
@@ -0,0 +1,204 @@
+"""
+Выдача штрихкодов EAN-13 для товаров магазина.
+
+Формат: 487 (префикс) + 9 цифр порядкового номера + контрольная цифра.
+
+Номера берутся из последовательности PostgreSQL в схеме магазина
+(products_barcode_seq, INCREMENT BY BARCODE_BLOCK_SIZE): один nextval()
+резервирует целый блок номеров, который процесс раздаёт без обращений к БД.
+nextval() не блокируется и не откатывается, поэтому параллельные импорты
+не ждут друг друга (пропуски номеров допустимы).
+
+Использование:
+    barcode = allocate_barcode()
+    barcodes = allocate_barcodes(500)  # массовый импорт
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.utils import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+
+BARCODE_PREFIX = getattr(settings, 'PRODUCT_BARCODE_PREFIX', '487')
+BARCODE_BLOCK_SIZE = getattr(settings, 'PRODUCT_BARCODE_BLOCK_SIZE', 100)
+BARCODE_SEQUENCE = 'products_barcode_seq'
+
+# Разрядность порядкового номера: 13 - префикс - контрольная цифра
+SERIAL_DIGITS = 12 - len(BARCODE_PREFIX)
+
+# Зарезервированные, но ещё не выданные номера: {схема: [следующий, конец блока)}
+_blocks = {}
+_lock = threading.Lock()
+
+
+def ean13_check_digit(code12):
+    """Контрольная цифра EAN-13 для первых 12 цифр"""
+    odd_sum = sum(int(code12[i]) for i in range(0, 12, 2))
+    even_sum = sum(int(code12[i]) for i in range(1, 12, 2))
+    total = odd_sum + (even_sum * 3)
+    return (10 - (total % 10)) % 10
+
+
+def is_valid_ean13(code):
+    """Проверяет формат и контрольную цифру EAN-13"""
+    return (
+        isinstance(code, str) and len(code) == 13 and code.isdigit()
+        and ean13_check_digit(code[:12]) == int(code[12])
+    )
+
+
+def make_ean13(serial):
+    """Штрихкод из порядкового номера"""
+    code12 = f"{BARCODE_PREFIX}{serial:0{SERIAL_DIGITS}d}"
+    return code12 + str(ean13_check_digit(code12))
+
+
+def _is_sqlite():
+    return 'sqlite' in settings.DATABASES['default']['ENGINE']
+
+
+def _reserve_blocks(count):
+    """
+    Резервирует count блоков номеров в последовательности магазина.
+
+    Returns:
+        list[int]: первые номера каждого блока
+    """
+    if _is_sqlite():
+        # Dev режим: последовательностей нет, продолжаем от максимального номера
+        from products.models import Product
+
+        last = 0
+        for code in Product.objects.filter(barcode__startswith=BARCODE_PREFIX).values_list('barcode', flat=True):
+            if is_valid_ean13(code):
+                last = max(last, int(code[len(BARCODE_PREFIX):12]))
+        start = last + 1
+        return [start + i * BARCODE_BLOCK_SIZE for i in range(count)]
+
+    query = f"SELECT nextval('{BARCODE_SEQUENCE}') FROM generate_series(1, %s)"
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(query, [count])
+                return [row[0] for row in cursor.fetchall()]
+    except DatabaseError:
+        # Схема создана без миграций (SchemaManager) - создаём последовательность
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE SEQUENCE IF NOT EXISTS {BARCODE_SEQUENCE} "
+                f"INCREMENT BY {BARCODE_BLOCK_SIZE} START WITH 1"
+            )
+            cursor.execute(query, [count])
+            return [row[0] for row in cursor.fetchall()]
+
+
+def _take_serials(schema_name, count):
+    """Берёт count номеров из блоков процесса, при необходимости резервирует новые"""
+    serials = []
+    with _lock:
+        block = _blocks.get(schema_name)
+        while block and len(serials) < count:
+            serials.append(block[0])
+            block[0] += 1
+            if block[0] >= block[1]:
+                _blocks.pop(schema_name, None)
+                block = None
+
+    missing = count - len(serials)
+    if missing <= 0:
+        return serials
+
+    starts = _reserve_blocks(-(-missing // BARCODE_BLOCK_SIZE))
+    for start in starts:
+        for serial in range(start, start + BARCODE_BLOCK_SIZE):
+            if len(serials) < count:
+                serials.append(serial)
+            else:
+                # Остаток последнего блока оставляем для следующих вызовов
+                with _lock:
+                    _blocks[schema_name] = [serial, start + BARCODE_BLOCK_SIZE]
+                break
+
+    return serials
+
+
+def allocate_barcodes(count):
+    """
+    Выдаёт count свободных штрихкодов EAN-13.
+
+    Коды, которые уже заняты (старые случайные штрихкоды, ручной ввод),
+    пропускаются - на каждый блок один запрос проверки.
+
+    Returns:
+        list[str]
+    """
+    from core.schema_utils import SchemaManager
+    from products.models import Product, ProductBarcode
+
+    schema_name = SchemaManager.get_current_schema()
+    result = []
+
+    while len(result) < count:
+        candidates = [make_ean13(serial) for serial in _take_serials(schema_name, count - len(result))]
+        taken = set(
+            Product.objects.filter(barcode__in=candidates).values_list('barcode', flat=True)
+        ) | set(
+            ProductBarcode.objects.filter(barcode__in=candidates).values_list('barcode', flat=True)
+        )
+        result.extend(code for code in candidates if code not in taken)
+
+    return result
+
+
+def allocate_barcode():
+    """Выдаёт один свободный штрихкод EAN-13"""
+    return allocate_barcodes(1)[0]
+
+
+def find_duplicate_barcodes(product_model):
+    """
+    Товары с повторяющимися штрихкодами (кроме самого старого в каждой группе).
+
+    Args:
+        product_model: модель Product (в миграции - историческая)
+
+    Returns:
+        QuerySet: товары, которым нужен новый штрихкод
+    """
+    from django.db.models import Count, Min
+
+    duplicates = product_model.objects.exclude(barcode='').values('barcode').annotate(
+        count=Count('id'),
+        first_id=Min('id')
+    ).filter(count__gt=1)
+
+    keep_ids = [row['first_id'] for row in duplicates]
+    barcodes = [row['barcode'] for row in duplicates]
+
+    return product_model.objects.filter(barcode__in=barcodes).exclude(id__in=keep_ids).order_by('id')
+
+
+def reassign_barcodes(products):
+    """
+    Присваивает товарам новые штрихкоды одним bulk_update.
+
+    Args:
+        products: список товаров (Product или историческая модель)
+
+    Returns:
+        int: количество обновлённых товаров
+    """
+    products = list(products)
+    if not products:
+        return 0
+
+    for product, barcode in zip(products, allocate_barcodes(len(products))):
+        product.barcode = barcode
+
+    type(products[0]).objects.bulk_update(products, ['barcode'], batch_size=500)
+    return len(products)
@@ -0,0 +1,179 @@
+"""
+Генерация уменьшенных копий изображений товаров (Pillow).
+
+Для каждого загруженного изображения создаются варианты:
+- thumb  - миниатюра для POS и поиска
+- list   - карточка в каталоге
+- detail - страница товара
+
+Каждый вариант сохраняется в WebP и JPEG рядом с оригиналом.
+Имя файла строится из модели и ID объекта и хеша содержимого оригинала:
+повторная обработка того же файла ничего не перезаписывает, новый файл
+получает новые URL (кэш браузера/CDN не мешает), а у двух товаров
+с одинаковой картинкой свои файлы - замена изображения одного товара
+не удаляет варианты другого.
+
+Результат хранится в JSON поле image_variants:
+    {
+        'source': 'products/milk.png',
+        'thumb': {'webp': 'products/product_5_3f2a..._thumb.webp', 'jpeg': 'products/product_5_3f2a..._thumb.jpg'},
+        'list': {...},
+        'detail': {...}
+    }
+"""
+
+import hashlib
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+
+# Максимальные размеры вариантов (ширина, высота); пропорции сохраняются
+IMAGE_VARIANTS = {
+    'thumb': (150, 150),
+    'list': (400, 400),
+    'detail': (1200, 1200),
+}
+
+# Форматы: ключ в image_variants -> (формат Pillow, расширение, параметры сохранения)
+IMAGE_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def content_hash(data):
+    """Короткий хеш содержимого файла (для имени вариантов)"""
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _prepare(image):
+    """Приводит изображение к RGB (JPEG не поддерживает прозрачность)"""
+    from PIL import Image, ImageOps
+
+    # Учитываем ориентацию из EXIF (фото с телефона)
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def variant_owner(instance):
+    """Префикс имён файлов вариантов объекта: '<модель>_<ID>'"""
+    return f'{instance._meta.model_name}_{instance.pk}'
+
+
+def generate_variants(field_file, owner):
+    """
+    Создаёт все варианты изображения и сохраняет их в хранилище.
+
+    Args:
+        field_file: значение ImageField (product.main_image / product_image.image)
+        owner: префикс имён файлов (variant_owner)
+
+    Returns:
+        dict: структура для поля image_variants (пустой dict, если файла нет)
+    """
+    from PIL import Image
+
+    if not field_file:
+        return {}
+
+    field_file.open('rb')
+    try:
+        data = field_file.read()
+    finally:
+        field_file.close()
+
+    digest = content_hash(data)
+    directory = os.path.dirname(field_file.name)
+
+    with Image.open(io.BytesIO(data)) as original:
+        source = _prepare(original)
+
+        variants = {'source': field_file.name}
+        for variant, size in IMAGE_VARIANTS.items():
+            resized = source.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+
+            variants[variant] = {}
+            for key, (pil_format, extension, params) in IMAGE_FORMATS.items():
+                name = os.path.join(directory, f'{owner}_{digest}_{variant}.{extension}')
+
+                # Файл с таким хешем уже есть - содержимое то же самое
+                if not default_storage.exists(name):
+                    buffer = io.BytesIO()
+                    resized.save(buffer, format=pil_format, **params)
+                    name = default_storage.save(name, ContentFile(buffer.getvalue()))
+
+                variants[variant][key] = name
+
+    return variants
+
+
+def variant_files(variants):
+    """Множество путей файлов всех вариантов"""
+    return {
+        name
+        for variant in IMAGE_VARIANTS
+        for name in (variants or {}).get(variant, {}).values()
+    }
+
+
+def delete_variants(variants, owner, keep=None):
+    """
+    Удаляет файлы вариантов объекта из хранилища.
+
+    Файлы без префикса owner (созданные до того, как он появился в имени,
+    и общие для объектов с одинаковой картинкой) не удаляются.
+
+    Args:
+        variants: значение image_variants
+        owner: префикс имён файлов объекта (variant_owner)
+        keep: image_variants, файлы которых удалять нельзя (тот же хеш)
+    """
+    for name in variant_files(variants) - variant_files(keep):
+        if not os.path.basename(name).startswith(f'{owner}_'):
+            continue
+        try:
+            default_storage.delete(name)
+        except Exception as e:
+            logger.warning(f"Не удалось удалить вариант изображения {name}: {e}")
+
+
+def variant_urls(variants, field_file, request=None):
+    """
+    URL вариантов для API.
+
+    Args:
+        variants: значение image_variants
+        field_file: текущее изображение; варианты другого (заменённого) файла не отдаются
+
+    Returns:
+        dict | None: {'thumb': {'webp': url, 'jpeg': url}, ...}
+    """
+    if not variants or not field_file or variants.get('source') != field_file.name:
+        return None
+
+    urls = {}
+    for variant in IMAGE_VARIANTS:
+        files = variants.get(variant)
+        if not files:
+            continue
+        urls[variant] = {}
+        for key, name in files.items():
+            url = default_storage.url(name)
+            urls[variant][key] = request.build_absolute_uri(url) if request else url
+    return urls or None
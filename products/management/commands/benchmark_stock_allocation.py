@@ -0,0 +1,228 @@
+"""
+Management command для нагрузочной проверки списания по партиям (FEFO).
+
+Создаёт временный товар с несколькими партиями и запускает параллельные
+оплаты чеков из нескольких потоков (каждый поток - отдельное соединение с БД
+и своя смена, как отдельная касса). Списание идёт тем же путём, что и на
+кассе: Sale.complete_sale -> sales.checkout.complete_sale (партии
+блокируются в порядке id). После прогона проверяет, что не продано больше,
+чем было на складе, и удаляет временные товар, кассы и чеки.
+
+Usage:
+    python manage.py benchmark_stock_allocation --store test_shop
+    python manage.py benchmark_stock_allocation --store test_shop --workers 20 --checkouts 50 --quantity 3
+"""
+
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.schema_utils import schema_context
+from users.models import Store
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочная проверка параллельного списания товара по партиям (FEFO)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store',
+            type=str,
+            required=True,
+            help='Slug магазина',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=10,
+            help='Количество параллельных касс (потоков)',
+        )
+        parser.add_argument(
+            '--checkouts',
+            type=int,
+            default=50,
+            help='Количество чеков на одну кассу',
+        )
+        parser.add_argument(
+            '--quantity',
+            type=str,
+            default='1',
+            help='Количество товара в одном чеке',
+        )
+        parser.add_argument(
+            '--batches',
+            type=int,
+            default=5,
+            help='Количество партий временного товара',
+        )
+        parser.add_argument(
+            '--batch-quantity',
+            type=str,
+            default='100',
+            help='Остаток в каждой партии',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            store = Store.objects.get(slug=options['store'])
+        except Store.DoesNotExist:
+            self.stdout.write(self.style.ERROR(f'❌ Магазин "{options["store"]}" не найден'))
+            return
+
+        workers = options['workers']
+        checkouts = options['checkouts']
+        quantity = Decimal(options['quantity'])
+        initial_total = Decimal(options['batch_quantity']) * options['batches']
+
+        self.stdout.write(f'\n📦 {store.name} ({store.schema_name})')
+        self.stdout.write(
+            f'   Касс: {workers}, чеков на кассу: {checkouts}, '
+            f'по {quantity}, на складе: {initial_total}\n'
+        )
+
+        with schema_context(store.schema_name):
+            product = self._create_product(options['batches'], Decimal(options['batch_quantity']))
+            sessions = self._create_sessions(workers)
+
+        results = {'ok': 0, 'insufficient': 0, 'errors': 0, 'latencies': []}
+        lock = threading.Lock()
+
+        def worker(session):
+            from products.stock import InsufficientStockError
+
+            latencies = []
+            ok = insufficient = errors = 0
+            try:
+                with schema_context(store.schema_name):
+                    for _ in range(checkouts):
+                        sale = self._create_sale(session, product, quantity)
+                        started = time.perf_counter()
+                        try:
+                            sale.complete_sale()
+                            ok += 1
+                        except InsufficientStockError:
+                            insufficient += 1
+                        except Exception:
+                            errors += 1
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+            with lock:
+                results['ok'] += ok
+                results['insufficient'] += insufficient
+                results['errors'] += errors
+                results['latencies'].extend(latencies)
+
+        threads = [threading.Thread(target=worker, args=(session,)) for session in sessions]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with schema_context(store.schema_name):
+            remaining = sum(
+                (batch.quantity for batch in product.batches.all()), Decimal('0')
+            )
+            negative = product.batches.filter(quantity__lt=0).count()
+            self._cleanup(product, sessions)
+
+        latencies = sorted(results['latencies']) or [0]
+        sold = quantity * results['ok']
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(f'Время: {elapsed:.2f} c, оплат/с: {len(results["latencies"]) / elapsed:.1f}')
+        self.stdout.write(
+            f'p50: {latencies[len(latencies) // 2] * 1000:.1f} мс, '
+            f'p99: {latencies[int(len(latencies) * 0.99) - 1 if len(latencies) > 1 else 0] * 1000:.1f} мс'
+        )
+        self.stdout.write(f'Успешно: {results["ok"]}, не хватило товара: {results["insufficient"]}')
+        if results['errors']:
+            self.stdout.write(self.style.ERROR(f'Ошибок: {results["errors"]}'))
+        self.stdout.write(f'Продано: {sold}, осталось: {remaining}')
+        self.stdout.write('='*60)
+
+        if sold + remaining == initial_total and negative == 0:
+            self.stdout.write(self.style.SUCCESS('\n✅ Остатки сходятся, перепродаж нет'))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'\n❌ Остатки не сходятся: продано {sold} + осталось {remaining} != {initial_total}'
+            ))
+
+    def _create_product(self, batches, batch_quantity):
+        """Создаёт временный товар с партиями"""
+        from products.models import Product, ProductBatch, ProductInventory, Unit
+
+        unit = Unit.objects.first() or Unit.objects.create(name='штука', short_name='шт')
+        suffix = uuid.uuid4().hex[:8]
+        product = Product.objects.create(
+            name=f'Benchmark {suffix}',
+            slug=f'benchmark-{suffix}',
+            sku=f'BENCH-{suffix}',
+            unit=unit
+        )
+        ProductInventory.objects.create(product=product)
+        ProductBatch.objects.bulk_create([
+            ProductBatch(
+                product=product,
+                batch_number=f'BENCH-{suffix}-{i}',
+                quantity=batch_quantity,
+                purchase_price=Decimal('1.00')
+            )
+            for i in range(batches)
+        ])
+        return product
+
+    def _create_sessions(self, workers):
+        """Создаёт временные кассы с открытыми сменами (по одной на поток)"""
+        from sales.models import CashRegister, CashierSession
+
+        suffix = uuid.uuid4().hex[:6].upper()
+        sessions = []
+        for i in range(workers):
+            register = CashRegister.objects.create(name=f'Benchmark {suffix} {i}', code=f'S{suffix}{i}')
+            sessions.append(CashierSession.objects.create(
+                cash_register=register,
+                cashier_name='Benchmark',
+                opening_cash=0
+            ))
+        return sessions
+
+    def _create_sale(self, session, product, quantity):
+        """Открытый чек с одной позицией (партия выбирается при оплате по FEFO)"""
+        from sales.models import Sale, SaleItem
+        from sales.receipts import allocate_receipt_number
+
+        sale = Sale.objects.create(
+            session=session,
+            receipt_number=allocate_receipt_number(session.cash_register.code),
+            status='pending',
+            subtotal=quantity,
+            total_amount=quantity
+        )
+        SaleItem.objects.create(
+            sale=sale,
+            product=product,
+            quantity=quantity,
+            unit_price=Decimal('1.00')
+        )
+        return sale
+
+    def _cleanup(self, product, sessions):
+        """Удаляет чеки, смены, кассы и товар замера"""
+        from sales.models import CashRegister, CashierSession, ReceiptCounter, Sale
+        from sales.receipts import receipt_prefix
+
+        Sale.objects.filter(session__in=sessions).delete()
+        product.delete()
+        CashierSession.objects.filter(pk__in=[session.pk for session in sessions]).delete()
+        CashRegister.objects.filter(pk__in=[session.cash_register_id for session in sessions]).delete()
+        ReceiptCounter.objects.filter(
+            prefix__in=[receipt_prefix(session.cash_register.code) for session in sessions]
+        ).delete()
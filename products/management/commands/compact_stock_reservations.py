@@ -0,0 +1,146 @@
+"""
+Management command для очистки таблицы резервирований (products_stock_reservation).
+
+Продажи больше не создают StockReservation (движение товара хранится
+в позициях чека), но в таблице остались завершённые и отменённые резервы
+старых продаж. Команда удаляет их пачками по id, при необходимости
+предварительно выгружая в JSONL архив. Активные резервы не трогаются.
+
+Usage:
+    python manage.py compact_stock_reservations --store test_shop --dry-run
+    python manage.py compact_stock_reservations --store test_shop --days 30
+    python manage.py compact_stock_reservations --store test_shop --archive-file reservations.jsonl.gz
+"""
+
+import gzip
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from core.schema_utils import schema_context
+from users.models import Store
+
+
+# Активные резервы держат остаток, их удалять нельзя
+COMPACTABLE_STATUSES = ('completed', 'cancelled', 'expired')
+
+ARCHIVE_FIELDS = (
+    'id', 'product_id', 'batch_id', 'quantity', 'order_id', 'order_reference',
+    'status', 'reserved_until', 'notes', 'created_at', 'updated_at', 'created_by_id',
+)
+
+
+class Command(BaseCommand):
+    help = 'Удаление (с архивом) старых завершённых резервирований товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store',
+            type=str,
+            help='Slug магазина (если не указан - все магазины)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Удалять резервы старше N дней',
+        )
+        parser.add_argument(
+            '--status',
+            action='append',
+            choices=COMPACTABLE_STATUSES,
+            help='Статус резервов (можно несколько раз, по умолчанию все кроме active)',
+        )
+        parser.add_argument(
+            '--archive-file',
+            type=str,
+            help='Сохранить удаляемые резервы в JSONL (.gz - со сжатием)',
+        )
+        parser.add_argument(
+            '--chunk',
+            type=int,
+            default=5000,
+            help='Резервов в одной транзакции',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать, ничего не удалять',
+        )
+
+    def handle(self, *args, **options):
+        if options['store']:
+            stores = Store.objects.filter(slug=options['store'])
+            if not stores.exists():
+                raise CommandError(f'❌ Магазин "{options["store"]}" не найден')
+        else:
+            stores = Store.objects.filter(is_active=True)
+
+        statuses = options['status'] or list(COMPACTABLE_STATUSES)
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        dry_run = options['dry_run']
+
+        archive = None
+        if options['archive_file'] and not dry_run:
+            path = options['archive_file']
+            archive = gzip.open(path, 'at', encoding='utf-8') if path.endswith('.gz') else open(path, 'a', encoding='utf-8')
+
+        total = 0
+        try:
+            for store in stores:
+                with schema_context(store.schema_name):
+                    count = self._compact_store(store, statuses, cutoff, options['chunk'], archive, dry_run)
+                total += count
+        finally:
+            if archive:
+                archive.close()
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'\n⚠️  Dry run: к удалению {total} резервов'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'\n✅ Удалено резервов: {total}'))
+
+    def _compact_store(self, store, statuses, cutoff, chunk, archive, dry_run):
+        """Удаляет резервы одного магазина пачками, возвращает их количество"""
+        from products.models import StockReservation
+
+        queryset = StockReservation.objects.filter(
+            status__in=statuses,
+            updated_at__lt=cutoff
+        )
+
+        if dry_run:
+            count = queryset.count()
+            self.stdout.write(f'📦 {store.name}: {count}')
+            return count
+
+        deleted = 0
+        last_id = 0
+        while True:
+            ids = list(
+                queryset.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:chunk]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            with transaction.atomic():
+                if archive:
+                    for row in StockReservation.objects.filter(id__in=ids).order_by('id').values(*ARCHIVE_FIELDS):
+                        row['schema'] = store.schema_name
+                        archive.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+
+                # Позиции чеков ссылаются на резерв через SET_NULL:
+                # delete() обнулит ссылки одним UPDATE на пачку
+                deleted += StockReservation.objects.filter(id__in=ids).delete()[1].get(
+                    StockReservation._meta.label, 0
+                )
+
+        self.stdout.write(f'📦 {store.name}: удалено {deleted}')
+        return deleted
@@ -0,0 +1,83 @@
+"""
+Management command для исправления штрихкодов товаров.
+
+- Выдаёт новые штрихкоды товарам с повторяющимся штрихкодом
+  (самый старый товар в группе сохраняет свой код)
+- Заполняет пустые штрихкоды
+
+Usage:
+    python manage.py repair_barcodes
+    python manage.py repair_barcodes --store test_shop
+    python manage.py repair_barcodes --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.schema_utils import schema_context
+from users.models import Store
+
+
+class Command(BaseCommand):
+    help = 'Исправляет повторяющиеся и пустые штрихкоды товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store',
+            type=str,
+            help='Slug конкретного магазина (опционально)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет исправлено',
+        )
+
+    def handle(self, *args, **options):
+        store_slug = options.get('store')
+        dry_run = options.get('dry_run', False)
+
+        if store_slug:
+            try:
+                stores = [Store.objects.get(slug=store_slug)]
+            except Store.DoesNotExist:
+                self.stdout.write(self.style.ERROR(f'❌ Магазин "{store_slug}" не найден'))
+                return
+        else:
+            stores = list(Store.objects.filter(is_active=True).order_by('created_at'))
+
+        total = 0
+        for store in stores:
+            self.stdout.write(f'\n📦 {store.name} ({store.schema_name})...')
+            try:
+                with schema_context(store.schema_name):
+                    total += self._repair(dry_run)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'❌ Ошибка для {store.name}: {e}'))
+
+        self.stdout.write('\n' + '='*60)
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'Будет исправлено товаров: {total} (dry-run)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ Исправлено товаров: {total}'))
+
+    def _repair(self, dry_run):
+        """Исправляет штрихкоды в текущей схеме"""
+        from products.barcodes import find_duplicate_barcodes, reassign_barcodes
+        from products.models import Product
+
+        duplicates = list(find_duplicate_barcodes(Product))
+        empty = list(Product.objects.filter(barcode='').order_by('id'))
+
+        self.stdout.write(f'  Дубли: {len(duplicates)}, без штрихкода: {len(empty)}')
+
+        if dry_run:
+            for product in duplicates:
+                self.stdout.write(f'    {product.id} {product.name}: {product.barcode}')
+            return len(duplicates) + len(empty)
+
+        with transaction.atomic():
+            count = reassign_barcodes(duplicates + empty)
+
+        self.stdout.write(self.style.SUCCESS(f'  ✓ Новые штрихкоды: {count}'))
+        return count
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0006_categoryattribute"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="image_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="thumb/list/detail в WebP и JPEG, заполняется фоновой задачей",
+                verbose_name="Варианты изображения",
+            ),
+        ),
+        migrations.AddField(
+            model_name="productimage",
+            name="image_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="thumb/list/detail в WebP и JPEG, заполняется фоновой задачей",
+                verbose_name="Варианты изображения",
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:10
+
+from django.db import migrations, models
+
+
+def create_barcode_sequence(apps, schema_editor):
+    """Последовательность для выдачи штрихкодов блоками (только PostgreSQL)"""
+    from products.barcodes import BARCODE_BLOCK_SIZE, BARCODE_SEQUENCE
+
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute(
+        f"CREATE SEQUENCE IF NOT EXISTS {BARCODE_SEQUENCE} "
+        f"INCREMENT BY {BARCODE_BLOCK_SIZE} START WITH 1"
+    )
+
+
+def repair_duplicate_barcodes(apps, schema_editor):
+    """Перед уникальным ограничением выдаём новые штрихкоды дублям"""
+    from products.barcodes import find_duplicate_barcodes, reassign_barcodes
+
+    Product = apps.get_model("products", "Product")
+    reassign_barcodes(find_duplicate_barcodes(Product))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0007_product_image_variants"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_barcode_sequence, migrations.RunPython.noop),
+        migrations.RunPython(repair_duplicate_barcodes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="product",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("barcode", ""), _negated=True),
+                fields=("barcode",),
+                name="products_product_barcode_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:49
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_expiry_buckets(apps, schema_editor):
+    """Первичный расчёт групп сроков годности для существующих партий"""
+    ProductBatch = apps.get_model("products", "ProductBatch")
+
+    today = timezone.now().date()
+    week = today + timedelta(days=7)
+    month = today + timedelta(days=30)
+
+    ProductBatch.objects.filter(expiry_date__lt=today).update(expiry_bucket="expired")
+    ProductBatch.objects.filter(expiry_date__gte=today, expiry_date__lte=week).update(expiry_bucket="week")
+    ProductBatch.objects.filter(expiry_date__gt=week, expiry_date__lte=month).update(expiry_bucket="month")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0008_product_barcode_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productbatch",
+            name="expiry_bucket",
+            field=models.CharField(
+                choices=[
+                    ("expired", "Истёк"),
+                    ("week", "До 7 дней"),
+                    ("month", "До 30 дней"),
+                    ("ok", "В норме"),
+                ],
+                default="ok",
+                help_text="Истёк / до 7 дней / до 30 дней / в норме",
+                max_length=10,
+                verbose_name="Срок годности",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productbatch",
+            index=models.Index(
+                condition=models.Q(
+                    ("is_active", True),
+                    ("quantity__gt", 0),
+                    models.Q(("expiry_bucket", "ok"), _negated=True),
+                ),
+                fields=["expiry_bucket", "expiry_date"],
+                name="products_batch_expiry_risk_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productbatch",
+            index=models.Index(
+                condition=models.Q(("is_active", True), ("quantity__gt", 0)),
+                fields=["product", "expiry_bucket"],
+                name="products_batch_prod_bucket_idx",
+            ),
+        ),
+        migrations.RunPython(fill_expiry_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0009_productbatch_expiry_bucket"),
+        ("users", "0005_add_staff_role"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="product",
+            name="products_pr_created_bce1a7_idx",
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="products_pr_created_e6f9fc_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockreservation",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="products_st_created_027ec1_idx"
+            ),
+        ),
+    ]
@@ -422,6 +422,14 @@ class Product(models.Model):
         verbose_name=_('Главное изображение')
     )
 
+    # Уменьшенные копии главного изображения (products.images)
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name=_('Варианты изображения'),
+        help_text=_('thumb/list/detail в WebP и JPEG, заполняется фоновой задачей')
+    )
+
     # Характеристики товара
     weight = models.DecimalField(
         max_digits=10,
@@ -479,28 +487,23 @@ class Product(models.Model):
             models.Index(fields=['barcode']),
             models.Index(fields=['category']),
             models.Index(fields=['is_active']),
-            models.Index(fields=['-created_at']),
+            models.Index(fields=['-created_at', '-id']),  # Сортировка по умолчанию и курсорная пагинация
+        ]
+        constraints = [
+            # Пустой штрихкод допустим у нескольких товаров, заполненный - уникален
+            models.UniqueConstraint(
+                fields=['barcode'],
+                condition=~models.Q(barcode=''),
+                name='products_product_barcode_uniq'
+            ),
         ]
 
     def save(self, *args, **kwargs):
         """Автоматическая генерация штрихкода если не указан"""
         if not self.barcode:
-            import random
-            # Генерируем EAN-13 совместимый штрихкод (13 цифр)
-            # Формат: 487 (prefix) + 9 случайных цифр + контрольная сумма
-            prefix = "487"  # Можно изменить на свой префикс
-            random_part = ''.join([str(random.randint(0, 9)) for _ in range(9)])
-
-            # Генерируем штрихкод без контрольной суммы
-            barcode_without_check = prefix + random_part
-
-            # Вычисляем контрольную сумму EAN-13
-            odd_sum = sum(int(barcode_without_check[i]) for i in range(0, 12, 2))
-            even_sum = sum(int(barcode_without_check[i]) for i in range(1, 12, 2))
-            total = odd_sum + (even_sum * 3)
-            check_digit = (10 - (total % 10)) % 10
-
-            self.barcode = barcode_without_check + str(check_digit)
+            # EAN-13 из последовательности магазина: 487 + порядковый номер + контрольная сумма
+            from products.barcodes import allocate_barcode
+            self.barcode = allocate_barcode()
 
         super().save(*args, **kwargs)
 
@@ -725,6 +728,13 @@ class ProductBatch(models.Model):
     Это позволяет вести учёт по FIFO/FEFO методам.
     """
 
+    EXPIRY_BUCKET_CHOICES = [
+        ('expired', _('Истёк')),
+        ('week', _('До 7 дней')),
+        ('month', _('До 30 дней')),
+        ('ok', _('В норме')),
+    ]
+
     product = models.ForeignKey(
         Product,
         on_delete=models.CASCADE,
@@ -805,6 +815,15 @@ class ProductBatch(models.Model):
         help_text=_('Партия доступна для продажи')
     )
 
+    # Группа по сроку годности (пересчитывается ежедневно задачей refresh_expiry_buckets)
+    expiry_bucket = models.CharField(
+        max_length=10,
+        choices=EXPIRY_BUCKET_CHOICES,
+        default='ok',
+        verbose_name=_('Срок годности'),
+        help_text=_('Истёк / до 7 дней / до 30 дней / в норме')
+    )
+
     # Метаданные
     received_at = models.DateTimeField(
         auto_now_add=True,
@@ -825,13 +844,79 @@ class ProductBatch(models.Model):
             models.Index(fields=['product', 'is_active']),
             models.Index(fields=['expiry_date']),
             models.Index(fields=['received_at']),
+            # Только проблемные партии с остатком - маленький индекс для дашборда сроков
+            models.Index(
+                fields=['expiry_bucket', 'expiry_date'],
+                condition=models.Q(is_active=True, quantity__gt=0) & ~models.Q(expiry_bucket='ok'),
+                name='products_batch_expiry_risk_idx'
+            ),
+            models.Index(
+                fields=['product', 'expiry_bucket'],
+                condition=models.Q(is_active=True, quantity__gt=0),
+                name='products_batch_prod_bucket_idx'
+            ),
         ]
 
     def __str__(self):
         return f"{self.product.name} - Партия {self.batch_number} ({self.quantity} {self.product.unit.short_name})"
 
+    @staticmethod
+    def get_expiry_bucket(expiry_date, today=None):
+        """Группа срока годности для даты"""
+        if not expiry_date:
+            return 'ok'
+
+        from django.utils import timezone
+        today = today or timezone.localdate()
+        days_left = (expiry_date - today).days
+
+        if days_left < 0:
+            return 'expired'
+        if days_left <= 7:
+            return 'week'
+        if days_left <= 30:
+            return 'month'
+        return 'ok'
+
+    @classmethod
+    def refresh_expiry_buckets(cls, today=None):
+        """
+        Пересчитывает expiry_bucket всех активных партий текущей схемы.
+
+        Четыре UPDATE по диапазонам дат; меняются только строки,
+        у которых группа действительно сменилась.
+
+        Returns:
+            int: количество обновлённых партий
+        """
+        from datetime import timedelta
+        from django.utils import timezone
+
+        today = today or timezone.localdate()
+        week = today + timedelta(days=7)
+        month = today + timedelta(days=30)
+
+        ranges = {
+            'expired': models.Q(expiry_date__lt=today),
+            'week': models.Q(expiry_date__gte=today, expiry_date__lte=week),
+            'month': models.Q(expiry_date__gt=week, expiry_date__lte=month),
+            'ok': models.Q(expiry_date__isnull=True) | models.Q(expiry_date__gt=month),
+        }
+
+        updated = 0
+        active = cls.objects.filter(is_active=True)
+        for bucket, condition in ranges.items():
+            updated += active.filter(condition).exclude(expiry_bucket=bucket).update(expiry_bucket=bucket)
+        return updated
+
     def save(self, *args, **kwargs):
         """Автоматическая генерация штрихкода для партии"""
+        self.expiry_bucket = self.get_expiry_bucket(self.expiry_date)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'expiry_date' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'expiry_bucket'}
+
         if not self.barcode:
             import uuid
             from django.utils import timezone
@@ -848,7 +933,7 @@ class ProductBatch(models.Model):
         """Проверяет истёк ли срок годности"""
         if self.expiry_date:
             from django.utils import timezone
-            return timezone.now().date() > self.expiry_date
+            return timezone.localdate() > self.expiry_date
         return False
 
     @property
@@ -856,7 +941,7 @@ class ProductBatch(models.Model):
         """Количество дней до истечения срока годности"""
         if self.expiry_date:
             from django.utils import timezone
-            delta = self.expiry_date - timezone.now().date()
+            delta = self.expiry_date - timezone.localdate()
             return delta.days
         return None
 
@@ -967,6 +1052,14 @@ class ProductImage(models.Model):
         verbose_name=_('Изображение')
     )
 
+    # Уменьшенные копии изображения (products.images)
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name=_('Варианты изображения'),
+        help_text=_('thumb/list/detail в WebP и JPEG, заполняется фоновой задачей')
+    )
+
     alt_text = models.CharField(
         max_length=200,
         blank=True,
@@ -1348,6 +1441,7 @@ class StockReservation(models.Model):
             models.Index(fields=['order_id']),
             models.Index(fields=['reserved_until']),
             models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['-created_at', '-id']),  # Курсорная пагинация
         ]
 
     def __str__(self):
@@ -1372,18 +1466,22 @@ class StockReservation(models.Model):
         """
         Завершает резервирование (товар продан).
         ВАЖНО: Уменьшает количество товара в партии или общий запас!
+
+        Raises:
+            InsufficientStockError: если в партии меньше товара, чем зарезервировано
         """
+        from django.db import transaction
+        from products.stock import deduct_allocations
+
         if self.status == 'active':
-            # Уменьшаем количество товара
-            if self.batch:
-                # Списываем из конкретной партии
-                self.batch.quantity -= self.quantity
-                if self.batch.quantity < 0:
-                    self.batch.quantity = 0
-                self.batch.save(update_fields=['quantity', 'updated_at'])
-            # Если партия не указана, товар уже должен быть списан из партий
-            # Ничего дополнительно делать не нужно, так как количество хранится в партиях
-
-            # Меняем статус резервирования
-            self.status = 'completed'
-            self.save()
+            with transaction.atomic():
+                # Списываем из конкретной партии условным UPDATE (quantity >= x),
+                # чтобы параллельные продажи не увели остаток в минус
+                if self.batch_id:
+                    deduct_allocations([(self.batch_id, self.quantity)])
+                # Если партия не указана, товар уже должен быть списан из партий
+                # Ничего дополнительно делать не нужно, так как количество хранится в партиях
+
+                # Меняем статус резервирования
+                self.status = 'completed'
+                self.save()
@@ -229,11 +229,18 @@ class CategoryAttributeDetailSerializer(serializers.ModelSerializer):
 class ProductImageSerializer(serializers.ModelSerializer):
     """Сериализатор для изображений товара"""
 
+    # URL уменьшенных копий (thumb/list/detail); None пока фоновая задача не отработала
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
         fields = '__all__'
         read_only_fields = ['id', 'created_at']
 
+    def get_image_variants(self, obj):
+        from products.images import variant_urls
+        return variant_urls(obj.image_variants, obj.image, self.context.get('request'))
+
 
 class ProductPricingSerializer(serializers.ModelSerializer):
     """Сериализатор для цен товара"""
@@ -283,9 +290,11 @@ class ProductBatchSerializer(serializers.ModelSerializer):
 
     product_name = serializers.CharField(source='product.name', read_only=True)
     supplier_info = serializers.CharField(source='supplier.name', read_only=True, allow_null=True)
-    is_expired = serializers.BooleanField(read_only=True)
+    expiry_bucket_display = serializers.CharField(source='get_expiry_bucket_display', read_only=True)
+    # Флаги сроков - по expiry_bucket, как фильтры expired / near_expiry
+    is_expired = serializers.SerializerMethodField()
     days_until_expiry = serializers.IntegerField(read_only=True)
-    is_near_expiry = serializers.BooleanField(read_only=True)
+    is_near_expiry = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductBatch
@@ -294,9 +303,16 @@ class ProductBatchSerializer(serializers.ModelSerializer):
             'purchase_price', 'manufacturing_date', 'expiry_date',
             'supplier', 'supplier_info', 'supplier_name', 'notes', 'is_active',
             'is_expired', 'days_until_expiry', 'is_near_expiry',
+            'expiry_bucket', 'expiry_bucket_display',
             'received_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'barcode', 'received_at', 'updated_at']
+        read_only_fields = ['id', 'barcode', 'expiry_bucket', 'received_at', 'updated_at']
+
+    def get_is_expired(self, obj):
+        return obj.expiry_bucket == 'expired'
+
+    def get_is_near_expiry(self, obj):
+        return obj.expiry_bucket in ('week', 'month')
 
     def validate(self, data):
         """Валидация партии"""
@@ -347,6 +363,10 @@ class ProductListSerializer(serializers.ModelSerializer):
     quantity = serializers.DecimalField(source='inventory.quantity', max_digits=12, decimal_places=3, read_only=True)
     stock_status = serializers.CharField(read_only=True)
 
+    # URL уменьшенных копий главного изображения: {'thumb': {'webp': ..., 'jpeg': ...}, 'list': ..., 'detail': ...}
+    # Пока варианты не готовы - None (клиент использует main_image)
+    main_image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Product
         fields = [
@@ -355,11 +375,15 @@ class ProductListSerializer(serializers.ModelSerializer):
             'unit', 'unit_name',
             'sale_price', 'cost_price', 'margin',
             'quantity', 'stock_status',
-            'main_image', 'is_active', 'is_featured',
+            'main_image', 'main_image_variants', 'is_active', 'is_featured',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_main_image_variants(self, obj):
+        from products.images import variant_urls
+        return variant_urls(obj.image_variants, obj.main_image, self.context.get('request'))
+
 
 class ProductDetailSerializer(serializers.ModelSerializer):
     """Сериализатор для детальной информации о товаре"""
@@ -381,13 +405,14 @@ class ProductDetailSerializer(serializers.ModelSerializer):
     margin = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     profit = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     is_low_stock = serializers.BooleanField(read_only=True)
+    main_image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'slug', 'description', 'category', 'category_name', 'category_path',
             'sku', 'barcode', 'unit', 'unit_name', 'unit_short',
-            'main_image', 'weight', 'volume',
+            'main_image', 'main_image_variants', 'weight', 'volume',
             'is_active', 'is_featured',
             'pricing', 'inventory', 'batches', 'attributes', 'images',
             'stock_status', 'margin', 'profit', 'is_low_stock',
@@ -395,6 +420,10 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_main_image_variants(self, obj):
+        from products.images import variant_urls
+        return variant_urls(obj.image_variants, obj.main_image, self.context.get('request'))
+
 
 class ProductCreateSerializer(serializers.ModelSerializer):
     """
@@ -579,25 +608,6 @@ class ProductCreateSerializer(serializers.ModelSerializer):
 
         data['sku'] = sku
 
-        # ===== АВТОМАТИЧЕСКАЯ ГЕНЕРАЦИЯ BARCODE =====
-        # Формат: EAN-13 совместимый (13 цифр)
-        # Используем текущее время + случайные цифры
-        timestamp_part = timezone.now().strftime('%y%m%d%H%M')  # 10 цифр
-        random_part = str(uuid.uuid4().int)[:3]  # 3 случайные цифры
-        barcode = f"{timestamp_part}{random_part}"  # Итого 13 цифр
-
-        # Гарантируем уникальность barcode
-        counter = 1
-        while Product.objects.filter(barcode=barcode).exists():
-            random_part = str(uuid.uuid4().int)[:3]
-            barcode = f"{timestamp_part}{random_part}"
-            counter += 1
-            if counter > 100:  # Защита от бесконечного цикла
-                barcode = str(uuid.uuid4().int)[:13]
-                break
-
-        data['barcode'] = barcode
-
         # ===== ГЕНЕРАЦИЯ SLUG =====
         base_slug = slugify(data['name'])
         slug = base_slug
@@ -624,6 +634,7 @@ class ProductCreateSerializer(serializers.ModelSerializer):
         - ProductBarcode (если указан)
         """
         from django.db import transaction
+        from products.barcodes import allocate_barcode
         from django.utils import timezone
         import uuid
 
@@ -653,11 +664,12 @@ class ProductCreateSerializer(serializers.ModelSerializer):
         if not batch_data['batch_number']:
             batch_data['batch_number'] = f"BATCH-{uuid.uuid4().hex[:8].upper()}"
 
-        barcode = validated_data.pop('barcode', '')
+        # Штрихкод EAN-13 из последовательности магазина (products.barcodes)
+        barcode = validated_data.pop('barcode', '') or allocate_barcode()
 
         with transaction.atomic():
             # 1. Создаём Product
-            product = Product.objects.create(**validated_data)
+            product = Product.objects.create(barcode=barcode, **validated_data)
 
             # 2. Создаём ProductPricing
             ProductPricing.objects.create(product=product, **pricing_data)
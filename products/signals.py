@@ -0,0 +1,55 @@
+# coding: utf-8
+"""
+Signals для товаров.
+
+После загрузки изображения ставит в очередь генерацию вариантов
+(thumb/list/detail), чтобы каталог и POS не тянули оригинал.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from products.models import Product, ProductImage
+
+logger = logging.getLogger(__name__)
+
+
+def _schedule_image_variants(instance, field_name):
+    """Ставит задачу генерации вариантов после коммита транзакции"""
+    from core.schema_utils import SchemaManager
+    from products.tasks import generate_image_variants
+
+    field_file = getattr(instance, field_name)
+    variants = instance.image_variants or {}
+
+    # Изображение не менялось - варианты уже актуальны
+    if not field_file or variants.get('source') == field_file.name:
+        return
+
+    schema_name = SchemaManager.get_current_schema()
+    model_name = instance._meta.model_name
+    pk = instance.pk
+
+    def enqueue():
+        try:
+            generate_image_variants.apply_async(args=[schema_name, model_name, pk], retry=False)
+        except Exception as e:
+            # Брокер недоступен - товар отдаётся с оригиналом, варианты можно догенерировать позже
+            logger.warning(f"Не удалось поставить обработку изображения {model_name} #{pk}: {e}")
+
+    transaction.on_commit(enqueue)
+
+
+@receiver(post_save, sender=Product)
+def product_image_uploaded(sender, instance, **kwargs):
+    """Главное изображение товара загружено или заменено"""
+    _schedule_image_variants(instance, 'main_image')
+
+
+@receiver(post_save, sender=ProductImage)
+def gallery_image_uploaded(sender, instance, **kwargs):
+    """Дополнительное изображение загружено или заменено"""
+    _schedule_image_variants(instance, 'image')
@@ -0,0 +1,114 @@
+"""
+Списание остатков из партий по FEFO (First Expired, First Out).
+
+Распределение по партиям делает оплата чека (sales.checkout.complete_sale):
+партии товаров чека блокируются в порядке id и делятся в памяти по FEFO.
+Здесь - общее списание и возврат: условный UPDATE (quantity >= x), поэтому
+параллельные кассы не могут продать больше, чем лежит в партии.
+
+Использование (только внутри transaction.atomic):
+    deduct_allocations([Allocation(batch, Decimal('3'))])
+"""
+
+from collections import OrderedDict, namedtuple
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from core.exceptions import InsufficientStockException
+
+
+# Кусок позиции, списываемый из одной партии
+Allocation = namedtuple('Allocation', ['batch', 'quantity'])
+
+
+class InsufficientStockError(InsufficientStockException):
+    """
+    Недостаточно товара в партиях для списания.
+
+    Наследуется от InsufficientStockException, поэтому во view
+    без обработки превращается в ответ 400 (code=insufficient_stock).
+    """
+
+    def __init__(self, product_id=None, requested=None, available=None):
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+
+        if requested is not None and available is not None:
+            message = f'Недостаточно товара на складе. Доступно: {available}, запрошено: {requested}'
+        else:
+            message = None
+        super().__init__(detail=message)
+
+
+def deduct_allocations(allocations):
+    """
+    Списывает количество из партий одним UPDATE.
+
+    UPDATE ... SET quantity = quantity - x WHERE id = ... AND quantity >= x
+    Если хотя бы одна партия не прошла условие - бросаем исключение,
+    вызывающий код откатывает транзакцию целиком.
+
+    Args:
+        allocations: list[Allocation] или список пар (batch_id, quantity)
+    """
+    from products.models import ProductBatch
+
+    totals = OrderedDict()
+    for batch, quantity in allocations:
+        batch_id = getattr(batch, 'pk', batch)
+        totals[batch_id] = totals.get(batch_id, Decimal('0')) + Decimal(str(quantity))
+
+    if not totals:
+        return
+
+    guard = Q()
+    whens = []
+    for batch_id, quantity in totals.items():
+        guard |= Q(pk=batch_id, quantity__gte=quantity)
+        whens.append(When(pk=batch_id, then=F('quantity') - quantity))
+
+    updated = ProductBatch.objects.filter(guard).update(
+        quantity=Case(*whens, output_field=models.DecimalField(max_digits=12, decimal_places=3)),
+        updated_at=timezone.now()
+    )
+
+    if updated != len(totals):
+        # Находим партию, на которой не хватило остатка (только для сообщения об ошибке)
+        short = ProductBatch.objects.filter(pk__in=list(totals)).values('pk', 'product_id', 'quantity')
+        for row in short:
+            if row['quantity'] < totals[row['pk']]:
+                raise InsufficientStockError(row['product_id'], totals[row['pk']], row['quantity'])
+        raise InsufficientStockError()
+
+    # Обновляем объекты в памяти, чтобы вызывающий код видел актуальный остаток
+    for batch, quantity in allocations:
+        if hasattr(batch, 'quantity'):
+            batch.quantity -= Decimal(str(quantity))
+
+
+def return_to_batches(returns):
+    """
+    Возвращает количество в партии одним UPDATE (возврат, отмена продажи).
+
+    Args:
+        returns: список пар (batch или batch_id, quantity)
+    """
+    from products.models import ProductBatch
+
+    totals = OrderedDict()
+    for batch, quantity in returns:
+        batch_id = getattr(batch, 'pk', batch)
+        totals[batch_id] = totals.get(batch_id, Decimal('0')) + Decimal(str(quantity))
+
+    if not totals:
+        return 0
+
+    whens = [When(pk=batch_id, then=F('quantity') + quantity) for batch_id, quantity in totals.items()]
+    return ProductBatch.objects.filter(pk__in=list(totals)).update(
+        quantity=Case(*whens, output_field=models.DecimalField(max_digits=12, decimal_places=3)),
+        updated_at=timezone.now()
+    )
@@ -0,0 +1,92 @@
+"""
+Celery tasks для товаров.
+"""
+
+import logging
+
+from celery import shared_task
+from django.db.models import Q
+
+from core.schema_utils import iter_tenant_schemas, schema_context
+
+logger = logging.getLogger(__name__)
+
+
+# Модель -> поле с изображением
+IMAGE_FIELDS = {
+    'product': 'main_image',
+    'productimage': 'image',
+}
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def generate_image_variants(self, schema_name, model_name, pk):
+    """
+    Генерирует варианты изображения (thumb/list/detail) для товара.
+
+    Запускается после загрузки изображения (products.signals).
+
+    Args:
+        schema_name: схема магазина (tenant_<slug>)
+        model_name: 'product' или 'productimage'
+        pk: ID объекта
+    """
+    from products.images import delete_variants, generate_variants, variant_owner
+    from products.models import Product, ProductImage
+
+    model = {'product': Product, 'productimage': ProductImage}[model_name]
+    field_name = IMAGE_FIELDS[model_name]
+
+    with schema_context(schema_name):
+        obj = model.objects.filter(pk=pk).only('id', field_name, 'image_variants').first()
+        if obj is None:
+            return f"{model_name} #{pk} не найден"
+
+        old_variants = obj.image_variants or {}
+        field_file = getattr(obj, field_name)
+        owner = variant_owner(obj)
+
+        try:
+            variants = generate_variants(field_file, owner)
+        except Exception as e:
+            logger.error(f"Ошибка обработки изображения {model_name} #{pk}: {e}")
+            raise self.retry(exc=e)
+
+        # update() вместо save(), чтобы не вызывать сигнал повторно. Только если
+        # изображение не заменили, пока шла обработка: иначе варианты нового
+        # файла записывает его собственная задача
+        if field_file:
+            same_file = Q(**{field_name: field_file.name})
+        else:
+            same_file = Q(**{f'{field_name}__isnull': True}) | Q(**{field_name: ''})
+        updated = model.objects.filter(same_file, pk=pk).update(image_variants=variants)
+        if not updated:
+            current = model.objects.filter(pk=pk).values_list('image_variants', flat=True).first()
+            delete_variants(variants, owner, keep=current)
+            return f"{model_name} #{pk}: изображение заменено во время обработки"
+
+        # Чистим варианты предыдущего изображения
+        if old_variants:
+            delete_variants(old_variants, owner, keep=variants)
+
+    return f"{model_name} #{pk}: {len(variants) - 1 if variants else 0} вариантов"
+
+
+@shared_task
+def refresh_expiry_buckets():
+    """
+    Пересчитывает группы сроков годности партий во всех магазинах.
+
+    Запускается каждый день в 00:05 (CELERY_BEAT_SCHEDULE).
+    """
+    from products.models import ProductBatch
+
+    results = {}
+    for schema_name in iter_tenant_schemas():
+        try:
+            results[schema_name] = ProductBatch.refresh_expiry_buckets()
+        except Exception as e:
+            logger.error(f"Ошибка пересчёта сроков годности в {schema_name}: {e}")
+            results[schema_name] = str(e)
+
+    return results
@@ -1,3 +1,142 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from products.images import generate_variants, variant_files, variant_urls
+from products.models import Product, ProductBatch, Unit
+from products.serializers import ProductBatchSerializer
+from products.tasks import generate_image_variants
+from products.views import ProductBatchViewSet
+
+
+def png(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (600, 400), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue())
+
+
+class ImageVariantsTests(TestCase):
+    """Варианты изображений товаров (products/images.py, products/tasks.py)"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        unit = Unit.objects.create(name='штука', short_name='шт')
+        self.milk = Product.objects.create(name='Milk', slug='milk', sku='MILK', unit=unit)
+        self.kefir = Product.objects.create(name='Kefir', slug='kefir', sku='KEFIR', unit=unit)
+
+    def upload(self, product, color):
+        product.main_image.save('photo.png', png(color))
+        generate_image_variants('public', 'product', product.pk)
+        product.refresh_from_db()
+
+    def test_replacing_image_keeps_variants_of_product_with_same_image(self):
+        self.upload(self.milk, 'red')
+        self.upload(self.kefir, 'red')
+        kefir_files = variant_files(self.kefir.image_variants)
+        self.assertFalse(kefir_files & variant_files(self.milk.image_variants))
+
+        old_milk_files = variant_files(self.milk.image_variants)
+        self.upload(self.milk, 'blue')
+
+        self.assertTrue(all(default_storage.exists(name) for name in kefir_files))
+        self.assertFalse(any(default_storage.exists(name) for name in old_milk_files))
+
+    def test_stale_variants_are_not_served(self):
+        self.upload(self.milk, 'red')
+        self.assertIsNotNone(variant_urls(self.milk.image_variants, self.milk.main_image))
+
+        # Изображение заменено, задача ещё не отработала
+        self.milk.main_image.save('new.png', png('blue'))
+
+        self.assertIsNone(variant_urls(self.milk.image_variants, self.milk.main_image))
+
+    def test_task_does_not_overwrite_newer_image(self):
+        self.milk.main_image.save('photo.png', png('red'))
+        generated = {}
+
+        def replaced_during_processing(field_file, owner):
+            generated.update(generate_variants(field_file, owner))
+            Product.objects.filter(pk=self.milk.pk).update(main_image='products/newer.png')
+            return generated
+
+        with mock.patch('products.images.generate_variants', replaced_during_processing):
+            generate_image_variants('public', 'product', self.milk.pk)
+
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.image_variants, {})
+        self.assertFalse(any(default_storage.exists(name) for name in variant_files(generated)))
+
+
+def tenant_request(path, params=None):
+    """GET сотрудника магазина в обход TenantByKeyMiddleware (схема уже текущая)"""
+    request = APIRequestFactory().get(path, params)
+    request.tenant = SimpleNamespace(is_active=True)
+    request.employee = SimpleNamespace(id=None)
+    request.schema_name = 'public'
+    force_authenticate(request, user=User(username='owner'))
+    return request
+
+
+class BatchExpiryTests(TestCase):
+    """Фильтры и поля сроков годности партий (products/views.py, products/serializers.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = Unit.objects.create(name='штука', short_name='шт')
+        cls.milk = Product.objects.create(name='Milk', slug='milk', sku='MILK', unit=unit)
+        today = timezone.localdate()
+        cls.batches = {
+            days: ProductBatch.objects.create(
+                product=cls.milk,
+                batch_number=f'B{days}',
+                quantity=Decimal('5'),
+                purchase_price=Decimal('10.00'),
+                expiry_date=today + timedelta(days=days),
+            )
+            for days in (-1, 3, 10, 20, 45, 100)
+        }
+
+    def near_expiry(self, days):
+        request = tenant_request('/api/products/batches/near_expiry/', {'days': days})
+        response = ProductBatchViewSet.as_view({'get': 'near_expiry'})(request)
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        return sorted(row['batch_number'] for row in rows)
+
+    def test_near_expiry_matches_requested_days(self):
+        self.assertEqual(self.near_expiry(7), ['B3'])
+        self.assertEqual(self.near_expiry(14), ['B10', 'B3'])
+        self.assertEqual(self.near_expiry(60), ['B10', 'B20', 'B3', 'B45'])
+
+    def test_expiry_summary_rejects_non_integer_product(self):
+        request = tenant_request('/api/products/batches/expiry_summary/', {'product': 'abc'})
+        response = ProductBatchViewSet.as_view({'get': 'expiry_summary'})(request)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+
+    def test_serializer_keeps_expiry_flags(self):
+        expired = ProductBatchSerializer(self.batches[-1]).data
+        soon = ProductBatchSerializer(self.batches[20]).data
+        later = ProductBatchSerializer(self.batches[100]).data
+
+        self.assertEqual((expired['is_expired'], expired['is_near_expiry']), (True, False))
+        self.assertEqual((soon['is_expired'], soon['is_near_expiry'], soon['days_until_expiry']), (False, True, 20))
+        self.assertEqual((later['is_expired'], later['is_near_expiry']), (False, False))
@@ -23,6 +23,7 @@ from products.serializers import (
     SupplierSerializer, ProductBarcodeSerializer, ProductTagSerializer,
     StockReservationSerializer
 )
+from core.pagination import CursorOrPageNumberPagination
 from core.permissions import IsTenantUser
 
 
@@ -264,7 +265,7 @@ class ProductBatchViewSet(viewsets.ModelViewSet):
     serializer_class = ProductBatchSerializer
     permission_classes = [IsTenantUser]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['product', 'is_active']
+    filterset_fields = ['product', 'is_active', 'expiry_bucket']
     search_fields = ['batch_number', 'supplier_name']
     ordering_fields = ['received_at', 'expiry_date', 'quantity']
     ordering = ['expiry_date', 'received_at']  # FEFO по умолчанию
@@ -272,40 +273,65 @@ class ProductBatchViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = super().get_queryset()
 
-        # Фильтр по истёкшим партиям
+        # Фильтры по срокам - по expiry_bucket (пересчитывается ежедневно)
         expired = self.request.query_params.get('expired')
         if expired is not None:
-            from django.utils import timezone
             if expired.lower() == 'true':
-                queryset = queryset.filter(expiry_date__lt=timezone.now().date())
+                queryset = queryset.filter(expiry_bucket='expired')
             else:
-                queryset = queryset.filter(
-                    models.Q(expiry_date__isnull=True) | models.Q(expiry_date__gte=timezone.now().date())
-                )
+                queryset = queryset.exclude(expiry_bucket='expired')
 
-        # Фильтр по скоро истекающим партиям (по умолчанию 30 дней)
+        # Скоро истекающие партии (по умолчанию 30 дней)
         near_expiry = self.request.query_params.get('near_expiry')
         if near_expiry is not None:
-            from django.utils import timezone
-            from datetime import timedelta
+            queryset = queryset.filter(self._near_expiry_filter())
 
-            days = int(self.request.query_params.get('days', 30))
-            future_date = timezone.now().date() + timedelta(days=days)
+        return queryset
 
-            queryset = queryset.filter(
-                expiry_date__gte=timezone.now().date(),
-                expiry_date__lte=future_date
+    def destroy(self, request, *args, **kwargs):
+        """Удалить партию (партию с продажами или возвратами удалить нельзя - on_delete=PROTECT)"""
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except models.ProtectedError:
+            return Response(
+                {'error': 'Нельзя удалить партию: по ней есть продажи или возвраты. Отключите её (is_active=false)'},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        return queryset
+    def _near_expiry_filter(self):
+        """
+        Партии, истекающие в ближайшие ?days= дней (по умолчанию 30).
+
+        Группы сроков отсекают партии по частичному индексу (expiry_bucket, expiry_date),
+        точную границу задаёт условие по expiry_date.
+        """
+        from datetime import timedelta
+        from django.utils import timezone
+
+        try:
+            days = int(self.request.query_params.get('days', 30))
+        except (TypeError, ValueError):
+            days = 30
+
+        if days <= 7:
+            buckets = ['week']
+        elif days <= 30:
+            buckets = ['week', 'month']
+        else:
+            buckets = ['week', 'month', 'ok']
+
+        today = timezone.localdate()
+        return Q(
+            expiry_bucket__in=buckets,
+            expiry_date__gte=today,
+            expiry_date__lte=today + timedelta(days=days)
+        )
 
     @action(detail=False, methods=['get'])
     def expired(self, request):
         """Получить истёкшие партии"""
-        from django.utils import timezone
-
         batches = self.get_queryset().filter(
-            expiry_date__lt=timezone.now().date(),
+            expiry_bucket='expired',
             is_active=True
         )
 
@@ -319,18 +345,8 @@ class ProductBatchViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def near_expiry(self, request):
-        """Получить партии с истекающим сроком годности"""
-        from django.utils import timezone
-        from datetime import timedelta
-
-        days = int(request.query_params.get('days', 30))
-        future_date = timezone.now().date() + timedelta(days=days)
-
-        batches = self.get_queryset().filter(
-            expiry_date__gte=timezone.now().date(),
-            expiry_date__lte=future_date,
-            is_active=True
-        )
+        """Получить партии с истекающим сроком годности (?days=N, по умолчанию 30)"""
+        batches = self.get_queryset().filter(self._near_expiry_filter(), is_active=True)
 
         page = self.paginate_queryset(batches)
         if page is not None:
@@ -340,6 +356,70 @@ class ProductBatchViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(batches, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def expiry_summary(self, request):
+        """
+        Сводка по срокам годности для дашборда.
+
+        Считается по expiry_bucket (обновляется ежедневно) одним GROUP BY.
+        Стоимость под риском = остаток * закупочная цена партии.
+
+        Query params:
+        - product: ID товара (опционально)
+        """
+        from decimal import Decimal
+        from django.db.models import Count, Sum
+
+        batches = ProductBatch.objects.filter(is_active=True, quantity__gt=0)
+
+        product_id = request.query_params.get('product')
+        if product_id:
+            try:
+                batches = batches.filter(product_id=int(product_id))
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'Некорректный ID товара'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        rows = batches.values('expiry_bucket').annotate(
+            batches_count=Count('id'),
+            products_count=Count('product', distinct=True),
+            total_quantity=Sum('quantity'),
+            value_at_risk=Sum(
+                F('quantity') * F('purchase_price'),
+                output_field=models.DecimalField(max_digits=18, decimal_places=2)
+            ),
+            sale_value=Sum(
+                F('quantity') * F('product__pricing__sale_price'),
+                output_field=models.DecimalField(max_digits=18, decimal_places=2)
+            )
+        ).order_by()
+
+        by_bucket = {row['expiry_bucket']: row for row in rows}
+        buckets = []
+        for bucket, label in ProductBatch.EXPIRY_BUCKET_CHOICES:
+            row = by_bucket.get(bucket, {})
+            buckets.append({
+                'bucket': bucket,
+                'label': str(label),
+                'batches_count': row.get('batches_count', 0),
+                'products_count': row.get('products_count', 0),
+                'quantity': row.get('total_quantity') or Decimal('0'),
+                'value_at_risk': (row.get('value_at_risk') or Decimal('0')).quantize(Decimal('0.01')),
+                'sale_value': (row.get('sale_value') or Decimal('0')).quantize(Decimal('0.01')),
+            })
+
+        return Response({
+            'status': 'success',
+            'data': {
+                'buckets': buckets,
+                'total_value_at_risk': sum(
+                    (b['value_at_risk'] for b in buckets if b['bucket'] != 'ok'), Decimal('0.00')
+                )
+            }
+        })
+
 
 class ProductViewSet(viewsets.ModelViewSet):
     """ViewSet для товаров"""
@@ -354,6 +434,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'description', 'sku', 'barcode']
     ordering_fields = ['name', 'created_at', 'updated_at']
     ordering = ['-created_at']
+    pagination_class = CursorOrPageNumberPagination  # ?pagination=cursor для больших списков
 
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия"""
@@ -606,8 +687,10 @@ class ProductViewSet(viewsets.ModelViewSet):
         Если указан session, товар автоматически добавляется в текущую продажу.
         Возвращает информацию о товаре и обновлённую продажу (если добавлено).
         """
-        from sales.models import CashierSession, Sale, SaleItem
-        from decimal import Decimal
+        from decimal import Decimal, InvalidOperation
+        from sales.models import Sale
+        from sales.pos import ScanError, scan_item
+        from sales.serializers import SaleDetailSerializer
 
         barcode_value = request.query_params.get('barcode')
         session_id = request.query_params.get('session')
@@ -652,70 +735,27 @@ class ProductViewSet(viewsets.ModelViewSet):
                         'message': 'Количество должно быть больше 0',
                         'code': 'invalid_quantity'
                     }, status=status.HTTP_400_BAD_REQUEST)
-
-                session = CashierSession.objects.get(id=session_id, status='open')
-            except CashierSession.DoesNotExist:
-                return Response({
-                    'status': 'error',
-                    'message': 'Смена не найдена или закрыта',
-                    'code': 'session_not_found'
-                }, status=status.HTTP_404_NOT_FOUND)
-            except (ValueError, TypeError):
+            except (ValueError, TypeError, InvalidOperation):
                 return Response({
                     'status': 'error',
                     'message': 'Некорректное значение количества',
                     'code': 'invalid_quantity'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            batch = None
-            if batch_id:
-                from products.models import ProductBatch
-                try:
-                    batch = ProductBatch.objects.get(id=batch_id, product=product)
-                except ProductBatch.DoesNotExist:
-                    return Response({
-                        'status': 'error',
-                        'message': 'Партия не найдена',
-                        'code': 'batch_not_found'
-                    }, status=status.HTTP_404_NOT_FOUND)
-
-            # Ищем текущую незавершённую продажу этой смены
-            sale = Sale.objects.filter(
-                session=session,
-                status='pending'
-            ).order_by('-created_at').first()
-
-            # Если нет незавершённой продажи - создаём новую
-            if not sale:
-                # Генерируем номер чека
-                from django.utils import timezone
-                receipt_number = f"CHECK-{timezone.now().strftime('%Y%m%d%H%M%S')}"
-
-                sale = Sale.objects.create(
-                    session=session,
-                    receipt_number=receipt_number,
-                    status='pending'
-                )
-
-            # Получаем цену товара из pricing
-            unit_price = Decimal('0.00')
-            if hasattr(product, 'pricing') and product.pricing:
-                unit_price = product.pricing.sale_price or product.pricing.cost_price or Decimal('0.00')
-
-            # Добавляем позицию
-            sale_item = SaleItem.objects.create(
-                sale=sale,
-                product=product,
-                batch=batch,
-                quantity=quantity,
-                unit_price=unit_price
-            )
-
-            # Пересчитываем суммы
-            sale.calculate_totals()
-
-            # Импортируем сериализатор продажи
-            from sales.serializers import SaleDetailSerializer
+            # Тот же конвейер, что и у /api/sales/sales/scan_item/
+            try:
+                result = scan_item(session_id, product.id, quantity, batch_id=batch_id or None)
+            except ScanError as e:
+                error = {'status': 'error', 'message': e.message, 'code': e.code}
+                if e.data is not None:
+                    error['data'] = e.data
+                return Response(error, status=e.status_code)
+
+            sale = Sale.objects.select_related(
+                'session__cash_register', 'session__cashier', 'cashier', 'customer'
+            ).prefetch_related(
+                'items__product', 'items__batch', 'payments'
+            ).get(pk=result.sale.pk)
             response_data['sale'] = SaleDetailSerializer(sale).data
             response_data['message'] = 'Товар добавлен в продажу'
 
@@ -916,6 +956,7 @@ class StockReservationViewSet(viewsets.ModelViewSet):
     search_fields = ['order_reference', 'product__name', 'notes']
     ordering_fields = ['created_at', 'reserved_until']
     ordering = ['-created_at']
+    pagination_class = CursorOrPageNumberPagination  # ?pagination=cursor для больших списков
 
     @action(detail=True, methods=['post'])
     def release(self, request, pk=None):
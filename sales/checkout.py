@@ -0,0 +1,318 @@
+"""
+Оплата и завершение продажи одной транзакцией.
+
+Количество запросов не зависит от размера чека:
+
+1. SELECT ... FOR UPDATE строки продажи (параллельная оплата или
+   сканирование того же чека ждут здесь)
+2. SELECT позиций чека
+3. SELECT ... FOR UPDATE всех партий товаров чека, в порядке id -
+   кассы, продающие одни и те же товары, блокируют партии в одном
+   порядке и не попадают в deadlock
+4. UPDATE партий одним запросом с условием quantity >= x
+   (products.stock.deduct_allocations)
+5. UPDATE позиций (партия и количество) и INSERT позиций, на которые
+   разбилась позиция при списании из нескольких партий (только если нужно)
+6. INSERT платежей (bulk_create)
+7. UPDATE счётчиков смены (CashierSession.record_sales)
+8. UPDATE статуса продажи
+9. UPSERT сводки кассира за день (sales.stats.record_cashier_sales)
+10. UPSERT дневного отчёта аналитики (analytics.daily_report.record_daily_report)
+
+После коммита - событие sale.completed в живую ленту дашбордов (sales.live).
+
+StockReservation при оплате не создаются: проданная партия и количество
+хранятся в позициях чека (SaleItem.batch, SaleItem.quantity).
+
+Любая ошибка (не хватает товара, продажа уже оплачена) откатывает всё:
+партии, позиции и платежи остаются как были.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from analytics.daily_report import record_daily_report, sale_delta
+from sales.live import publish_sale_completed
+from sales.models import CashierSession, Payment, Sale, SaleItem, round_money
+from sales.stats import record_cashier_sales, sale_stats_row
+
+
+class CheckoutError(Exception):
+    """Ошибка оплаты, которую view отдаёт клиенту как есть"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def build_payments(sale, payments_data):
+    """
+    Проверяет платежи и собирает объекты Payment (без записи в БД).
+
+    Сдача для наличных считается здесь, потому что bulk_create
+    не вызывает Payment.save().
+
+    Returns:
+        tuple: (list[Payment], Decimal сумма платежей)
+
+    Raises:
+        CheckoutError: некорректные платежи
+    """
+    if not payments_data:
+        raise CheckoutError('Укажите способ оплаты')
+
+    total_paid = Decimal('0.00')
+    payments = []
+    for payment_data in payments_data:
+        payment_method = payment_data.get('payment_method')
+        if payment_method not in dict(Payment.PAYMENT_METHOD_CHOICES):
+            raise CheckoutError(f'Неизвестный способ оплаты: {payment_method}')
+        amount = Decimal(str(payment_data.get('amount', 0)))
+        received_amount = payment_data.get('received_amount')
+
+        if received_amount:
+            received_amount = Decimal(str(received_amount))
+
+        # Валидация для наличных
+        change_amount = Decimal('0.00')
+        if payment_method == 'cash' and received_amount:
+            if received_amount < amount:
+                raise CheckoutError('Полученная сумма не может быть меньше суммы платежа')
+            change_amount = received_amount - amount
+
+        payments.append(Payment(
+            sale=sale,
+            session_id=sale.session_id,
+            payment_method=payment_method,
+            amount=amount,
+            received_amount=received_amount,
+            change_amount=change_amount,
+            card_last4=payment_data.get('card_last4'),
+            transaction_id=payment_data.get('transaction_id'),
+            notes=payment_data.get('notes', '')
+        ))
+        total_paid += amount
+
+    return payments, total_paid
+
+
+def _fefo_key(batch):
+    # FEFO; партии без срока годности - последними
+    return (batch.expiry_date is None, batch.expiry_date, batch.received_at, batch.pk)
+
+
+def _lock_batches(product_ids):
+    """Блокирует партии товаров в порядке id и группирует их по товару в порядке FEFO"""
+    from products.models import ProductBatch
+
+    batches = ProductBatch.objects.select_for_update().filter(
+        product_id__in=product_ids,
+        is_active=True,
+        quantity__gt=0
+    ).only('id', 'product_id', 'quantity', 'expiry_date', 'received_at').order_by('id')
+
+    by_product = defaultdict(list)
+    for batch in batches:
+        by_product[batch.product_id].append(batch)
+    for product_batches in by_product.values():
+        product_batches.sort(key=_fefo_key)
+    return by_product
+
+
+def _allocate_items(items):
+    """
+    Распределяет позиции по партиям в памяти (партии уже заблокированы).
+
+    Сначала позиции с явно выбранной партией, затем остальные по FEFO.
+
+    Returns:
+        list[tuple[SaleItem, list[Allocation]]]
+
+    Raises:
+        InsufficientStockError: если какой-то позиции не хватает остатка
+    """
+    from products.stock import Allocation, InsufficientStockError
+
+    tracked = [item for item in items if _tracks_stock(item)]
+    by_product = _lock_batches({item.product_id for item in tracked})
+    remaining = {
+        batch.pk: batch.quantity
+        for product_batches in by_product.values()
+        for batch in product_batches
+    }
+
+    result = []
+    for item in sorted(tracked, key=lambda item: (item.batch_id is None, item.product_id, item.pk)):
+        candidates = by_product.get(item.product_id, [])
+        if item.batch_id:
+            candidates = [batch for batch in candidates if batch.pk == item.batch_id]
+
+        allocations = []
+        need = item.quantity
+        for batch in candidates:
+            take = min(remaining[batch.pk], need)
+            if take <= 0:
+                continue
+            allocations.append(Allocation(batch, take))
+            remaining[batch.pk] -= take
+            need -= take
+            if need <= 0:
+                break
+
+        if need > 0:
+            raise InsufficientStockError(item.product_id, item.quantity, item.quantity - need)
+        result.append((item, allocations))
+
+    return result
+
+
+def _tracks_stock(item):
+    inventory = getattr(item.product, 'inventory', None)
+    return inventory is None or inventory.track_inventory
+
+
+def complete_sale(sale, payments=None, cashier_id=None, customer_id=None):
+    """
+    Списать товар по всем позициям, записать платежи и завершить продажу.
+
+    Вызывается внутри transaction.atomic с уже заблокированной строкой продажи
+    (см. checkout_sale и Sale.complete_sale).
+
+    Raises:
+        CheckoutError: в продаже нет позиций
+        InsufficientStockError: не хватает товара
+    """
+    from products.stock import deduct_allocations
+
+    items = list(
+        SaleItem.objects.filter(sale_id=sale.pk)
+        .select_related('product__inventory')
+        .order_by('product_id', 'id')
+    )
+    if not items:
+        raise CheckoutError('Нельзя завершить продажу без товаров')
+    total_quantity = sum(item.quantity for item in items)
+
+    allocated = _allocate_items(items)
+
+    # Одно списание по всем партиям чека
+    deduct_allocations([
+        allocation
+        for _, allocations in allocated
+        for allocation in allocations
+    ])
+
+    # Движение товара фиксируется самими позициями (партия + количество),
+    # без StockReservation: резерв, который сразу же завершается, никто не читает.
+    # Позиция остаётся на первой партии (вместе со скидкой),
+    # для остальных партий - новые позиции с той же ценой
+    changed = []
+    split = []
+    for item, allocations in allocated:
+        first, rest = allocations[0], allocations[1:]
+        if item.batch_id == first.batch.pk and item.quantity == first.quantity:
+            continue
+        item.batch = first.batch
+        item.quantity = first.quantity
+        item.line_total = round_money(item.quantity * item.unit_price - item.discount_amount)
+        changed.append(item)
+
+        for allocation in rest:
+            extra = SaleItem(
+                sale_id=sale.pk,
+                product_id=item.product_id,
+                batch=allocation.batch,
+                quantity=allocation.quantity,
+                unit_price=item.unit_price,
+                tax_rate=item.tax_rate
+            )
+            extra.line_total = round_money(extra.quantity * extra.unit_price)
+            split.append(extra)
+
+    if changed:
+        SaleItem.objects.bulk_update(changed, ['batch', 'quantity', 'line_total'])
+    if split:
+        SaleItem.objects.bulk_create(split)
+
+    if payments:
+        Payment.objects.bulk_create(payments)
+
+    # Счётчики смены для отчётов: платежи уже записаны заранее, если их не передали
+    if payments is None:
+        payment_totals = dict(
+            Payment.objects.filter(sale_id=sale.pk)
+            .values('payment_method')
+            .annotate(total=Sum('amount'))
+            .values_list('payment_method', 'total')
+        )
+    else:
+        payment_totals = defaultdict(Decimal)
+        for payment in payments:
+            payment_totals[payment.payment_method] += payment.amount
+    CashierSession.record_sales(
+        sale.session_id,
+        count=1,
+        amount=sale.total_amount,
+        quantity=total_quantity,
+        payments=payment_totals
+    )
+
+    # save() а не update(): на завершение продажи подписана аналитика (post_save)
+    update_fields = ['status', 'completed_at']
+    if cashier_id and not sale.cashier_id:
+        sale.cashier_id = cashier_id
+        update_fields.append('cashier')
+    if customer_id and not sale.customer_id:
+        sale.customer_id = customer_id
+        update_fields.append('customer')
+    sale.status = 'completed'
+    sale.completed_at = timezone.now()
+    # Дневной отчёт обновляется ниже приращением - сигналу не нужно его пересобирать
+    sale._daily_report_recorded = True
+    sale.save(update_fields=update_fields)
+
+    # Сводка для рейтинга кассиров (после того как кассир продажи известен)
+    record_cashier_sales([sale_stats_row(sale, payment_totals)])
+    record_daily_report([sale_delta(sale, payment_totals, total_quantity, {item.product_id for item in items})])
+    publish_sale_completed(sale, payment_totals)
+    return sale
+
+
+def checkout_sale(sale_id, payments_data, cashier_id=None, customer_id=None):
+    """
+    Оплатить и завершить продажу.
+
+    Args:
+        sale_id: ID продажи
+        payments_data: [{"payment_method": "cash", "amount": 150000, "received_amount": 200000}]
+        cashier_id: ID кассира (если не был указан при сканировании)
+        customer_id: ID клиента (если не был указан)
+
+    Returns:
+        Sale
+
+    Raises:
+        CheckoutError: продажа не pending, нет позиций, платежи некорректны
+        InsufficientStockError: не хватает товара (ничего не списано)
+    """
+    with transaction.atomic():
+        sale = Sale.objects.select_for_update().filter(pk=sale_id).first()
+        if sale is None:
+            raise CheckoutError('Продажа не найдена', status_code=404)
+        if sale.status != 'pending':
+            raise CheckoutError('Можно завершить только незавершённую продажу')
+
+        payments, total_paid = build_payments(sale, payments_data)
+
+        # Проверяем что оплачено достаточно
+        if total_paid < sale.total_amount:
+            raise CheckoutError(
+                f'Недостаточно оплачено. Нужно: {sale.total_amount}, Оплачено: {total_paid}'
+            )
+
+        return complete_sale(sale, payments, cashier_id=cashier_id, customer_id=customer_id)
@@ -0,0 +1,286 @@
+"""
+Черновик чека в кеше (Redis) вместо pending продажи в БД.
+
+Режим для касс, которые не хотят писать в БД на каждое сканирование:
+позиции копятся в кеше по ключу магазина и смены, цена и остаток товара
+берутся из короткоживущей подсказки (product_hint), тоже из кеша.
+В БД чек попадает только при оплате - одной транзакцией через
+sales.offline.upload_sales (тот же путь, что и офлайн чеки): там же
+окончательная проверка остатка под блокировкой партий.
+
+Повторная оплата того же черновика (например, касса не получила ответ)
+не создаёт вторую продажу: у черновика есть client_uuid.
+
+Одна смена - одна касса, поэтому черновик меняет только она
+(без блокировок между запросами).
+"""
+
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from sales.models import CashierSession, round_money
+from sales.pos import UNTRACKED_AVAILABLE, ScanError
+
+# Как SaleItem.quantity в API
+QUANTITY_PLACES = Decimal('0.001')
+
+
+def _id(value, field):
+    """ID из запроса; некорректное значение - ошибка 400, а не 500"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ScanError(f'Некорректный {field}: {value}', code='invalid')
+
+
+def _cart_key(schema_name, session_id):
+    return f'pos:draft:{schema_name}:{session_id}'
+
+
+def _hint_key(schema_name, product_id):
+    return f'pos:product:{schema_name}:{product_id}'
+
+
+def product_hint(schema_name, product_id):
+    """
+    Цена и остаток товара для сканирования (из кеша или одним запросом).
+
+    Остаток - подсказка: за время жизни кеша его могли продать,
+    точная проверка выполняется при оплате.
+
+    Returns:
+        dict или None, если товара нет
+    """
+    from products.models import Product
+
+    key = _hint_key(schema_name, product_id)
+    hint = cache.get(key)
+    if hint is not None:
+        return hint
+
+    product = (
+        Product.objects.select_related('pricing', 'inventory')
+        .annotate(available=Sum('batches__quantity', filter=Q(batches__is_active=True)))
+        .filter(pk=product_id)
+        .first()
+    )
+    if product is None:
+        return None
+
+    pricing = getattr(product, 'pricing', None)
+    inventory = getattr(product, 'inventory', None)
+    if inventory is None:
+        available = Decimal('0')
+    elif not inventory.track_inventory:
+        available = UNTRACKED_AVAILABLE
+    else:
+        available = product.available or Decimal('0')
+
+    hint = {
+        'id': product.pk,
+        'name': product.name,
+        'sku': product.sku,
+        'price': (pricing.sale_price or pricing.cost_price) if pricing else Decimal('0.00'),
+        'available': available,
+    }
+    cache.set(key, hint, settings.POS_PRODUCT_HINT_TTL)
+    return hint
+
+
+class DraftCart:
+    """Черновик чека: позиции с ценой на момент сканирования"""
+
+    def __init__(self, session_id, client_uuid=None, cashier_id=None, lines=None, created_at=None):
+        self.session_id = session_id
+        self.client_uuid = client_uuid or str(uuid.uuid4())
+        self.cashier_id = cashier_id
+        self.lines = lines or []
+        self.created_at = created_at or timezone.now().isoformat()
+
+    @classmethod
+    def load(cls, schema_name, session_id):
+        data = cache.get(_cart_key(schema_name, session_id))
+        return cls(**data) if data else None
+
+    def save(self, schema_name):
+        cache.set(_cart_key(schema_name, self.session_id), {
+            'session_id': self.session_id,
+            'client_uuid': self.client_uuid,
+            'cashier_id': self.cashier_id,
+            'lines': self.lines,
+            'created_at': self.created_at,
+        }, settings.POS_DRAFT_CART_TTL)
+
+    def find_line(self, product_id, batch_id=None):
+        for line in self.lines:
+            if line['product_id'] == product_id and line['batch_id'] == batch_id:
+                return line
+        return None
+
+    def quantity_of(self, product_id):
+        return sum((line['quantity'] for line in self.lines if line['product_id'] == product_id), Decimal('0'))
+
+    def data(self):
+        """Черновик с итогами для ответа API"""
+        items = []
+        subtotal = Decimal('0.00')
+        total_quantity = Decimal('0')
+        for line in self.lines:
+            line_total = round_money(line['quantity'] * line['unit_price'])
+            subtotal += line_total
+            total_quantity += line['quantity']
+            items.append({
+                'product': line['product_id'],
+                'product_name': line['product_name'],
+                'product_sku': line['product_sku'],
+                'batch': line['batch_id'],
+                'quantity': str(line['quantity'].quantize(QUANTITY_PLACES)),
+                'unit_price': str(round_money(line['unit_price'])),
+                'line_total': str(line_total),
+            })
+        return {
+            'session': self.session_id,
+            'client_uuid': self.client_uuid,
+            'cashier': self.cashier_id,
+            'status': 'draft',
+            'subtotal': str(subtotal),
+            'total_amount': str(subtotal),
+            'items_count': len(items),
+            'total_quantity': str(total_quantity.quantize(QUANTITY_PLACES)),
+            'items': items,
+            'created_at': self.created_at,
+        }
+
+
+def get_cart(schema_name, session_id):
+    """Текущий черновик смены или None"""
+    return DraftCart.load(schema_name, _id(session_id, 'ID смены'))
+
+
+def scan(schema_name, session_id, product_id, quantity=Decimal('1'), batch_id=None, cashier_id=None):
+    """
+    Добавить товар в черновик смены (без записи в БД).
+
+    Raises:
+        ScanError: некорректные ID, смена закрыта, товар не найден, не хватает остатка (по подсказке)
+    """
+    session_id = _id(session_id, 'ID смены')
+    product_id = _id(product_id, 'product')
+    batch_id = _id(batch_id, 'batch') if batch_id else None
+
+    cart = DraftCart.load(schema_name, session_id)
+    if cart is None:
+        # Смена проверяется один раз, при открытии черновика
+        if not CashierSession.objects.filter(pk=session_id, status='open').exists():
+            raise ScanError('Смена не найдена или закрыта', code='session_not_found', status_code=404)
+        cart = DraftCart(session_id, cashier_id=cashier_id)
+
+    hint = product_hint(schema_name, product_id)
+    if hint is None:
+        raise ScanError('Товар не найден', code='product_not_found', status_code=404)
+
+    current_qty_in_sale = cart.quantity_of(product_id)
+    total_requested = current_qty_in_sale + quantity
+    if total_requested > hint['available']:
+        raise ScanError(
+            f'Недостаточно товара на складе. Доступно: {hint["available"]}, запрошено: {total_requested}',
+            code='insufficient_stock',
+            data={
+                'available': str(hint['available']),
+                'requested': str(total_requested),
+                'current_in_sale': str(current_qty_in_sale),
+            },
+        )
+
+    line = cart.find_line(product_id, batch_id)
+    if line:
+        line['quantity'] += quantity
+    else:
+        cart.lines.append({
+            'product_id': product_id,
+            'batch_id': batch_id,
+            'product_name': hint['name'],
+            'product_sku': hint['sku'],
+            'quantity': quantity,
+            'unit_price': hint['price'],
+        })
+    if cashier_id and not cart.cashier_id:
+        cart.cashier_id = cashier_id
+
+    cart.save(schema_name)
+    return cart
+
+
+def remove(schema_name, session_id, product_id, batch_id=None, quantity=None):
+    """
+    Убрать товар из черновика (целиком или quantity штук).
+
+    Raises:
+        ScanError: некорректные ID, черновика или позиции нет
+    """
+    product_id = _id(product_id, 'product')
+    batch_id = _id(batch_id, 'batch') if batch_id else None
+    cart = DraftCart.load(schema_name, _id(session_id, 'ID смены'))
+    line = cart and cart.find_line(product_id, batch_id)
+    if not line:
+        raise ScanError('Товар не найден в чеке', code='item_not_found', status_code=404)
+
+    if quantity is None or quantity >= line['quantity']:
+        cart.lines.remove(line)
+    else:
+        line['quantity'] -= quantity
+
+    cart.save(schema_name)
+    return cart
+
+
+def clear(schema_name, session_id):
+    """Отменить черновик"""
+    cache.delete(_cart_key(schema_name, _id(session_id, 'ID смены')))
+
+
+def checkout(schema_name, session_id, payments_data, cashier_id=None, customer_id=None):
+    """
+    Записать черновик в БД одной транзакцией и удалить его из кеша.
+
+    Returns:
+        int: ID созданной (или уже созданной ранее) продажи
+
+    Raises:
+        ScanError: черновик пуст, смена закрыта, не хватает товара или оплаты
+    """
+    from sales.offline import upload_sales
+
+    cart = DraftCart.load(schema_name, _id(session_id, 'ID смены'))
+    if cart is None or not cart.lines:
+        raise ScanError('Нельзя завершить продажу без товаров', code='empty_cart')
+    if not CashierSession.objects.filter(pk=cart.session_id, status='open').exists():
+        raise ScanError('Смена не найдена или закрыта', code='session_not_found', status_code=404)
+
+    result = upload_sales(cart.session_id, [{
+        'client_uuid': cart.client_uuid,
+        'customer_id': customer_id,
+        'payments': payments_data,
+        'items': [
+            {
+                'product_id': line['product_id'],
+                'batch_id': line['batch_id'],
+                'quantity': line['quantity'],
+                'unit_price': line['unit_price'],
+            }
+            for line in cart.lines
+        ],
+    }], cashier_id=cashier_id or cart.cashier_id)['results'][0]
+
+    if result['status'] == 'rejected':
+        raise ScanError(result['message'], code=result['code'])
+
+    # Остаток изменился - подсказки по проданным товарам больше не точны
+    cache.delete_many([_hint_key(schema_name, line['product_id']) for line in cart.lines])
+    clear(schema_name, cart.session_id)
+    return result['sale_id']
@@ -0,0 +1,185 @@
+"""
+Потоковая выгрузка продаж, позиций и платежей в CSV и JSON Lines.
+
+Строки читаются через values_list().iterator(chunk_size=...) - на PostgreSQL
+это серверный курсор, в памяти держится только текущая пачка. Поэтому
+выгрузка за любой период занимает постоянную память и не создаёт
+сериализаторы на каждую продажу, как постраничное чтение SaleViewSet.
+
+Используется эндпоинтом GET /api/sales/sales/export/ (StreamingHttpResponse)
+и командой export_sales.
+"""
+
+import csv
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from core.schema_utils import schema_context
+from sales.models import Payment, Sale, SaleItem
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Строк в одном куске ответа (меньше - больше мелких записей в сокет)
+ROWS_PER_WRITE = 500
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Набор данных: модель, поле даты продажи и колонки (заголовок, lookup)
+EXPORT_DATASETS = {
+    'sales': (Sale, 'created_at', 'status', (
+        ('id', 'id'),
+        ('receipt_number', 'receipt_number'),
+        ('status', 'status'),
+        ('created_at', 'created_at'),
+        ('completed_at', 'completed_at'),
+        ('session_id', 'session_id'),
+        ('cash_register', 'session__cash_register__name'),
+        ('cashier_id', 'cashier_id'),
+        ('customer_id', 'customer_id'),
+        ('customer_name', 'customer_name'),
+        ('customer_phone', 'customer_phone'),
+        ('subtotal', 'subtotal'),
+        ('discount_amount', 'discount_amount'),
+        ('tax_amount', 'tax_amount'),
+        ('total_amount', 'total_amount'),
+    )),
+    'items': (SaleItem, 'sale__created_at', 'sale__status', (
+        ('id', 'id'),
+        ('sale_id', 'sale_id'),
+        ('receipt_number', 'sale__receipt_number'),
+        ('sale_created_at', 'sale__created_at'),
+        ('product_id', 'product_id'),
+        ('product_name', 'product__name'),
+        ('product_sku', 'product__sku'),
+        ('batch_id', 'batch_id'),
+        ('batch_number', 'batch__batch_number'),
+        ('quantity', 'quantity'),
+        ('unit_price', 'unit_price'),
+        ('discount_amount', 'discount_amount'),
+        ('tax_rate', 'tax_rate'),
+        ('line_total', 'line_total'),
+    )),
+    'payments': (Payment, 'sale__created_at', 'sale__status', (
+        ('id', 'id'),
+        ('sale_id', 'sale_id'),
+        ('receipt_number', 'sale__receipt_number'),
+        ('session_id', 'session_id'),
+        ('payment_method', 'payment_method'),
+        ('amount', 'amount'),
+        ('received_amount', 'received_amount'),
+        ('change_amount', 'change_amount'),
+        ('card_last4', 'card_last4'),
+        ('transaction_id', 'transaction_id'),
+        ('created_at', 'created_at'),
+    )),
+}
+
+
+class ExportError(Exception):
+    """Неверные параметры выгрузки"""
+
+
+def parse_date_bound(value, end=False):
+    """
+    Граница периода из YYYY-MM-DD или YYYY-MM-DDTHH:MM:SS.
+
+    Для даты без времени end=True даёт конец дня.
+    """
+    if not value:
+        return None
+    text = value
+    if 'T' not in text:
+        text = f"{text}T23:59:59.999999" if end else f"{text}T00:00:00"
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        raise ExportError(f'Неверная дата: {value}')
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+def export_queryset(dataset, date_from=None, date_to=None, statuses=None, session_id=None):
+    """
+    values_list() набора данных с фильтрами по дате продажи, статусу и смене.
+
+    Returns:
+        (заголовки, queryset)
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise ExportError(f'Неизвестный набор данных: {dataset}. Доступно: {", ".join(EXPORT_DATASETS)}')
+    model, date_field, status_field, columns = EXPORT_DATASETS[dataset]
+
+    filters = {}
+    if date_from:
+        filters[f'{date_field}__gte'] = date_from
+    if date_to:
+        filters[f'{date_field}__lte'] = date_to
+    if statuses:
+        filters[f'{status_field}__in'] = statuses
+    if session_id:
+        filters['session_id' if model is not SaleItem else 'sale__session_id'] = session_id
+
+    queryset = model.objects.filter(**filters).order_by('id').values_list(*(lookup for _, lookup in columns))
+    return [header for header, _ in columns], queryset
+
+
+class _LineBuffer:
+    """Файлоподобный объект для csv.writer: копит строки до выдачи куска"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, value):
+        self.parts.append(value)
+
+    def flush(self):
+        data = ''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def iter_export(headers, queryset, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Куски текста выгрузки (по ROWS_PER_WRITE строк)"""
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f'Неизвестный формат: {export_format}. Доступно: {", ".join(EXPORT_FORMATS)}')
+
+    buffer = _LineBuffer()
+    if export_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(headers)
+        write = writer.writerow
+    else:
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+        def write(row):
+            buffer.write(encoder.encode(dict(zip(headers, row))) + '\n')
+
+    pending = 0
+    for row in queryset.iterator(chunk_size=chunk_size):
+        write(row)
+        pending += 1
+        if pending >= ROWS_PER_WRITE:
+            yield buffer.flush()
+            pending = 0
+
+    tail = buffer.flush()
+    if tail:
+        yield tail
+
+
+def stream_export(schema_name, headers, queryset, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    iter_export для StreamingHttpResponse.
+
+    Ответ читается уже после того, как TenantByKeyMiddleware вернул search_path
+    в public, поэтому генератор сам переключает схему. Транзакция нужна
+    серверному курсору PostgreSQL: вне её Django создаёт курсор WITH HOLD,
+    который сервер материализует целиком.
+    """
+    with schema_context(schema_name), transaction.atomic():
+        yield from iter_export(headers, queryset, export_format, chunk_size)
@@ -0,0 +1,185 @@
+"""
+Живая лента продаж для дашбордов владельца (Server-Sent Events).
+
+Вместо опроса today / current каждые несколько секунд дашборд один раз
+открывает GET /api/sales/sales/live/ и получает события:
+
+- totals          - итоги дня сразу после подключения
+- sale.completed  - оплаченный чек
+- sale.refunded   - возврат (весь чек или часть)
+- sales.uploaded  - пачка офлайн чеков
+
+Каждое событие (кроме totals) несёт и новые итоги дня (sales.stats.day_totals),
+поэтому дашборду не нужно ничего пересчитывать.
+
+События публикуются в Redis канал магазина (sales-live:<schema>) после
+коммита транзакции оплаты. Если канал никто не слушает (PUBSUB NUMSUB = 0),
+итоги не считаются и ничего не публикуется - касса платит одним
+запросом в Redis. Ошибки Redis только пишутся в лог, оплату не ломают.
+
+Поток читается асинхронным генератором (redis.asyncio) и не держит поток
+воркера, поэтому работает только под ASGI (uvicorn / daphne): под WSGI
+Django читает асинхронный ответ целиком и поток никогда не отдастся.
+"""
+
+import json
+import logging
+import time
+
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from rest_framework.renderers import BaseRenderer
+
+from core.schema_utils import SchemaManager
+
+logger = logging.getLogger(__name__)
+
+LIVE_CHANNEL_PREFIX = 'sales-live'
+
+# Сколько клиенту ждать перед переподключением (мс)
+RETRY_MS = 3000
+
+_client = None
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Пропускает Accept: text/event-stream через согласование формата DRF.
+
+    Сам поток отдаётся StreamingHttpResponse, рендерер нужен только
+    для ответов-ошибок (401, 403), их тело - JSON.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+
+
+def live_channel(schema_name):
+    return f'{LIVE_CHANNEL_PREFIX}:{schema_name}'
+
+
+def _redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.SALES_LIVE_REDIS_URL,
+            socket_connect_timeout=1,
+            socket_timeout=1,
+        )
+    return _client
+
+
+def format_event(event, data):
+    """Одно событие в формате text/event-stream"""
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)}\n\n'
+
+
+def publish_live_event(event, build_payload):
+    """
+    Опубликовать событие после коммита текущей транзакции.
+
+    Args:
+        event: тип события (sale.completed, sale.refunded, sales.uploaded)
+        build_payload: функция без аргументов -> dict; вызывается только
+                       если ленту магазина кто-то слушает
+    """
+    if not settings.SALES_LIVE_ENABLED:
+        return
+    transaction.on_commit(lambda: _publish(event, build_payload))
+
+
+def _publish(event, build_payload):
+    from sales.stats import day_totals
+
+    channel = live_channel(SchemaManager.get_current_schema())
+    try:
+        client = _redis()
+        if not client.pubsub_numsub(channel)[0][1]:
+            return
+        payload = build_payload()
+        payload['totals'] = day_totals()
+        client.publish(channel, json.dumps({'event': event, 'data': payload}, cls=DjangoJSONEncoder))
+    except redis.RedisError as e:
+        logger.warning(f"Не удалось опубликовать {event} в {channel}: {e}")
+
+
+def publish_sale_completed(sale, payment_totals):
+    publish_live_event('sale.completed', lambda: {
+        'sale': {
+            'id': sale.pk,
+            'receipt_number': sale.receipt_number,
+            'session': sale.session_id,
+            'cashier': sale.cashier_id,
+            'customer': sale.customer_id,
+            'total_amount': str(sale.total_amount),
+            'payments': {method: str(amount) for method, amount in payment_totals.items()},
+            'completed_at': sale.completed_at,
+        },
+    })
+
+
+def publish_sale_refunded(sale, refund, payment_totals, fully_refunded):
+    publish_live_event('sale.refunded', lambda: {
+        'refund': {
+            'id': refund.pk,
+            'sale': sale.pk,
+            'receipt_number': sale.receipt_number,
+            'session': sale.session_id,
+            'cashier': refund.cashier_id,
+            'total_amount': str(refund.total_amount),
+            'payments': {method: str(amount) for method, amount in payment_totals.items()},
+            'fully_refunded': fully_refunded,
+            'created_at': refund.created_at,
+        },
+    })
+
+
+def publish_sales_uploaded(session_id, sales):
+    publish_live_event('sales.uploaded', lambda: {
+        'session': session_id,
+        'count': len(sales),
+        'amount': str(sum(sale.total_amount for sale in sales)),
+        'sales': [sale.pk for sale in sales],
+    })
+
+
+async def live_stream(schema_name, snapshot):
+    """
+    Асинхронный генератор text/event-stream для StreamingHttpResponse.
+
+    Не обращается к БД: снимок итогов считается во view, события приходят
+    из Redis готовыми. Раз в SALES_LIVE_KEEPALIVE секунд без событий
+    отправляет комментарий, чтобы прокси не закрыли соединение, через
+    SALES_LIVE_MAX_AGE секунд завершает поток (клиент переподключится
+    и получит свежий снимок).
+    """
+    import redis.asyncio as aioredis
+
+    yield f'retry: {RETRY_MS}\n' + format_event('totals', snapshot)
+
+    client = aioredis.Redis.from_url(settings.SALES_LIVE_REDIS_URL)
+    pubsub = client.pubsub()
+    deadline = time.monotonic() + settings.SALES_LIVE_MAX_AGE
+    try:
+        await pubsub.subscribe(live_channel(schema_name))
+        while time.monotonic() < deadline:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=settings.SALES_LIVE_KEEPALIVE
+            )
+            if message is None:
+                yield ': keepalive\n\n'
+                continue
+            body = json.loads(message['data'])
+            yield format_event(body['event'], body['data'])
+    except redis.RedisError as e:
+        logger.warning(f"Лента продаж {schema_name} прервана: {e}")
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,250 @@
+"""
+Management command для нагрузочной проверки оплаты (sales.checkout).
+
+Несколько касс (потоков, у каждого своё соединение с БД и своя смена)
+параллельно пробивают чеки из одних и тех же "горячих" товаров и оплачивают их.
+После прогона проверяет, что списано ровно столько, сколько продано,
+остатки не ушли в минус, и удаляет временные данные.
+
+Usage:
+    python manage.py benchmark_checkout --store test_shop
+    python manage.py benchmark_checkout --store test_shop --registers 20 --sales 25 --skus 3 --lines 5
+"""
+
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+
+from core.schema_utils import schema_context
+from users.models import Store
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочная проверка параллельной оплаты чеков с общими товарами'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store',
+            type=str,
+            required=True,
+            help='Slug магазина',
+        )
+        parser.add_argument(
+            '--registers',
+            type=int,
+            default=20,
+            help='Количество параллельных касс (потоков)',
+        )
+        parser.add_argument(
+            '--sales',
+            type=int,
+            default=25,
+            help='Количество чеков на одну кассу',
+        )
+        parser.add_argument(
+            '--skus',
+            type=int,
+            default=3,
+            help='Количество горячих товаров, общих для всех касс',
+        )
+        parser.add_argument(
+            '--lines',
+            type=int,
+            default=5,
+            help='Позиций в чеке',
+        )
+        parser.add_argument(
+            '--batches',
+            type=int,
+            default=3,
+            help='Партий у каждого товара',
+        )
+        parser.add_argument(
+            '--batch-quantity',
+            type=str,
+            default='1000',
+            help='Остаток в каждой партии',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            store = Store.objects.get(slug=options['store'])
+        except Store.DoesNotExist:
+            self.stdout.write(self.style.ERROR(f'❌ Магазин "{options["store"]}" не найден'))
+            return
+
+        registers = options['registers']
+        sales_per_register = options['sales']
+        lines = options['lines']
+        batch_quantity = Decimal(options['batch_quantity'])
+
+        self.stdout.write(f'\n📦 {store.name} ({store.schema_name})')
+        self.stdout.write(
+            f'   Касс: {registers}, чеков на кассу: {sales_per_register}, '
+            f'горячих товаров: {options["skus"]}, позиций в чеке: {lines}\n'
+        )
+
+        with schema_context(store.schema_name):
+            fixture = self._create_fixture(registers, options['skus'], options['batches'], batch_quantity)
+        initial_total = batch_quantity * options['batches'] * options['skus']
+
+        results = {'ok': 0, 'insufficient': 0, 'errors': 0, 'latencies': [], 'first_error': None}
+        lock = threading.Lock()
+
+        def worker(session):
+            from products.stock import InsufficientStockError
+            from sales.checkout import checkout_sale
+            from sales.models import Sale
+            from sales.pos import ScanError, scan_item
+
+            latencies = []
+            ok = insufficient = errors = 0
+            first_error = None
+            products = fixture['products']
+            try:
+                with schema_context(store.schema_name):
+                    for _ in range(sales_per_register):
+                        try:
+                            for line in range(lines):
+                                result = scan_item(session.id, products[line % len(products)].id, Decimal('1'))
+
+                            started = time.perf_counter()
+                            checkout_sale(result.sale.pk, [{
+                                'payment_method': 'card',
+                                'amount': str(result.sale.total_amount),
+                            }])
+                            latencies.append(time.perf_counter() - started)
+                            ok += 1
+                        except (InsufficientStockError, ScanError):
+                            insufficient += 1
+                            Sale.objects.filter(session=session, status='pending').update(status='cancelled')
+                        except Exception as e:
+                            errors += 1
+                            first_error = first_error or f'{type(e).__name__}: {e}'
+                            Sale.objects.filter(session=session, status='pending').update(status='cancelled')
+            finally:
+                connection.close()
+
+            with lock:
+                results['ok'] += ok
+                results['insufficient'] += insufficient
+                results['errors'] += errors
+                results['latencies'].extend(latencies)
+                results['first_error'] = results['first_error'] or first_error
+
+        threads = [threading.Thread(target=worker, args=(session,)) for session in fixture['sessions']]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with schema_context(store.schema_name):
+            remaining, negative, sold = self._stock_summary(fixture)
+            self._cleanup(fixture)
+
+        latencies = sorted(results['latencies']) or [0]
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(f'Время: {elapsed:.2f} c, оплат/с: {results["ok"] / elapsed:.1f}')
+        self.stdout.write(
+            f'Оплата p50: {latencies[len(latencies) // 2] * 1000:.1f} мс, '
+            f'p99: {latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000:.1f} мс'
+        )
+        self.stdout.write(f'Оплачено чеков: {results["ok"]}, не хватило товара: {results["insufficient"]}')
+        if results['errors']:
+            self.stdout.write(self.style.ERROR(f'Ошибок: {results["errors"]} (первая: {results["first_error"]})'))
+        self.stdout.write(f'Продано: {sold}, осталось: {remaining}')
+        self.stdout.write('='*60)
+
+        if sold + remaining == initial_total and negative == 0:
+            self.stdout.write(self.style.SUCCESS('\n✅ Остатки сходятся, перепродаж нет'))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'\n❌ Остатки не сходятся: продано {sold} + осталось {remaining} != {initial_total}'
+            ))
+
+    def _create_fixture(self, registers, skus, batches, batch_quantity):
+        """Создаёт временные кассы со сменами и горячие товары с партиями"""
+        from products.models import (
+            Product, ProductBatch, ProductInventory, ProductPricing, Unit
+        )
+        from sales.models import CashRegister, CashierSession
+
+        unit = Unit.objects.first() or Unit.objects.create(name='штука', short_name='шт')
+        suffix = uuid.uuid4().hex[:6].upper()
+
+        sessions = []
+        for i in range(registers):
+            register = CashRegister.objects.create(name=f'Benchmark {suffix} {i}', code=f'C{suffix}{i}')
+            sessions.append(CashierSession.objects.create(
+                cash_register=register,
+                cashier_name='Benchmark',
+                opening_cash=0
+            ))
+
+        products = []
+        for i in range(skus):
+            product = Product.objects.create(
+                name=f'Benchmark {suffix} {i}',
+                slug=f'benchmark-{suffix.lower()}-{i}',
+                sku=f'BENCH-{suffix}-{i}',
+                unit=unit
+            )
+            ProductPricing.objects.create(
+                product=product,
+                cost_price=Decimal('50.00'),
+                sale_price=Decimal('100.00')
+            )
+            ProductInventory.objects.create(product=product)
+            ProductBatch.objects.bulk_create([
+                ProductBatch(
+                    product=product,
+                    batch_number=f'BENCH-{suffix}-{i}-{j}',
+                    quantity=batch_quantity,
+                    purchase_price=Decimal('50.00')
+                )
+                for j in range(batches)
+            ])
+            products.append(product)
+
+        return {'sessions': sessions, 'products': products}
+
+    def _stock_summary(self, fixture):
+        """Остаток, число отрицательных партий и продано по позициям оплаченных чеков"""
+        from products.models import ProductBatch
+        from sales.models import SaleItem
+
+        product_ids = [product.pk for product in fixture['products']]
+        batches = ProductBatch.objects.filter(product_id__in=product_ids)
+        remaining = batches.aggregate(total=Sum('quantity'))['total'] or Decimal('0')
+        negative = batches.filter(quantity__lt=0).count()
+        sold = SaleItem.objects.filter(
+            product_id__in=product_ids,
+            sale__status='completed'
+        ).aggregate(total=Sum('quantity'))['total'] or Decimal('0')
+        return remaining, negative, sold
+
+    def _cleanup(self, fixture):
+        """Удаляет чеки, резервы, смены, кассы и товары замера"""
+        from products.models import Product, StockReservation
+        from sales.models import CashRegister, CashierSession, ReceiptCounter, Sale
+        from sales.receipts import receipt_prefix
+
+        sessions = fixture['sessions']
+        product_ids = [product.pk for product in fixture['products']]
+
+        Sale.objects.filter(session__in=sessions).delete()
+        StockReservation.objects.filter(product_id__in=product_ids).delete()
+        Product.objects.filter(pk__in=product_ids).delete()
+        CashierSession.objects.filter(pk__in=[session.pk for session in sessions]).delete()
+        CashRegister.objects.filter(pk__in=[session.cash_register_id for session in sessions]).delete()
+        ReceiptCounter.objects.filter(
+            prefix__in=[receipt_prefix(session.cash_register.code) for session in sessions]
+        ).delete()
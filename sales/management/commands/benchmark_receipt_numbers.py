@@ -0,0 +1,167 @@
+"""
+Management command для проверки выдачи номеров чеков под нагрузкой.
+
+Создаёт временные кассы со сменами и параллельно открывает продажи
+(каждый поток - отдельное соединение с БД, как отдельная касса).
+Проверяет, что не было конфликтов номеров, нумерация каждой кассы
+идёт подряд без пропусков, и что достигнута нужная скорость.
+
+Usage:
+    python manage.py benchmark_receipt_numbers --store test_shop
+    python manage.py benchmark_receipt_numbers --store test_shop --registers 20 --sales 100 --target 200
+"""
+
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+
+from core.schema_utils import schema_context
+from users.models import Store
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочная проверка выдачи номеров чеков параллельными кассами'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store',
+            type=str,
+            required=True,
+            help='Slug магазина',
+        )
+        parser.add_argument(
+            '--registers',
+            type=int,
+            default=10,
+            help='Количество параллельных касс (потоков)',
+        )
+        parser.add_argument(
+            '--sales',
+            type=int,
+            default=100,
+            help='Количество продаж на одну кассу',
+        )
+        parser.add_argument(
+            '--target',
+            type=float,
+            default=200,
+            help='Минимальная скорость открытия продаж (в секунду)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            store = Store.objects.get(slug=options['store'])
+        except Store.DoesNotExist:
+            self.stdout.write(self.style.ERROR(f'❌ Магазин "{options["store"]}" не найден'))
+            return
+
+        registers = options['registers']
+        sales_per_register = options['sales']
+
+        self.stdout.write(f'\n📦 {store.name} ({store.schema_name})')
+        self.stdout.write(f'   Касс: {registers}, продаж на кассу: {sales_per_register}\n')
+
+        with schema_context(store.schema_name):
+            sessions = self._create_sessions(registers)
+
+        results = {'ok': 0, 'conflicts': 0, 'errors': 0, 'numbers': {}}
+        lock = threading.Lock()
+
+        def worker(session):
+            from sales.models import Sale
+            from sales.receipts import allocate_receipt_number
+
+            numbers = []
+            ok = conflicts = errors = 0
+            try:
+                with schema_context(store.schema_name):
+                    for _ in range(sales_per_register):
+                        try:
+                            with transaction.atomic():
+                                sale = Sale.objects.create(
+                                    session=session,
+                                    receipt_number=allocate_receipt_number(session.cash_register.code),
+                                    status='cancelled'
+                                )
+                            numbers.append(sale.receipt_number)
+                            ok += 1
+                        except IntegrityError:
+                            conflicts += 1
+                        except Exception:
+                            errors += 1
+            finally:
+                connection.close()
+
+            with lock:
+                results['ok'] += ok
+                results['conflicts'] += conflicts
+                results['errors'] += errors
+                results['numbers'][session.cash_register.code] = numbers
+
+        threads = [threading.Thread(target=worker, args=(session,)) for session in sessions]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        # Номера каждой кассы должны идти подряд: 00001, 00002, ...
+        gaps = 0
+        for numbers in results['numbers'].values():
+            serials = [int(number.rsplit('-', 1)[1]) for number in numbers]
+            if serials and serials != list(range(serials[0], serials[0] + len(serials))):
+                gaps += 1
+
+        with schema_context(store.schema_name):
+            self._cleanup(sessions)
+
+        rate = results['ok'] / elapsed if elapsed else 0
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(f'Время: {elapsed:.2f} c, продаж/с: {rate:.1f}')
+        self.stdout.write(f'Открыто продаж: {results["ok"]}, конфликтов номеров: {results["conflicts"]}')
+        if results['errors']:
+            self.stdout.write(self.style.ERROR(f'Ошибок: {results["errors"]}'))
+        if gaps:
+            self.stdout.write(self.style.ERROR(f'Касс с пропусками в нумерации: {gaps}'))
+        self.stdout.write('='*60)
+
+        if results['conflicts'] or gaps:
+            raise CommandError('❌ Номера чеков выдаются с конфликтами или пропусками')
+        if rate < options['target']:
+            raise CommandError(f'❌ Скорость {rate:.1f} продаж/с ниже цели {options["target"]:.0f}')
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Конфликтов нет, {rate:.1f} продаж/с'))
+
+    def _create_sessions(self, count):
+        """Создаёт временные кассы с открытыми сменами"""
+        from sales.models import CashRegister, CashierSession
+
+        suffix = uuid.uuid4().hex[:6].upper()
+        sessions = []
+        for i in range(count):
+            register = CashRegister.objects.create(name=f'Benchmark {suffix} {i}', code=f'B{suffix}{i}')
+            session = CashierSession.objects.create(
+                cash_register=register,
+                cashier_name='Benchmark',
+                opening_cash=0
+            )
+            sessions.append(session)
+        return sessions
+
+    def _cleanup(self, sessions):
+        """Удаляет временные продажи, смены, кассы и их счётчики"""
+        from sales.models import CashRegister, CashierSession, ReceiptCounter, Sale
+        from sales.receipts import receipt_prefix
+
+        session_ids = [session.id for session in sessions]
+        register_ids = [session.cash_register_id for session in sessions]
+        prefixes = [receipt_prefix(session.cash_register.code) for session in sessions]
+
+        Sale.objects.filter(session_id__in=session_ids).delete()
+        CashierSession.objects.filter(id__in=session_ids).delete()
+        CashRegister.objects.filter(id__in=register_ids).delete()
+        ReceiptCounter.objects.filter(prefix__in=prefixes).delete()
@@ -0,0 +1,205 @@
+"""
+Management command для замера сканирования товара на кассе (sales.pos.scan_item).
+
+Создаёт временные кассу, смену и товары, пробивает несколько чеков
+по 30 позиций (часть товаров сканируется повторно) и выводит p50/p99
+времени одного сканирования и всего чека. Для каждого сканирования
+считаются SQL запросы: если хоть одно превысило бюджет, команда
+завершается с ошибкой (удобно запускать в CI).
+
+Usage:
+    python manage.py benchmark_scan_item --store test_shop
+    python manage.py benchmark_scan_item --store test_shop --baskets 50 --lines 30
+"""
+
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.schema_utils import schema_context
+from users.models import Store
+
+
+# BEGIN/COMMIT/SAVEPOINT не считаются: бюджет - это запросы к данным
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+def count_queries(captured_queries):
+    """Количество SQL запросов без управления транзакцией"""
+    return sum(
+        1 for query in captured_queries
+        if not query['sql'].lstrip().upper().startswith(TRANSACTION_STATEMENTS)
+    )
+
+
+def percentile(values, percent):
+    """Перцентиль по отсортированному списку"""
+    if not values:
+        return 0
+    index = max(0, int(round(len(values) * percent / 100)) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Замер времени и количества SQL запросов сканирования товара на кассе'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store',
+            type=str,
+            required=True,
+            help='Slug магазина',
+        )
+        parser.add_argument(
+            '--baskets',
+            type=int,
+            default=20,
+            help='Количество чеков',
+        )
+        parser.add_argument(
+            '--lines',
+            type=int,
+            default=30,
+            help='Количество сканирований в чеке',
+        )
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=20,
+            help='Количество разных товаров (меньше lines - будут повторные сканирования)',
+        )
+
+    def handle(self, *args, **options):
+        from sales.pos import SCAN_QUERY_BUDGET
+
+        try:
+            store = Store.objects.get(slug=options['store'])
+        except Store.DoesNotExist:
+            self.stdout.write(self.style.ERROR(f'❌ Магазин "{options["store"]}" не найден'))
+            return
+
+        baskets = options['baskets']
+        lines = options['lines']
+
+        self.stdout.write(f'\n📦 {store.name} ({store.schema_name})')
+        self.stdout.write(
+            f'   Чеков: {baskets}, сканирований в чеке: {lines}, '
+            f'товаров: {options["products"]}, бюджет: {SCAN_QUERY_BUDGET} запроса\n'
+        )
+
+        with schema_context(store.schema_name):
+            fixture = self._create_fixture(options['products'], baskets * lines)
+            try:
+                scan_latencies, basket_latencies, query_counts = self._run(
+                    fixture, baskets, lines
+                )
+            finally:
+                self._cleanup(fixture)
+
+        scan_latencies.sort()
+        basket_latencies.sort()
+        over_budget = [count for count in query_counts if count > SCAN_QUERY_BUDGET]
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(
+            f'Сканирование: p50 {percentile(scan_latencies, 50) * 1000:.2f} мс, '
+            f'p99 {percentile(scan_latencies, 99) * 1000:.2f} мс'
+        )
+        self.stdout.write(
+            f'Чек из {lines} позиций: p50 {percentile(basket_latencies, 50) * 1000:.1f} мс, '
+            f'p99 {percentile(basket_latencies, 99) * 1000:.1f} мс'
+        )
+        self.stdout.write(
+            f'SQL запросов на сканирование: макс {max(query_counts)}, '
+            f'в среднем {sum(query_counts) / len(query_counts):.2f}'
+        )
+        self.stdout.write('='*60)
+
+        if over_budget:
+            raise CommandError(
+                f'❌ {len(over_budget)} сканирований превысили бюджет '
+                f'{SCAN_QUERY_BUDGET} запроса (макс {max(over_budget)})'
+            )
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Все сканирования уложились в {SCAN_QUERY_BUDGET} запроса'))
+
+    def _run(self, fixture, baskets, lines):
+        """Пробивает чеки и возвращает замеры"""
+        from sales.models import Sale
+        from sales.pos import scan_item
+
+        products = fixture['products']
+        session = fixture['session']
+        scan_latencies = []
+        basket_latencies = []
+        query_counts = []
+
+        for basket in range(baskets):
+            basket_started = time.perf_counter()
+            for line in range(lines):
+                product = products[line % len(products)]
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    result = scan_item(session.id, product.id, Decimal('1'))
+                    scan_latencies.append(time.perf_counter() - started)
+                query_counts.append(count_queries(queries.captured_queries))
+            basket_latencies.append(time.perf_counter() - basket_started)
+
+            # Откладываем чек, чтобы следующее сканирование открыло новый
+            Sale.objects.filter(pk=result.sale.pk).update(status='cancelled')
+
+        return scan_latencies, basket_latencies, query_counts
+
+    def _create_fixture(self, count, stock):
+        """Создаёт временные кассу, смену и товары с остатком"""
+        from products.models import (
+            Product, ProductBatch, ProductInventory, ProductPricing, Unit
+        )
+        from sales.models import CashRegister, CashierSession
+
+        unit = Unit.objects.first() or Unit.objects.create(name='штука', short_name='шт')
+        suffix = f'BENCH-{uuid.uuid4().hex[:8]}'
+
+        register = CashRegister.objects.create(name=suffix, code=suffix)
+        session = CashierSession.objects.create(
+            cash_register=register,
+            cashier_name='Benchmark',
+            opening_cash=0
+        )
+
+        products = []
+        for i in range(count):
+            product = Product.objects.create(
+                name=f'{suffix} {i}',
+                slug=f'{suffix.lower()}-{i}',
+                sku=f'{suffix}-{i}',
+                unit=unit
+            )
+            ProductPricing.objects.create(
+                product=product,
+                cost_price=Decimal('50.00'),
+                sale_price=Decimal('100.00')
+            )
+            ProductInventory.objects.create(product=product)
+            ProductBatch.objects.create(
+                product=product,
+                batch_number=f'{suffix}-{i}',
+                quantity=stock,
+                purchase_price=Decimal('50.00')
+            )
+            products.append(product)
+
+        return {'suffix': suffix, 'register': register, 'session': session, 'products': products}
+
+    def _cleanup(self, fixture):
+        """Удаляет всё, что создал замер"""
+        from products.models import Product
+        from sales.models import Sale
+
+        Sale.objects.filter(session=fixture['session']).delete()
+        fixture['session'].delete()
+        fixture['register'].delete()
+        Product.objects.filter(pk__in=[product.pk for product in fixture['products']]).delete()
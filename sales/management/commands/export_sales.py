@@ -0,0 +1,105 @@
+"""
+Management command для потоковой выгрузки продаж, позиций и платежей.
+
+Тот же формат, что у GET /api/sales/sales/export/: строки читаются
+серверным курсором пачками, память не зависит от размера выгрузки.
+
+Usage:
+    python manage.py export_sales --store test_shop --date-from 2025-01-01 --date-to 2025-01-31
+    python manage.py export_sales --store test_shop --dataset items --format jsonl --output items.jsonl.gz
+    python manage.py export_sales --store test_shop --dataset payments --status completed --status refunded
+"""
+
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import Store
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка продаж, позиций или платежей магазина в CSV / JSON Lines'
+
+    def add_arguments(self, parser):
+        from sales.export import EXPORT_CHUNK_SIZE, EXPORT_DATASETS, EXPORT_FORMATS
+
+        parser.add_argument(
+            '--store',
+            type=str,
+            required=True,
+            help='Slug магазина',
+        )
+        parser.add_argument(
+            '--dataset',
+            type=str,
+            default='sales',
+            choices=list(EXPORT_DATASETS),
+            help='Что выгружать (по умолчанию sales)',
+        )
+        parser.add_argument(
+            '--format',
+            type=str,
+            default='csv',
+            choices=list(EXPORT_FORMATS),
+            help='Формат файла (по умолчанию csv)',
+        )
+        parser.add_argument(
+            '--date-from',
+            type=str,
+            help='Начало периода YYYY-MM-DD (по дате продажи)',
+        )
+        parser.add_argument(
+            '--date-to',
+            type=str,
+            help='Конец периода YYYY-MM-DD (включительно)',
+        )
+        parser.add_argument(
+            '--status',
+            action='append',
+            help='Статус продаж (можно несколько раз)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Файл для выгрузки (.gz - со сжатием), по умолчанию stdout',
+        )
+        parser.add_argument(
+            '--chunk',
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help='Строк в одной пачке курсора',
+        )
+
+    def handle(self, *args, **options):
+        from sales.export import ExportError, export_queryset, parse_date_bound, stream_export
+
+        try:
+            store = Store.objects.get(slug=options['store'])
+        except Store.DoesNotExist:
+            raise CommandError(f'❌ Магазин "{options["store"]}" не найден')
+
+        try:
+            date_from = parse_date_bound(options['date_from'])
+            date_to = parse_date_bound(options['date_to'], end=True)
+            headers, queryset = export_queryset(options['dataset'], date_from, date_to, options['status'])
+        except ExportError as e:
+            raise CommandError(f'❌ {e}')
+
+        path = options['output']
+        if not path:
+            output = sys.stdout
+        elif path.endswith('.gz'):
+            output = gzip.open(path, 'wt', encoding='utf-8', newline='')
+        else:
+            output = open(path, 'w', encoding='utf-8', newline='')
+
+        try:
+            for part in stream_export(store.schema_name, headers, queryset, options['format'], options['chunk']):
+                output.write(part)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        if path:
+            self.stdout.write(self.style.SUCCESS(f'✅ {store.name}: выгрузка {options["dataset"]} сохранена в {path}'))
@@ -0,0 +1,106 @@
+"""
+Management command для помесячного секционирования таблиц продаж (PostgreSQL).
+
+Без --convert только создаёт недостающие секции вперёд в магазинах, где
+секционирование уже включено (то же делает задача ensure_sales_partitions).
+
+--convert переводит sales_sale, sales_sale_item и sales_payment на секции
+по created_at (см. core.partitioning). Таблицы блокируются на время
+перевода - запускайте вне рабочих часов магазина.
+
+--detach-before отсоединяет секции старше месяца, отсоединённые таблицы
+остаются в схеме магазина для выгрузки в архив.
+
+Usage:
+    python manage.py partition_sales_tables --store test_shop --convert
+    python manage.py partition_sales_tables --months-ahead 6
+    python manage.py partition_sales_tables --store test_shop --detach-before 2024-01
+"""
+
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.schema_utils import schema_context
+from users.models import Store
+
+
+class Command(BaseCommand):
+    help = 'Помесячное секционирование таблиц продаж магазинов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store',
+            type=str,
+            help='Slug конкретного магазина (опционально)',
+        )
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Перевести таблицы продаж на секции, если ещё не переведены',
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=settings.SALES_PARTITION_MONTHS_AHEAD,
+            help='На сколько месяцев вперёд создавать секции',
+        )
+        parser.add_argument(
+            '--detach-before',
+            type=str,
+            help='Отсоединить секции до месяца YYYY-MM (не включая его)',
+        )
+
+    def handle(self, *args, **options):
+        from core.partitioning import (
+            PartitioningError, detach_partitions, ensure_partitions, is_supported, partition_sales_tables,
+        )
+
+        if not is_supported():
+            raise CommandError('❌ Секционирование таблиц продаж доступно только на PostgreSQL')
+
+        detach_before = None
+        if options['detach_before']:
+            try:
+                detach_before = date.fromisoformat(f"{options['detach_before']}-01")
+            except ValueError:
+                raise CommandError(f'❌ Неверный месяц: {options["detach_before"]} (нужно YYYY-MM)')
+
+        store_slug = options.get('store')
+        if store_slug:
+            try:
+                stores = [Store.objects.get(slug=store_slug)]
+            except Store.DoesNotExist:
+                self.stdout.write(self.style.ERROR(f'❌ Магазин "{store_slug}" не найден'))
+                return
+        else:
+            stores = list(Store.objects.filter(is_active=True).order_by('created_at'))
+
+        error_count = 0
+        for store in stores:
+            self.stdout.write(f'\n📦 {store.name} ({store.schema_name})...')
+            try:
+                with schema_context(store.schema_name):
+                    if options['convert']:
+                        converted = partition_sales_tables(options['months_ahead'])
+                        for table in converted:
+                            self.stdout.write(self.style.SUCCESS(f'  ✓ {table} секционирована'))
+                    created = ensure_partitions(options['months_ahead'])
+                    for name in created:
+                        self.stdout.write(f'  + {name}')
+                    if detach_before:
+                        for name in detach_partitions(detach_before):
+                            self.stdout.write(self.style.WARNING(f'  - {name} отсоединена'))
+            except PartitioningError as e:
+                error_count += 1
+                self.stdout.write(self.style.ERROR(f'❌ {e}'))
+            except Exception as e:
+                error_count += 1
+                self.stdout.write(self.style.ERROR(f'❌ Ошибка для {store.name}: {e}'))
+
+        self.stdout.write('\n' + '='*60)
+        if error_count == 0:
+            self.stdout.write(self.style.SUCCESS('✅ Секции таблиц продаж обновлены'))
+        else:
+            self.stdout.write(self.style.WARNING(f'⚠️  Завершено с {error_count} ошибками'))
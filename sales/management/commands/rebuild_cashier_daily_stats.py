@@ -0,0 +1,90 @@
+"""
+Management command для пересборки дневной сводки кассиров (sales_cashier_daily_stats).
+
+Сводка ведётся приращениями при оплате и возврате, по ней строится
+рейтинг кассиров (cashier-stats) за целые дни. Команда пересчитывает
+её по продажам и платежам за период.
+
+После добавления сводки запустите один раз с нужным периодом, чтобы
+заполнить её для старых продаж.
+
+Usage:
+    python manage.py rebuild_cashier_daily_stats
+    python manage.py rebuild_cashier_daily_stats --store test_shop --days 90
+    python manage.py rebuild_cashier_daily_stats --store test_shop --date-from 2025-01-01 --date-to 2025-01-31
+"""
+
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.schema_utils import schema_context
+from users.models import Store
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает дневную сводку продаж по кассирам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store',
+            type=str,
+            help='Slug конкретного магазина (опционально)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=31,
+            help='Пересобрать последние N дней (по умолчанию 31)',
+        )
+        parser.add_argument(
+            '--date-from',
+            type=str,
+            help='Начальная дата YYYY-MM-DD (вместо --days)',
+        )
+        parser.add_argument(
+            '--date-to',
+            type=str,
+            help='Конечная дата YYYY-MM-DD (по умолчанию сегодня)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            day_to = date.fromisoformat(options['date_to']) if options['date_to'] else timezone.localdate()
+            if options['date_from']:
+                day_from = date.fromisoformat(options['date_from'])
+            else:
+                day_from = day_to - timedelta(days=options['days'] - 1)
+        except ValueError as e:
+            raise CommandError(f'❌ Неверная дата: {e}')
+
+        if day_from > day_to:
+            raise CommandError('❌ --date-from позже --date-to')
+
+        store_slug = options.get('store')
+        if store_slug:
+            try:
+                stores = [Store.objects.get(slug=store_slug)]
+            except Store.DoesNotExist:
+                self.stdout.write(self.style.ERROR(f'❌ Магазин "{store_slug}" не найден'))
+                return
+        else:
+            stores = list(Store.objects.filter(is_active=True).order_by('created_at'))
+
+        self.stdout.write(f'📅 Период: {day_from} - {day_to}')
+
+        total = 0
+        for store in stores:
+            self.stdout.write(f'\n📦 {store.name} ({store.schema_name})...')
+            try:
+                with schema_context(store.schema_name):
+                    from sales.stats import rebuild_cashier_daily_stats
+                    rows = rebuild_cashier_daily_stats(day_from, day_to)
+                self.stdout.write(f'  Строк сводки: {rows}')
+                total += rows
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'❌ Ошибка для {store.name}: {e}'))
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.SUCCESS(f'✅ Сводка пересобрана, строк: {total}'))
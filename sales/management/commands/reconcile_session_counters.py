@@ -0,0 +1,113 @@
+"""
+Management command для сверки счётчиков кассовых смен.
+
+Счётчики смены (количество и сумма продаж, возвраты, суммы по способам
+оплаты, внесения и изъятия) ведутся приращениями при оплате, возврате
+и движении наличности. Команда пересчитывает их по продажам, платежам
+и движениям наличности и показывает смены с расхождением.
+
+Существующие смены заполняет миграция 0012_cashier_session_counters;
+--fix нужен, только если счётчики разошлись позже.
+
+Usage:
+    python manage.py reconcile_session_counters
+    python manage.py reconcile_session_counters --store test_shop --status open
+    python manage.py reconcile_session_counters --store test_shop --fix
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.schema_utils import schema_context
+from users.models import Store
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики кассовых смен с продажами и движениями наличности'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store',
+            type=str,
+            help='Slug конкретного магазина (опционально)',
+        )
+        parser.add_argument(
+            '--status',
+            type=str,
+            help='Проверять только смены с этим статусом (open, closed, suspended)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Проверять только смены, открытые за последние N дней',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Записать пересчитанные счётчики',
+        )
+
+    def handle(self, *args, **options):
+        store_slug = options.get('store')
+
+        if store_slug:
+            try:
+                stores = [Store.objects.get(slug=store_slug)]
+            except Store.DoesNotExist:
+                self.stdout.write(self.style.ERROR(f'❌ Магазин "{store_slug}" не найден'))
+                return
+        else:
+            stores = list(Store.objects.filter(is_active=True).order_by('created_at'))
+
+        total = 0
+        for store in stores:
+            self.stdout.write(f'\n📦 {store.name} ({store.schema_name})...')
+            try:
+                with schema_context(store.schema_name):
+                    total += self._reconcile(options)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'❌ Ошибка для {store.name}: {e}'))
+
+        self.stdout.write('\n' + '='*60)
+        if not total:
+            self.stdout.write(self.style.SUCCESS('✅ Счётчики всех смен сходятся'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'✅ Исправлено смен: {total}'))
+        else:
+            self.stdout.write(self.style.WARNING(f'Смен с расхождением: {total} (запустите с --fix)'))
+
+    def _reconcile(self, options):
+        """Сверяет смены в текущей схеме"""
+        from sales.models import CashierSession
+
+        queryset = CashierSession.objects.all()
+        if options.get('status'):
+            queryset = queryset.filter(status=options['status'])
+        if options.get('days'):
+            queryset = queryset.filter(opened_at__gte=timezone.now() - timedelta(days=options['days']))
+
+        drifted = list(CashierSession.find_counters_drift(queryset).select_related('cash_register').order_by('id'))
+        self.stdout.write(f'  Расхождений: {len(drifted)}')
+
+        for session in drifted:
+            changes = ', '.join(
+                f'{field} {getattr(session, field)} -> {getattr(session, f"expected_{field}")}'
+                for field in CashierSession.COUNTER_FIELDS
+                if getattr(session, field) != getattr(session, f'expected_{field}')
+            )
+            self.stdout.write(f'    #{session.pk} {session.cash_register.name} ({session.status}): {changes}')
+
+        if options['fix'] and drifted:
+            with transaction.atomic():
+                CashierSession.with_expected_counters(
+                    CashierSession.objects.filter(pk__in=[session.pk for session in drifted])
+                ).update(**{
+                    field: F(f'expected_{field}') for field in CashierSession.COUNTER_FIELDS
+                })
+            self.stdout.write(self.style.SUCCESS(f'  ✓ Пересчитано: {len(drifted)}'))
+
+        return len(drifted)
@@ -0,0 +1,112 @@
+"""
+Management command для сверки итогов продаж с позициями.
+
+Итоги чека (subtotal, discount_amount, total_amount) ведутся приращениями
+при каждом изменении позиции (Sale.apply_line_delta). Команда пересчитывает
+их по позициям одним запросом и показывает чеки с расхождением.
+
+Usage:
+    python manage.py verify_sale_totals
+    python manage.py verify_sale_totals --store test_shop --status pending
+    python manage.py verify_sale_totals --store test_shop --days 7 --fix
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.schema_utils import schema_context
+from users.models import Store
+
+
+class Command(BaseCommand):
+    help = 'Сверяет итоги продаж с позициями и показывает расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store',
+            type=str,
+            help='Slug конкретного магазина (опционально)',
+        )
+        parser.add_argument(
+            '--status',
+            type=str,
+            help='Проверять только продажи с этим статусом (pending, completed, ...)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Проверять только продажи за последние N дней',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Записать пересчитанные итоги',
+        )
+
+    def handle(self, *args, **options):
+        store_slug = options.get('store')
+
+        if store_slug:
+            try:
+                stores = [Store.objects.get(slug=store_slug)]
+            except Store.DoesNotExist:
+                self.stdout.write(self.style.ERROR(f'❌ Магазин "{store_slug}" не найден'))
+                return
+        else:
+            stores = list(Store.objects.filter(is_active=True).order_by('created_at'))
+
+        total = 0
+        for store in stores:
+            self.stdout.write(f'\n📦 {store.name} ({store.schema_name})...')
+            try:
+                with schema_context(store.schema_name):
+                    total += self._verify(options)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'❌ Ошибка для {store.name}: {e}'))
+
+        self.stdout.write('\n' + '='*60)
+        if not total:
+            self.stdout.write(self.style.SUCCESS('✅ Итоги всех продаж сходятся с позициями'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'✅ Исправлено продаж: {total}'))
+        else:
+            self.stdout.write(self.style.WARNING(f'Продаж с расхождением: {total} (запустите с --fix)'))
+
+    def _verify(self, options):
+        """Сверяет продажи в текущей схеме"""
+        from sales.models import Sale, round_money
+
+        queryset = Sale.objects.all()
+        if options.get('status'):
+            queryset = queryset.filter(status=options['status'])
+        if options.get('days'):
+            queryset = queryset.filter(created_at__gte=timezone.now() - timedelta(days=options['days']))
+
+        drifted = list(Sale.find_totals_drift(queryset).order_by('id'))
+        self.stdout.write(f'  Расхождений: {len(drifted)}')
+
+        for sale in drifted:
+            self.stdout.write(
+                f'    {sale.receipt_number} ({sale.status}): '
+                f'subtotal {sale.subtotal} -> {round_money(sale.expected_subtotal)}, '
+                f'скидка {sale.discount_amount} -> {round_money(sale.expected_discount)}, '
+                f'итого {sale.total_amount} -> {round_money(sale.expected_total)}'
+            )
+
+        if options['fix'] and drifted:
+            # update() вместо save(): не трогаем сигналы аналитики завершённых продаж
+            with transaction.atomic():
+                Sale.with_expected_totals(
+                    Sale.objects.filter(pk__in=[sale.pk for sale in drifted])
+                ).update(
+                    subtotal=F('expected_subtotal'),
+                    discount_amount=F('expected_discount'),
+                    total_amount=F('expected_total'),
+                )
+            self.stdout.write(self.style.SUCCESS(f'  ✓ Пересчитано: {len(drifted)}'))
+
+        return len(drifted)
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customers", "0003_transaction_cursor_pagination_index"),
+        ("sales", "0008_add_cashier_db_constraint_false"),
+        ("users", "0005_add_staff_role"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="sales_sale_created_f4075b_idx"
+            ),
+        ),
+    ]
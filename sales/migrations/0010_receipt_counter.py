@@ -0,0 +1,48 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0009_sale_cursor_pagination_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReceiptCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "prefix",
+                    models.CharField(
+                        help_text="Код кассы в номере чека",
+                        max_length=20,
+                        verbose_name="Префикс",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="День")),
+                (
+                    "last_number",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Последний номер"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Счётчик чеков",
+                "verbose_name_plural": "Счётчики чеков",
+                "db_table": "sales_receipt_counter",
+                "unique_together": {("prefix", "day")},
+            },
+        ),
+    ]
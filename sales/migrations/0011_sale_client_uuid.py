@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0010_receipt_counter"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sale",
+            name="client_uuid",
+            field=models.UUIDField(
+                blank=True,
+                help_text="Идентификатор офлайн продажи для защиты от повторной загрузки",
+                null=True,
+                unique=True,
+                verbose_name="UUID кассы",
+            ),
+        ),
+    ]
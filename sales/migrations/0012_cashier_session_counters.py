@@ -0,0 +1,203 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:13
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+PAYMENT_COUNTER_FIELDS = {
+    "cash": "cash_amount",
+    "card": "card_amount",
+    "transfer": "transfer_amount",
+    "online": "online_amount",
+    "credit": "credit_amount",
+    "other": "other_amount",
+}
+
+
+def fill_session_counters(apps, schema_editor):
+    """
+    Счётчики существующих смен по их продажам, платежам и движениям
+    наличности (как CashierSession.with_expected_counters), одним UPDATE.
+
+    Без этого открытые на момент деплоя смены показывали бы нули
+    и закрывались с неверными expected_cash / cash_difference.
+    """
+    CashierSession = apps.get_model("sales", "CashierSession")
+    Sale = apps.get_model("sales", "Sale")
+    SaleItem = apps.get_model("sales", "SaleItem")
+    Payment = apps.get_model("sales", "Payment")
+    CashMovement = apps.get_model("sales", "CashMovement")
+
+    money = DecimalField(max_digits=14, decimal_places=2)
+
+    def total(queryset, expression, output_field, default, session_lookup="session_id"):
+        subquery = (
+            queryset.filter(**{session_lookup: OuterRef("pk")})
+            .values(session_lookup)
+            .annotate(total=expression)
+            .values("total")
+        )
+        return Coalesce(Subquery(subquery, output_field=output_field), Value(default), output_field=output_field)
+
+    completed = Sale.objects.filter(status="completed")
+    refunded = Sale.objects.filter(status="refunded")
+    paid = Payment.objects.filter(sale__status="completed")
+
+    counters = {
+        "sales_count": total(completed, Count("id"), IntegerField(), 0),
+        "sales_amount": total(completed, Sum("total_amount"), money, Decimal("0.00")),
+        "items_quantity": total(
+            SaleItem.objects.filter(sale__status="completed"),
+            Sum("quantity"),
+            DecimalField(max_digits=14, decimal_places=3),
+            Decimal("0.000"),
+            session_lookup="sale__session_id",
+        ),
+        "refunds_count": total(refunded, Count("id"), IntegerField(), 0),
+        "refunds_amount": total(refunded, Sum("total_amount"), money, Decimal("0.00")),
+        "cash_in_amount": total(
+            CashMovement.objects.filter(movement_type="cash_in"), Sum("amount"), money, Decimal("0.00")
+        ),
+        "cash_out_amount": total(
+            CashMovement.objects.filter(movement_type="cash_out"), Sum("amount"), money, Decimal("0.00")
+        ),
+    }
+    known = [method for method in PAYMENT_COUNTER_FIELDS if method != "other"]
+    for method, field in PAYMENT_COUNTER_FIELDS.items():
+        if method == "other":
+            payments = paid.filter(~Q(payment_method__in=known))
+        else:
+            payments = paid.filter(payment_method=method)
+        counters[field] = total(payments, Sum("amount"), money, Decimal("0.00"))
+
+    CashierSession.objects.update(**counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0011_sale_client_uuid"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cashiersession",
+            name="card_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                max_digits=14,
+                verbose_name="Оплачено картой",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="cash_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                max_digits=14,
+                verbose_name="Оплачено наличными",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="cash_in_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                max_digits=14,
+                verbose_name="Внесено наличных",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="cash_out_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                max_digits=14,
+                verbose_name="Изъято наличных",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="credit_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                max_digits=14,
+                verbose_name="Продано в кредит",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="items_quantity",
+            field=models.DecimalField(
+                decimal_places=3,
+                default=0,
+                max_digits=14,
+                verbose_name="Продано товаров",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="online_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                max_digits=14,
+                verbose_name="Оплачено онлайн",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="other_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                max_digits=14,
+                verbose_name="Оплачено другими способами",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="refunds_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                max_digits=14,
+                verbose_name="Сумма возвратов",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="refunds_count",
+            field=models.IntegerField(default=0, verbose_name="Количество возвратов"),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="sales_amount",
+            field=models.DecimalField(
+                decimal_places=2, default=0, max_digits=14, verbose_name="Сумма продаж"
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="sales_count",
+            field=models.IntegerField(default=0, verbose_name="Количество продаж"),
+        ),
+        migrations.AddField(
+            model_name="cashiersession",
+            name="transfer_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                max_digits=14,
+                verbose_name="Оплачено переводом",
+            ),
+        ),
+        migrations.RunPython(fill_session_counters, migrations.RunPython.noop),
+    ]
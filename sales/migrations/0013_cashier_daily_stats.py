@@ -0,0 +1,95 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0012_cashier_session_counters"),
+        ("users", "0005_add_staff_role"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CashierDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="День")),
+                (
+                    "sales_count",
+                    models.IntegerField(default=0, verbose_name="Количество продаж"),
+                ),
+                (
+                    "sales_amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Сумма продаж",
+                    ),
+                ),
+                (
+                    "cash_amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Оплачено наличными",
+                    ),
+                ),
+                (
+                    "card_amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Оплачено картой",
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Дата обновления"),
+                ),
+                (
+                    "cashier",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="daily_stats",
+                        to="users.employee",
+                        verbose_name="Кассир",
+                    ),
+                ),
+                (
+                    "session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="cashier_daily_stats",
+                        to="sales.cashiersession",
+                        verbose_name="Кассовая смена",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Статистика кассира за день",
+                "verbose_name_plural": "Статистика кассиров по дням",
+                "db_table": "sales_cashier_daily_stats",
+                "indexes": [
+                    models.Index(
+                        fields=["date", "cashier"], name="sales_cashi_date_6adba9_idx"
+                    )
+                ],
+                "unique_together": {("date", "cashier", "session")},
+            },
+        ),
+    ]
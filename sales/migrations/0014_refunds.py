@@ -0,0 +1,241 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:25
+
+from decimal import ROUND_HALF_UP, Decimal
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_legacy_refunds(apps, schema_editor):
+    """
+    Возвраты для продаж, возвращённых целиком до появления Refund:
+    все позиции и платежи с отрицательной суммой, как у sales.refunds.
+
+    Счётчики смен у таких продаж уже уменьшены, поэтому после
+    заполнения они сходятся с пересчётом reconcile_session_counters.
+    """
+    Sale = apps.get_model("sales", "Sale")
+    Refund = apps.get_model("sales", "Refund")
+    RefundItem = apps.get_model("sales", "RefundItem")
+    Payment = apps.get_model("sales", "Payment")
+
+    sales = Sale.objects.filter(status="refunded", refunds__isnull=True).prefetch_related("items")
+    for sale in sales.iterator(chunk_size=500):
+        refund = Refund.objects.create(
+            sale_id=sale.pk,
+            session_id=sale.session_id,
+            cashier_id=sale.cashier_id,
+            total_amount=sale.total_amount,
+            reason="Возврат всего чека",
+        )
+
+        ratio = sale.total_amount / sale.subtotal if sale.subtotal else Decimal("0")
+        items = [
+            RefundItem(
+                refund=refund,
+                sale_item_id=item.pk,
+                batch_id=item.batch_id,
+                quantity=item.quantity,
+                amount=(item.line_total * ratio).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP),
+            )
+            for item in sale.items.all()
+        ]
+        if items:
+            items[-1].amount += sale.total_amount - sum(item.amount for item in items)
+        RefundItem.objects.bulk_create(items)
+
+        paid = (
+            Payment.objects.filter(sale_id=sale.pk)
+            .values("payment_method")
+            .annotate(total=Sum("amount"))
+            .order_by("payment_method")
+        )
+        Payment.objects.bulk_create([
+            Payment(
+                sale_id=sale.pk,
+                session_id=sale.session_id,
+                refund=refund,
+                payment_method=row["payment_method"],
+                amount=-row["total"],
+                notes=f"Возврат #{refund.pk}",
+            )
+            for row in paid
+            if row["total"]
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0010_cursor_pagination_indexes"),
+        ("sales", "0013_cashier_daily_stats"),
+        ("users", "0005_add_staff_role"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Refund",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "total_amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        max_digits=12,
+                        validators=[django.core.validators.MinValueValidator(0)],
+                        verbose_name="Сумма возврата",
+                    ),
+                ),
+                ("reason", models.TextField(blank=True, verbose_name="Причина")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата возврата"
+                    ),
+                ),
+                (
+                    "cashier",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        help_text="Кто оформил возврат",
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="refunds",
+                        to="users.employee",
+                        verbose_name="Кассир",
+                    ),
+                ),
+                (
+                    "sale",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="refunds",
+                        to="sales.sale",
+                        verbose_name="Продажа",
+                    ),
+                ),
+                (
+                    "session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="refunds",
+                        to="sales.cashiersession",
+                        verbose_name="Кассовая смена",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Возврат",
+                "verbose_name_plural": "Возвраты",
+                "db_table": "sales_refund",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="refund",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="payments",
+                to="sales.refund",
+                verbose_name="Возврат",
+            ),
+        ),
+        migrations.CreateModel(
+            name="RefundItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.DecimalField(
+                        decimal_places=3,
+                        max_digits=12,
+                        validators=[django.core.validators.MinValueValidator(0)],
+                        verbose_name="Количество",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        help_text="Доля итога чека (с учётом скидки на чек)",
+                        max_digits=12,
+                        validators=[django.core.validators.MinValueValidator(0)],
+                        verbose_name="Сумма",
+                    ),
+                ),
+                (
+                    "batch",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="refund_items",
+                        to="products.productbatch",
+                        verbose_name="Партия",
+                    ),
+                ),
+                (
+                    "refund",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="sales.refund",
+                        verbose_name="Возврат",
+                    ),
+                ),
+                (
+                    "sale_item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="refund_items",
+                        to="sales.saleitem",
+                        verbose_name="Позиция продажи",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Позиция возврата",
+                "verbose_name_plural": "Позиции возвратов",
+                "db_table": "sales_refund_item",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="refund",
+            index=models.Index(fields=["sale"], name="sales_refun_sale_id_2aeaaa_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="refund",
+            index=models.Index(
+                fields=["session"], name="sales_refun_session_506e56_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="refunditem",
+            index=models.Index(
+                fields=["sale_item"], name="sales_refun_sale_it_6c83f0_idx"
+            ),
+        ),
+        migrations.RunPython(fill_legacy_refunds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0014_refunds"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sale",
+            name="version",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Номер изменения позиций и итогов чека",
+                verbose_name="Версия чека",
+            ),
+        ),
+    ]
@@ -8,7 +8,12 @@
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
+
+
+def round_money(value):
+    """Округление до копеек так же, как numeric(12, 2) в PostgreSQL (half up)"""
+    return Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
 
 class CashRegister(models.Model):
@@ -161,6 +166,96 @@ class CashierSession(models.Model):
         help_text=_('Фактическая - Ожидаемая (+ излишек, - недостача)')
     )
 
+    # Счётчики смены для отчётов (X/Z) без агрегатов по продажам.
+    # Меняются только приращениями: оплата, возврат, движение наличности
+    # (record_sales, record_cash_movement). Сверка: reconcile_session_counters
+    sales_count = models.IntegerField(
+        default=0,
+        verbose_name=_('Количество продаж')
+    )
+
+    sales_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Сумма продаж')
+    )
+
+    items_quantity = models.DecimalField(
+        max_digits=14,
+        decimal_places=3,
+        default=0,
+        verbose_name=_('Продано товаров')
+    )
+
+    refunds_count = models.IntegerField(
+        default=0,
+        verbose_name=_('Количество возвратов')
+    )
+
+    refunds_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Сумма возвратов')
+    )
+
+    cash_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Оплачено наличными')
+    )
+
+    card_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Оплачено картой')
+    )
+
+    transfer_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Оплачено переводом')
+    )
+
+    online_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Оплачено онлайн')
+    )
+
+    credit_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Продано в кредит')
+    )
+
+    other_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Оплачено другими способами')
+    )
+
+    cash_in_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Внесено наличных')
+    )
+
+    cash_out_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Изъято наличных')
+    )
+
     notes = models.TextField(
         blank=True,
         verbose_name=_('Примечания')
@@ -198,47 +293,182 @@ class CashierSession(models.Model):
         from django.utils import timezone
         return timezone.now() - self.opened_at
 
+    # Способ оплаты -> счётчик (неизвестные способы - в other_amount)
+    PAYMENT_COUNTER_FIELDS = {
+        'cash': 'cash_amount',
+        'card': 'card_amount',
+        'transfer': 'transfer_amount',
+        'online': 'online_amount',
+        'credit': 'credit_amount',
+        'other': 'other_amount',
+    }
+
+    COUNTER_FIELDS = (
+        'sales_count', 'sales_amount', 'items_quantity', 'refunds_count', 'refunds_amount',
+        *PAYMENT_COUNTER_FIELDS.values(), 'cash_in_amount', 'cash_out_amount',
+    )
+
+    def save(self, *args, **kwargs):
+        # Счётчики меняются приращениями в других транзакциях: обычное сохранение
+        # смены (закрытие, PATCH) не должно затирать их значениями из памяти
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def total_sales(self):
         """Общая сумма продаж за смену"""
-        from django.db.models import Sum
-        total = self.sales.filter(status='completed').aggregate(
-            total=Sum('total_amount')
-        )['total']
-        return total or Decimal('0.00')
+        return self.sales_amount
 
     @property
     def cash_sales(self):
         """Сумма продаж наличными"""
-        from django.db.models import Sum
-        total = self.payments.filter(
-            payment_method='cash',
-            sale__status='completed'
-        ).aggregate(total=Sum('amount'))['total']
-        return total or Decimal('0.00')
+        return self.cash_amount
 
     @property
     def card_sales(self):
         """Сумма продаж по карте"""
-        from django.db.models import Sum
-        total = self.payments.filter(
-            payment_method='card',
-            sale__status='completed'
-        ).aggregate(total=Sum('amount'))['total']
-        return total or Decimal('0.00')
+        return self.card_amount
+
+    def payment_totals(self):
+        """Суммы по способам оплаты (только ненулевые)"""
+        return [
+            {'payment_method': method, 'total': getattr(self, field)}
+            for method, field in self.PAYMENT_COUNTER_FIELDS.items()
+            if getattr(self, field)
+        ]
+
+    @classmethod
+    def record_sales(cls, session_id, count, amount, quantity, payments, refund=False):
+        """
+        Изменить счётчики продаж смены одним UPDATE (в транзакции оплаты/возврата).
+
+        Args:
+            session_id: ID смены
+            count: количество продаж (для возврата: 1, если чек возвращён полностью, иначе 0)
+            amount: сумма продаж (total_amount) или возврата
+            quantity: количество товара
+            payments: {payment_method: сумма}
+            refund: один возврат (Refund) - вычитается из продаж и добавляется к возвратам
+        """
+        from django.db.models import F
+
+        sign = -1 if refund else 1
+        by_field = {}
+        for method, total in payments.items():
+            field = cls.PAYMENT_COUNTER_FIELDS.get(method, 'other_amount')
+            by_field[field] = by_field.get(field, Decimal('0.00')) + Decimal(str(total))
+
+        updates = {
+            'sales_count': F('sales_count') + sign * count,
+            'sales_amount': F('sales_amount') + sign * Decimal(str(amount)),
+            'items_quantity': F('items_quantity') + sign * Decimal(str(quantity)),
+        }
+        for field, total in by_field.items():
+            updates[field] = F(field) + sign * total
+        if refund:
+            updates['refunds_count'] = F('refunds_count') + 1
+            updates['refunds_amount'] = F('refunds_amount') + Decimal(str(amount))
+
+        cls.objects.filter(pk=session_id).update(**updates)
+
+    @classmethod
+    def record_cash_movement(cls, session_id, movement_type, amount):
+        """Изменить счётчик внесений/изъятий смены (amount < 0 - отмена движения)"""
+        from django.db.models import F
+
+        field = 'cash_in_amount' if movement_type == 'cash_in' else 'cash_out_amount'
+        cls.objects.filter(pk=session_id).update(**{field: F(field) + Decimal(str(amount))})
+
+    @classmethod
+    def with_expected_counters(cls, queryset=None):
+        """
+        Аннотирует смены счётчиками, пересчитанными по продажам, платежам
+        и движениям наличности: expected_<счётчик> для каждого из COUNTER_FIELDS.
+        """
+        from django.db.models import Count, DecimalField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+        from django.db.models.functions import Coalesce
+
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        money = DecimalField(max_digits=14, decimal_places=2)
+        quantity = DecimalField(max_digits=14, decimal_places=3)
+
+        def total(queryset, expression, output_field, default):
+            subquery = (
+                queryset.filter(session_id=OuterRef('pk'))
+                .values('session_id')
+                .annotate(total=expression)
+                .values('total')
+            )
+            return Coalesce(Subquery(subquery, output_field=output_field), Value(default), output_field=output_field)
+
+        def quantity_total(queryset, session_lookup):
+            return Coalesce(
+                Subquery(
+                    queryset.filter(**{session_lookup: OuterRef('pk')})
+                    .values(session_lookup)
+                    .annotate(total=Sum('quantity'))
+                    .values('total'),
+                    output_field=quantity
+                ),
+                Value(Decimal('0.000')),
+                output_field=quantity
+            )
+
+        # Частичные возвраты не меняют статус продажи, но уменьшают продажи смены;
+        # у полностью возвращённых продаж в деньгах остаются платежи минус возвраты
+        completed = Sale.objects.filter(status='completed')
+        partial_refunds = Refund.objects.filter(sale__status='completed')
+        paid = Payment.objects.filter(sale__status__in=('completed', 'refunded'))
+
+        annotations = {
+            'expected_sales_count': total(completed, Count('id'), IntegerField(), 0),
+            'expected_sales_amount': (
+                total(completed, Sum('total_amount'), money, Decimal('0.00'))
+                - total(partial_refunds, Sum('total_amount'), money, Decimal('0.00'))
+            ),
+            'expected_items_quantity': (
+                quantity_total(SaleItem.objects.filter(sale__status='completed'), 'sale__session_id')
+                - quantity_total(RefundItem.objects.filter(refund__sale__status='completed'), 'refund__session_id')
+            ),
+            'expected_refunds_count': total(Refund.objects.all(), Count('id'), IntegerField(), 0),
+            'expected_refunds_amount': total(Refund.objects.all(), Sum('total_amount'), money, Decimal('0.00')),
+            'expected_cash_in_amount': total(
+                CashMovement.objects.filter(movement_type='cash_in'), Sum('amount'), money, Decimal('0.00')
+            ),
+            'expected_cash_out_amount': total(
+                CashMovement.objects.filter(movement_type='cash_out'), Sum('amount'), money, Decimal('0.00')
+            ),
+        }
+        known = [method for method in cls.PAYMENT_COUNTER_FIELDS if method != 'other']
+        for method, field in cls.PAYMENT_COUNTER_FIELDS.items():
+            if method == 'other':
+                payments = paid.filter(~Q(payment_method__in=known))
+            else:
+                payments = paid.filter(payment_method=method)
+            annotations[f'expected_{field}'] = total(payments, Sum('amount'), money, Decimal('0.00'))
+
+        return queryset.annotate(**annotations)
+
+    @classmethod
+    def find_counters_drift(cls, queryset=None):
+        """Смены, у которых счётчики расходятся с продажами и движениями наличности"""
+        from django.db.models import F, Q
+
+        condition = Q()
+        for field in cls.COUNTER_FIELDS:
+            condition |= ~Q(**{field: F(f'expected_{field}')})
+        return cls.with_expected_counters(queryset).filter(condition)
 
     def calculate_expected_cash(self):
         """Рассчитать ожидаемую сумму наличных"""
         # Начальная сумма + продажи наличными + внесения - изъятия
-        cash_in = self.cash_movements.filter(movement_type='cash_in').aggregate(
-            total=models.Sum('amount')
-        )['total'] or Decimal('0.00')
-
-        cash_out = self.cash_movements.filter(movement_type='cash_out').aggregate(
-            total=models.Sum('amount')
-        )['total'] or Decimal('0.00')
-
-        expected = self.opening_cash + self.cash_sales + cash_in - cash_out
+        expected = self.opening_cash + self.cash_amount + self.cash_in_amount - self.cash_out_amount
         self.expected_cash = expected
         return expected
 
@@ -246,6 +476,7 @@ class CashierSession(models.Model):
         """Закрыть смену"""
         from django.utils import timezone
 
+        self.refresh_from_db(fields=self.COUNTER_FIELDS)
         self.calculate_expected_cash()
         self.actual_cash = Decimal(str(actual_cash_amount))
         self.cash_difference = self.actual_cash - self.expected_cash
@@ -287,6 +518,8 @@ class Sale(models.Model):
         db_constraint=False  # Отключаем FK constraint для multi-tenant
     )
 
+    # На секционированной таблице (core.partitioning) индекс не уникальный,
+    # уникальность обеспечивает ReceiptCounter
     receipt_number = models.CharField(
         max_length=50,
         unique=True,
@@ -301,6 +534,17 @@ class Sale(models.Model):
         verbose_name=_('Статус')
     )
 
+    # UUID, который касса генерирует для продажи, пробитой без связи
+    # На секционированной таблице индекс не уникальный: повторную загрузку
+    # отсекает sales.offline под блокировкой UUID
+    client_uuid = models.UUIDField(
+        null=True,
+        blank=True,
+        unique=True,
+        verbose_name=_('UUID кассы'),
+        help_text=_('Идентификатор офлайн продажи для защиты от повторной загрузки')
+    )
+
     # Клиент (опционально)
     customer = models.ForeignKey(
         'customers.Customer',
@@ -373,6 +617,14 @@ class Sale(models.Model):
         verbose_name=_('Примечания')
     )
 
+    # Растёт при каждом изменении позиций или итогов чека: касса сверяет его
+    # с локальной копией корзины, получив ответ response=compact
+    version = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Версия чека'),
+        help_text=_('Номер изменения позиций и итогов чека')
+    )
+
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name=_('Дата создания')
@@ -393,6 +645,7 @@ class Sale(models.Model):
             models.Index(fields=['session', 'status']),
             models.Index(fields=['receipt_number']),
             models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['-created_at', '-id']),  # Курсорная пагинация
         ]
 
     def __str__(self):
@@ -421,13 +674,20 @@ class Sale(models.Model):
         return total or 0
 
     def calculate_totals(self):
-        """Рассчитать итоговые суммы"""
-        # Сумма всех позиций
-        self.subtotal = sum(item.line_total for item in self.items.all())
+        """
+        Полный пересчёт итоговых сумм по всем позициям.
+
+        Для изменения одной позиции используйте apply_line_delta:
+        он не читает позиции и не зависит от размера чека.
+        """
+        from django.db.models import Sum
+
+        # Сумма всех позиций (агрегат в БД)
+        self.subtotal = round_money(self.items.aggregate(total=Sum('line_total'))['total'] or 0)
 
         # Применяем скидку
         if self.discount_percent > 0:
-            self.discount_amount = self.subtotal * (self.discount_percent / 100)
+            self.discount_amount = round_money(self.subtotal * self.discount_percent / 100)
 
         # Итого с учётом скидки
         amount_after_discount = self.subtotal - self.discount_amount
@@ -437,20 +697,171 @@ class Sale(models.Model):
 
         # Финальная сумма
         self.total_amount = amount_after_discount + self.tax_amount
+        self.version += 1
         self.save()
 
+    def apply_line_delta(self, delta, cashier_id=None):
+        """
+        Изменить итоги чека на delta (изменение суммы позиций) одним UPDATE
+        и увеличить версию чека.
+
+        Вызывается в той же транзакции, что и запись SaleItem.
+        Все значения считаются в SQL от текущих значений строки,
+        поэтому параллельные изменения не теряются, а результат совпадает
+        с calculate_totals без чтения позиций. Новые итоги и версия
+        возвращаются тем же запросом (UPDATE ... RETURNING) и записываются
+        в объект: значения, прочитанные до UPDATE, могли устареть, если чек
+        менялся с другого устройства.
+
+        Args:
+            delta (Decimal): Новая сумма позиций минус старая
+            cashier_id: Заполнить кассира, если в чеке его ещё нет
+
+        Returns:
+            bool: False если чек уже не pending (ничего не изменено)
+        """
+        from django.db import connection
+
+        delta = round_money(delta)
+        table = connection.ops.quote_name(self._meta.db_table)
+        with connection.cursor() as cursor:
+            # В SET справа - значения строки до UPDATE (PostgreSQL и SQLite)
+            cursor.execute(
+                f"""
+                UPDATE {table} SET
+                    subtotal = subtotal + %s,
+                    discount_amount = CASE
+                        WHEN discount_percent > 0 THEN ROUND((subtotal + %s) * discount_percent / 100, 2)
+                        ELSE discount_amount
+                    END,
+                    total_amount = subtotal + %s - CASE
+                        WHEN discount_percent > 0 THEN ROUND((subtotal + %s) * discount_percent / 100, 2)
+                        ELSE discount_amount
+                    END + tax_amount,
+                    version = version + 1,
+                    cashier_id = COALESCE(cashier_id, %s)
+                WHERE id = %s AND status = 'pending'
+                RETURNING subtotal, discount_amount, total_amount, version, cashier_id
+                """,
+                [delta, delta, delta, delta, cashier_id, self.pk]
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            return False
+
+        subtotal, discount_amount, total_amount, self.version, self.cashier_id = row
+        money = self._meta.get_field('subtotal')
+        self.subtotal = round_money(money.to_python(subtotal))
+        self.discount_amount = round_money(money.to_python(discount_amount))
+        self.total_amount = round_money(money.to_python(total_amount))
+        return True
+
+    @classmethod
+    def with_expected_totals(cls, queryset=None):
+        """
+        Аннотирует продажи суммами, пересчитанными по позициям:
+        expected_subtotal, expected_discount, expected_total.
+        """
+        from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+        from django.db.models.functions import Coalesce, Round
+
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        money = DecimalField(max_digits=12, decimal_places=2)
+        items_total = (
+            SaleItem.objects.filter(sale_id=OuterRef('pk'))
+            .values('sale_id')
+            .annotate(total=Sum('line_total'))
+            .values('total')
+        )
+        return queryset.annotate(
+            expected_subtotal=Round(
+                Coalesce(Subquery(items_total, output_field=money), Value(Decimal('0.00')), output_field=money),
+                2,
+                output_field=money,
+            ),
+        ).annotate(
+            expected_discount=Case(
+                When(
+                    discount_percent__gt=0,
+                    then=Round(F('expected_subtotal') * F('discount_percent') / Value(100), 2, output_field=money)
+                ),
+                default=F('discount_amount'),
+                output_field=money,
+            ),
+        ).annotate(
+            expected_total=models.ExpressionWrapper(
+                F('expected_subtotal') - F('expected_discount') + F('tax_amount'),
+                output_field=money,
+            ),
+        )
+
+    @classmethod
+    def find_totals_drift(cls, queryset=None):
+        """
+        Продажи, у которых сохранённые итоги расходятся с позициями.
+
+        Итоги ведутся приращениями (apply_line_delta), поэтому расхождение
+        означает запись в обход него - такие чеки нужно проверить и пересчитать.
+        """
+        from django.db.models import F, Q
+
+        return cls.with_expected_totals(queryset).filter(
+            ~Q(subtotal=F('expected_subtotal'))
+            | ~Q(discount_amount=F('expected_discount'))
+            | ~Q(total_amount=F('expected_total'))
+        )
+
+    def verify_totals(self):
+        """
+        Сверить итоги чека с позициями.
+
+        Returns:
+            dict: {поле: (сохранено, ожидается)} для расходящихся полей,
+                  пустой dict если всё сходится
+        """
+        expected = Sale.with_expected_totals(Sale.objects.filter(pk=self.pk)).values(
+            'subtotal', 'discount_amount', 'total_amount',
+            'expected_subtotal', 'expected_discount', 'expected_total'
+        ).first()
+        if expected is None:
+            return {}
+
+        drift = {}
+        for field, expected_field in (
+            ('subtotal', 'expected_subtotal'),
+            ('discount_amount', 'expected_discount'),
+            ('total_amount', 'expected_total'),
+        ):
+            stored = round_money(expected[field])
+            actual = round_money(expected[expected_field])
+            if stored != actual:
+                drift[field] = (stored, actual)
+        return drift
+
     def complete_sale(self):
-        """Завершить продажу"""
-        from django.utils import timezone
+        """
+        Завершить продажу.
 
-        if self.status == 'pending':
-            self.status = 'completed'
-            self.completed_at = timezone.now()
-            self.save()
+        Списание всех позиций и смена статуса выполняются в одной транзакции
+        с блокировкой строки продажи (sales.checkout.complete_sale):
+        если хотя бы одной позиции не хватает остатка, продажа остаётся pending,
+        а партии не меняются (InsufficientStockError).
+        """
+        from django.db import transaction
+        from sales.checkout import complete_sale
 
-            # Создаём резервирования для товаров
-            for item in self.items.all():
-                item.create_stock_reservation()
+        if self.status != 'pending':
+            return
+
+        with transaction.atomic():
+            locked = Sale.objects.select_for_update().get(pk=self.pk)
+            if locked.status == 'pending':
+                complete_sale(locked)
+            self.status = locked.status
+            self.completed_at = locked.completed_at
 
 
 class SaleItem(models.Model):
@@ -522,7 +933,8 @@ class SaleItem(models.Model):
         help_text=_('quantity * unit_price - discount')
     )
 
-    # Резервирование товара
+    # Резервирование товара (только у продаж, оплаченных до прямого списания,
+    # новые продажи хранят движение товара в batch/quantity позиции)
     reservation = models.ForeignKey(
         'products.StockReservation',
         on_delete=models.SET_NULL,
@@ -553,30 +965,128 @@ class SaleItem(models.Model):
 
     def save(self, *args, **kwargs):
         """Пересчитываем line_total при сохранении"""
-        self.line_total = (self.quantity * self.unit_price) - self.discount_amount
+        self.line_total = round_money((self.quantity * self.unit_price) - self.discount_amount)
         super().save(*args, **kwargs)
 
-    def create_stock_reservation(self):
-        """Создать резервирование товара"""
-        from products.models import StockReservation
-
-        if not self.reservation:
-            # Пытаемся найти Employee через User кассира
-            # Поскольку в CashierSession нет прямой связи с Employee,
-            # а только cashier_name (строка), оставляем created_by = None
-            reservation = StockReservation.objects.create(
-                product=self.product,
-                batch=self.batch,
-                quantity=self.quantity,
-                order_reference=self.sale.receipt_number,
-                status='active',
-                created_by=None  # TODO: Добавить связь когда CashierSession будет иметь FK к Employee
-            )
-            self.reservation = reservation
-            self.save()
 
-            # Сразу завершаем резервирование, чтобы списать товар со склада
-            reservation.complete()
+class Refund(models.Model):
+    """
+    Возврат по продаже - весь чек или выбранные позиции и количества.
+
+    Продажа остаётся завершённой, пока возвращено не всё: тогда её статус
+    становится refunded. Товар возвращается в партии списания, деньги -
+    платежами с отрицательной суммой (Payment.refund). Оформление: sales.refunds.
+    """
+
+    sale = models.ForeignKey(
+        Sale,
+        on_delete=models.PROTECT,
+        related_name='refunds',
+        verbose_name=_('Продажа')
+    )
+
+    # Смена продажи: возврат уменьшает её счётчики
+    session = models.ForeignKey(
+        CashierSession,
+        on_delete=models.PROTECT,
+        related_name='refunds',
+        verbose_name=_('Кассовая смена')
+    )
+
+    cashier = models.ForeignKey(
+        'users.Employee',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='refunds',
+        verbose_name=_('Кассир'),
+        help_text=_('Кто оформил возврат'),
+        db_constraint=False  # Отключаем FK constraint для multi-tenant
+    )
+
+    total_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        validators=[MinValueValidator(0)],
+        verbose_name=_('Сумма возврата')
+    )
+
+    reason = models.TextField(
+        blank=True,
+        verbose_name=_('Причина')
+    )
+
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Дата возврата')
+    )
+
+    class Meta:
+        db_table = 'sales_refund'
+        verbose_name = _('Возврат')
+        verbose_name_plural = _('Возвраты')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['sale']),
+            models.Index(fields=['session']),
+        ]
+
+    def __str__(self):
+        return f"Возврат по {self.sale.receipt_number} - {self.total_amount}"
+
+
+class RefundItem(models.Model):
+    """Возвращённое количество позиции чека"""
+
+    refund = models.ForeignKey(
+        Refund,
+        on_delete=models.CASCADE,
+        related_name='items',
+        verbose_name=_('Возврат')
+    )
+
+    sale_item = models.ForeignKey(
+        SaleItem,
+        on_delete=models.PROTECT,
+        related_name='refund_items',
+        verbose_name=_('Позиция продажи')
+    )
+
+    # Партия, в которую вернули товар (партия списания позиции)
+    batch = models.ForeignKey(
+        'products.ProductBatch',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='refund_items',
+        verbose_name=_('Партия')
+    )
+
+    quantity = models.DecimalField(
+        max_digits=12,
+        decimal_places=3,
+        validators=[MinValueValidator(0)],
+        verbose_name=_('Количество')
+    )
+
+    amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        validators=[MinValueValidator(0)],
+        verbose_name=_('Сумма'),
+        help_text=_('Доля итога чека (с учётом скидки на чек)')
+    )
+
+    class Meta:
+        db_table = 'sales_refund_item'
+        verbose_name = _('Позиция возврата')
+        verbose_name_plural = _('Позиции возвратов')
+        indexes = [
+            models.Index(fields=['sale_item']),
+        ]
+
+    def __str__(self):
+        return f"{self.sale_item_id} x {self.quantity} = {self.amount}"
 
 
 class Payment(models.Model):
@@ -609,12 +1119,23 @@ class Payment(models.Model):
         verbose_name=_('Кассовая смена')
     )
 
+    # Возврат денег: платёж с отрицательной суммой, оформленный возвратом
+    refund = models.ForeignKey(
+        Refund,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='payments',
+        verbose_name=_('Возврат')
+    )
+
     payment_method = models.CharField(
         max_length=20,
         choices=PAYMENT_METHOD_CHOICES,
         verbose_name=_('Способ оплаты')
     )
 
+    # Отрицательная только у платежей возврата (пишутся bulk_create, без валидации)
     amount = models.DecimalField(
         max_digits=12,
         decimal_places=2,
@@ -766,3 +1287,134 @@ class CashMovement(models.Model):
     def __str__(self):
         sign = '+' if self.movement_type == 'cash_in' else '-'
         return f"{sign}{self.amount} - {self.get_reason_display()}"
+
+    def save(self, *args, **kwargs):
+        """Вместе с движением меняет счётчик внесений/изъятий смены"""
+        from django.db import transaction
+
+        with transaction.atomic():
+            if not self._state.adding:
+                previous = CashMovement.objects.filter(pk=self.pk).values(
+                    'session_id', 'movement_type', 'amount'
+                ).first()
+                if previous:
+                    CashierSession.record_cash_movement(
+                        previous['session_id'], previous['movement_type'], -previous['amount']
+                    )
+            super().save(*args, **kwargs)
+            CashierSession.record_cash_movement(self.session_id, self.movement_type, self.amount)
+
+    def delete(self, *args, **kwargs):
+        from django.db import transaction
+
+        with transaction.atomic():
+            CashierSession.record_cash_movement(self.session_id, self.movement_type, -self.amount)
+            return super().delete(*args, **kwargs)
+
+
+class ReceiptCounter(models.Model):
+    """
+    Счётчик номеров чеков.
+
+    Отдельная строка на префикс (код кассы) и день: кассы не блокируют
+    друг друга, а нумерация каждый день начинается с 1.
+    Номера выдаются через sales.receipts.allocate_receipt_number.
+    """
+
+    prefix = models.CharField(
+        max_length=20,
+        verbose_name=_('Префикс'),
+        help_text=_('Код кассы в номере чека')
+    )
+
+    day = models.DateField(
+        verbose_name=_('День')
+    )
+
+    last_number = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Последний номер')
+    )
+
+    class Meta:
+        db_table = 'sales_receipt_counter'
+        verbose_name = _('Счётчик чеков')
+        verbose_name_plural = _('Счётчики чеков')
+        unique_together = [['prefix', 'day']]
+
+    def __str__(self):
+        return f"{self.prefix} {self.day}: {self.last_number}"
+
+
+class CashierDailyStats(models.Model):
+    """
+    Продажи кассира за день в одной смене (для рейтинга кассиров).
+
+    Строка на день, кассира и смену: суммы по дням складываются,
+    а количество смен за период - это число разных session.
+    Ведётся приращениями при оплате и возврате (sales.stats.record_cashier_sales),
+    день - локальная дата оплаты продажи (completed_at, как фильтр cashier-stats).
+    Пересборка: rebuild_cashier_daily_stats.
+    """
+
+    date = models.DateField(
+        verbose_name=_('День')
+    )
+
+    cashier = models.ForeignKey(
+        'users.Employee',
+        on_delete=models.PROTECT,
+        related_name='daily_stats',
+        verbose_name=_('Кассир'),
+        db_constraint=False  # Отключаем FK constraint для multi-tenant
+    )
+
+    session = models.ForeignKey(
+        CashierSession,
+        on_delete=models.CASCADE,
+        related_name='cashier_daily_stats',
+        verbose_name=_('Кассовая смена')
+    )
+
+    sales_count = models.IntegerField(
+        default=0,
+        verbose_name=_('Количество продаж')
+    )
+
+    sales_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Сумма продаж')
+    )
+
+    cash_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Оплачено наличными')
+    )
+
+    card_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Оплачено картой')
+    )
+
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('Дата обновления')
+    )
+
+    class Meta:
+        db_table = 'sales_cashier_daily_stats'
+        verbose_name = _('Статистика кассира за день')
+        verbose_name_plural = _('Статистика кассиров по дням')
+        unique_together = [['date', 'cashier', 'session']]
+        indexes = [
+            models.Index(fields=['date', 'cashier']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} кассир #{self.cashier_id}: {self.sales_amount}"
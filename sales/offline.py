@@ -0,0 +1,505 @@
+"""
+Загрузка продаж, пробитых кассой без связи (офлайн очередь).
+
+Касса присылает сразу пачку готовых чеков (позиции, платежи, клиент)
+с UUID, сгенерированным на кассе. Повторная загрузка того же UUID
+не создаёт вторую продажу, а возвращает уже созданную.
+
+Чеки записываются пачками по chunk_size, каждая пачка - одна транзакция:
+
+1. SELECT ... FOR UPDATE партий всех товаров пачки (в порядке id, как в sales.checkout),
+   затем блокировка UUID чеков (pg_advisory_xact_lock) и повторная проверка client_uuid
+2. распределение по партиям (FEFO) в памяти; чек, которому не хватает
+   остатка, отклоняется целиком, остальные чеки пачки записываются
+3. номера чеков одним запросом (sales.receipts.allocate_receipt_numbers)
+4. bulk_create продаж, позиций и платежей
+5. UPDATE партий одним запросом (products.stock.deduct_allocations)
+6. UPDATE счётчиков смены (CashierSession.record_sales)
+7. UPSERT сводки кассиров за день (sales.stats.record_cashier_sales)
+8. UPSERT дневного отчёта аналитики (analytics.daily_report.record_daily_report)
+
+Аналитика ставится в очередь пересчёта после коммита один раз на пачку
+(analytics.signals.refresh_sales_analytics), т.к. bulk_create не вызывает post_save.
+"""
+
+import uuid
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from analytics.daily_report import record_daily_report, sale_delta
+from sales.checkout import CheckoutError, _lock_batches, build_payments
+from sales.live import publish_sales_uploaded
+from sales.models import CashierSession, Sale, SaleItem, Payment, round_money
+from sales.receipts import allocate_receipt_numbers
+from sales.stats import record_cashier_sales, sale_stats_row
+
+OFFLINE_CHUNK_SIZE = 100
+
+# Больше за один запрос не принимаем: касса досылает остаток следующим запросом
+MAX_OFFLINE_SALES = 1000
+
+
+class OfflineSaleError(Exception):
+    """Чек из пачки отклонён (остальные чеки пачки это не затрагивает)"""
+
+    def __init__(self, message, code='invalid'):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def _decimal(value, field, default=None):
+    if value in (None, ''):
+        if default is None:
+            raise OfflineSaleError(f'Не указано поле {field}')
+        return default
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError, TypeError):
+        raise OfflineSaleError(f'Некорректное значение {field}: {value}')
+
+
+def _optional_decimal(value, field):
+    if value in (None, ''):
+        return None
+    return _decimal(value, field)
+
+
+def _int(value, field):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        raise OfflineSaleError(f'Некорректное значение {field}: {value}')
+
+
+def _parse_sale(data):
+    """Проверяет формат одного чека и приводит значения к нужным типам"""
+    if not isinstance(data, dict):
+        raise OfflineSaleError('Чек должен быть объектом')
+
+    try:
+        client_uuid = uuid.UUID(str(data.get('client_uuid')))
+    except (ValueError, TypeError, AttributeError):
+        raise OfflineSaleError('Некорректный client_uuid')
+
+    raw_items = data.get('items') or []
+    if not isinstance(raw_items, list):
+        raise OfflineSaleError('Позиции должны быть списком')
+
+    items = []
+    for item in raw_items:
+        if not isinstance(item, dict):
+            raise OfflineSaleError('Позиция должна быть объектом')
+        product_id = _int(item.get('product_id') or item.get('product'), 'product_id')
+        if not product_id:
+            raise OfflineSaleError('Не указан товар позиции')
+        quantity = _decimal(item.get('quantity'), 'quantity')
+        if quantity <= 0:
+            raise OfflineSaleError('Количество должно быть больше 0')
+        items.append({
+            'product_id': product_id,
+            'batch_id': _int(item.get('batch_id') or item.get('batch'), 'batch_id'),
+            'quantity': quantity,
+            'unit_price': _optional_decimal(item.get('unit_price'), 'unit_price'),
+            'discount_amount': _decimal(item.get('discount_amount'), 'discount_amount', Decimal('0.00')),
+        })
+    if not items:
+        raise OfflineSaleError('Нельзя завершить продажу без товаров')
+
+    raw_payments = data.get('payments') or []
+    if not isinstance(raw_payments, list):
+        raise OfflineSaleError('Платежи должны быть списком')
+
+    # Суммы приводятся здесь, чтобы build_payments получил уже проверенные значения
+    payments = []
+    for payment in raw_payments:
+        if not isinstance(payment, dict):
+            raise OfflineSaleError('Платёж должен быть объектом')
+        # bulk_create не проверяет choices: неизвестный способ оплаты
+        # попал бы в БД (а пустой - уронил бы всю пачку на NOT NULL)
+        if payment.get('payment_method') not in dict(Payment.PAYMENT_METHOD_CHOICES):
+            raise OfflineSaleError(
+                f'Неизвестный способ оплаты: {payment.get("payment_method")}',
+                code='invalid_payment'
+            )
+        payments.append({
+            **payment,
+            'amount': _decimal(payment.get('amount'), 'amount', Decimal('0')),
+            'received_amount': _optional_decimal(payment.get('received_amount'), 'received_amount'),
+        })
+
+    completed_at = data.get('completed_at')
+    if completed_at:
+        completed_at = parse_datetime(str(completed_at))
+        if completed_at is None:
+            raise OfflineSaleError('Некорректная дата completed_at')
+        if timezone.is_naive(completed_at):
+            completed_at = timezone.make_aware(completed_at)
+
+    return {
+        'client_uuid': client_uuid,
+        'items': items,
+        'payments': payments,
+        'customer_id': _int(data.get('customer_id') or data.get('customer'), 'customer_id'),
+        'customer_name': data.get('customer_name', ''),
+        'customer_phone': data.get('customer_phone', ''),
+        'discount_percent': _decimal(data.get('discount_percent'), 'discount_percent', Decimal('0.00')),
+        'notes': data.get('notes', ''),
+        'completed_at': completed_at or timezone.now(),
+    }
+
+
+def _tracks_stock(product):
+    inventory = getattr(product, 'inventory', None)
+    return inventory is None or inventory.track_inventory
+
+
+def _allocate_sale(parsed, products, by_product, remaining):
+    """
+    Распределяет позиции чека по заблокированным партиям.
+
+    remaining не меняется: вызывающий код вычитает taken, только когда
+    чек принят целиком (и по остатку, и по оплате).
+
+    Returns:
+        tuple: (list[SaleItem] - позиции (позиция, списанная из нескольких
+                партий, разбита), dict batch_id -> взятое количество)
+    """
+    taken = {}
+    lines = []
+    for line in sorted(parsed['items'], key=lambda line: line['batch_id'] is None):
+        product = products[line['product_id']]
+        pricing = getattr(product, 'pricing', None)
+        if line['unit_price'] is not None:
+            unit_price = line['unit_price']
+        elif pricing is not None:
+            unit_price = pricing.sale_price or pricing.cost_price or Decimal('0.00')
+        else:
+            unit_price = Decimal('0.00')
+
+        if not _tracks_stock(product):
+            lines.append((line, unit_price, [(None, line['quantity'])]))
+            continue
+
+        candidates = by_product.get(product.pk, [])
+        if line['batch_id']:
+            candidates = [batch for batch in candidates if batch.pk == line['batch_id']]
+
+        parts = []
+        need = line['quantity']
+        for batch in candidates:
+            take = min(remaining[batch.pk] - taken.get(batch.pk, 0), need)
+            if take <= 0:
+                continue
+            parts.append((batch, take))
+            taken[batch.pk] = taken.get(batch.pk, 0) + take
+            need -= take
+            if need <= 0:
+                break
+
+        if need > 0:
+            raise OfflineSaleError(
+                f'Недостаточно товара "{product.name}" на складе. '
+                f'Доступно: {line["quantity"] - need}, запрошено: {line["quantity"]}',
+                code='insufficient_stock'
+            )
+        lines.append((line, unit_price, parts))
+
+    # Скидка позиции остаётся на первой партии (как при обычной оплате)
+    items = []
+    for line, unit_price, parts in lines:
+        for index, (batch, quantity) in enumerate(parts):
+            discount_amount = line['discount_amount'] if index == 0 else Decimal('0.00')
+            items.append(SaleItem(
+                product_id=line['product_id'],
+                batch=batch,
+                quantity=quantity,
+                unit_price=unit_price,
+                discount_amount=discount_amount,
+                line_total=round_money(quantity * unit_price - discount_amount),
+            ))
+    return items, taken
+
+
+def _lock_client_uuids(client_uuids):
+    """
+    Блокирует UUID чеков до конца транзакции (PostgreSQL, pg_advisory_xact_lock).
+
+    Параллельная загрузка того же чека - с любой смены магазина - ждёт здесь
+    и после коммита первой видит уже записанную продажу. На секционированной
+    sales_sale (core.partitioning) уникального индекса по client_uuid нет,
+    и повторную запись отсекает только эта проверка. Ключи включают схему
+    магазина и берутся по возрастанию, поэтому загрузки с пересекающимися
+    UUID не попадают в deadlock.
+    """
+    if connection.vendor != 'postgresql' or not client_uuids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT pg_advisory_xact_lock(lock_key)
+            FROM (
+                SELECT DISTINCT hashtextextended(current_schema() || ':' || client_uuid, 0) AS lock_key
+                FROM unnest(%s::text[]) AS client_uuid
+                ORDER BY lock_key
+            ) AS lock_keys
+            """,
+            [sorted(str(client_uuid) for client_uuid in client_uuids)]
+        )
+
+
+def _build_sale(session, parsed, items, cashier_id):
+    """Продажа с итогами по позициям (без записи в БД)"""
+    subtotal = round_money(sum((item.line_total for item in items), Decimal('0.00')))
+    discount_amount = round_money(subtotal * parsed['discount_percent'] / 100)
+    return Sale(
+        session=session,
+        client_uuid=parsed['client_uuid'],
+        cashier_id=cashier_id,
+        customer_id=parsed['customer_id'],
+        customer_name=parsed['customer_name'],
+        customer_phone=parsed['customer_phone'],
+        status='completed',
+        subtotal=subtotal,
+        discount_percent=parsed['discount_percent'],
+        discount_amount=discount_amount,
+        total_amount=subtotal - discount_amount,
+        notes=parsed['notes'],
+        completed_at=parsed['completed_at'],
+    )
+
+
+def _write_chunk(session, chunk, products, cashier_id):
+    """
+    Записывает пачку чеков одной транзакцией.
+
+    Returns:
+        dict: client_uuid -> результат
+    """
+    from analytics.signals import refresh_sales_analytics
+    from products.stock import deduct_allocations
+
+    results = {}
+    with transaction.atomic():
+        by_product = _lock_batches({
+            line['product_id']
+            for parsed in chunk
+            for line in parsed['items']
+            if _tracks_stock(products[line['product_id']])
+        })
+
+        # Повторная проверка client_uuid под блокировкой UUID: параллельная
+        # загрузка тех же чеков (с этой или другой смены) ждёт здесь
+        client_uuids = [parsed['client_uuid'] for parsed in chunk]
+        _lock_client_uuids(client_uuids)
+        for client_uuid, sale_id, receipt_number in Sale.objects.filter(
+            client_uuid__in=client_uuids
+        ).values_list('client_uuid', 'id', 'receipt_number'):
+            results[client_uuid] = {
+                'client_uuid': str(client_uuid),
+                'status': 'duplicate',
+                'sale_id': sale_id,
+                'receipt_number': receipt_number,
+            }
+        chunk = [parsed for parsed in chunk if parsed['client_uuid'] not in results]
+
+        remaining = {
+            batch.pk: batch.quantity
+            for product_batches in by_product.values()
+            for batch in product_batches
+        }
+
+        accepted = []
+        for parsed in chunk:
+            try:
+                items, taken = _allocate_sale(parsed, products, by_product, remaining)
+                sale = _build_sale(session, parsed, items, cashier_id)
+                payments, total_paid = build_payments(sale, parsed['payments'])
+                if total_paid < sale.total_amount:
+                    raise OfflineSaleError(
+                        f'Недостаточно оплачено. Нужно: {sale.total_amount}, Оплачено: {total_paid}',
+                        code='underpaid'
+                    )
+            except CheckoutError as e:
+                results[parsed['client_uuid']] = _rejected(parsed['client_uuid'], e.message, 'invalid_payment')
+                continue
+            except OfflineSaleError as e:
+                results[parsed['client_uuid']] = _rejected(parsed['client_uuid'], e.message, e.code)
+                continue
+
+            # Чек принят - его партии больше недоступны следующим чекам пачки
+            for batch_id, quantity in taken.items():
+                remaining[batch_id] -= quantity
+            accepted.append((sale, items, payments))
+
+        if not accepted:
+            return results
+
+        numbers = allocate_receipt_numbers(session.cash_register.code, len(accepted))
+        for (sale, _, _), number in zip(accepted, numbers):
+            sale.receipt_number = number
+
+        Sale.objects.bulk_create([sale for sale, _, _ in accepted])
+
+        all_items = []
+        for sale, items, _ in accepted:
+            for item in items:
+                item.sale = sale
+                all_items.append(item)
+        SaleItem.objects.bulk_create(all_items)
+        Payment.objects.bulk_create([payment for _, _, payments in accepted for payment in payments])
+
+        deduct_allocations([(item.batch, item.quantity) for item in all_items if item.batch is not None])
+
+        payment_totals = defaultdict(Decimal)
+        stats_rows = []
+        report_deltas = []
+        for sale, items, payments in accepted:
+            sale_totals = defaultdict(Decimal)
+            for payment in payments:
+                sale_totals[payment.payment_method] += payment.amount
+                payment_totals[payment.payment_method] += payment.amount
+            stats_rows.append(sale_stats_row(sale, sale_totals))
+            report_deltas.append(sale_delta(
+                sale,
+                sale_totals,
+                sum(item.quantity for item in items),
+                {item.product_id for item in items}
+            ))
+        CashierSession.record_sales(
+            session.pk,
+            count=len(accepted),
+            amount=sum(sale.total_amount for sale, _, _ in accepted),
+            quantity=sum(item.quantity for item in all_items),
+            payments=payment_totals
+        )
+        record_cashier_sales(stats_rows)
+        record_daily_report(report_deltas)
+        publish_sales_uploaded(session.pk, [sale for sale, _, _ in accepted])
+
+        sale_ids = [sale.pk for sale, _, _ in accepted]
+        transaction.on_commit(lambda: refresh_sales_analytics(sale_ids))
+
+    for sale, _, _ in accepted:
+        results[sale.client_uuid] = {
+            'client_uuid': str(sale.client_uuid),
+            'status': 'created',
+            'sale_id': sale.pk,
+            'receipt_number': sale.receipt_number,
+        }
+    return results
+
+
+def _rejected(client_uuid, message, code):
+    return {
+        'client_uuid': str(client_uuid) if client_uuid else None,
+        'status': 'rejected',
+        'code': code,
+        'message': message,
+    }
+
+
+def upload_sales(session_id, sales_data, cashier_id=None, chunk_size=OFFLINE_CHUNK_SIZE):
+    """
+    Записать пачку офлайн чеков.
+
+    Args:
+        session_id: ID кассовой смены, в которой пробиты чеки
+        sales_data: [{"client_uuid": "...", "items": [{"product_id": 1, "quantity": 2}],
+                      "payments": [{"payment_method": "cash", "amount": 100}],
+                      "customer_id": 5, "completed_at": "2025-01-17T10:15:00+05:00"}]
+        cashier_id: ID кассира
+        chunk_size: чеков в одной транзакции
+
+    Returns:
+        dict: results (по одному на чек, в порядке запроса) и счётчики created/duplicate/rejected
+
+    Raises:
+        OfflineSaleError: смена не найдена или слишком много чеков
+    """
+    from customers.models import Customer
+    from products.models import Product
+
+    if len(sales_data) > MAX_OFFLINE_SALES:
+        raise OfflineSaleError(f'Не больше {MAX_OFFLINE_SALES} чеков за один запрос', code='too_many_sales')
+
+    session = CashierSession.objects.select_related('cash_register').filter(pk=session_id).first()
+    if session is None:
+        raise OfflineSaleError('Смена не найдена', code='session_not_found')
+
+    # Разбор и проверка формата; повтор UUID внутри запроса - дубликат
+    results = [None] * len(sales_data)
+    parsed_sales = []
+    positions = {}
+    for index, data in enumerate(sales_data):
+        try:
+            parsed = _parse_sale(data)
+        except OfflineSaleError as e:
+            client_uuid = data.get('client_uuid') if isinstance(data, dict) else None
+            results[index] = _rejected(client_uuid, e.message, e.code)
+            continue
+        if parsed['client_uuid'] in positions:
+            positions[parsed['client_uuid']].append(index)
+            continue
+        positions[parsed['client_uuid']] = [index]
+        parsed_sales.append(parsed)
+
+    # Уже загруженные ранее чеки
+    existing = {
+        client_uuid: (sale_id, receipt_number)
+        for client_uuid, sale_id, receipt_number in Sale.objects.filter(
+            client_uuid__in=list(positions)
+        ).values_list('client_uuid', 'id', 'receipt_number')
+    }
+
+    # Товары и клиенты всех чеков - по одному запросу
+    products = Product.objects.select_related('pricing', 'inventory').in_bulk({
+        line['product_id'] for parsed in parsed_sales for line in parsed['items']
+    })
+    customer_ids = set(Customer.objects.filter(
+        pk__in={parsed['customer_id'] for parsed in parsed_sales if parsed['customer_id']}
+    ).values_list('pk', flat=True))
+
+    outcome = {}
+    pending = []
+    for parsed in parsed_sales:
+        client_uuid = parsed['client_uuid']
+        if client_uuid in existing:
+            continue
+        missing = [line['product_id'] for line in parsed['items'] if line['product_id'] not in products]
+        if missing:
+            outcome[client_uuid] = _rejected(client_uuid, f'Товар не найден: {missing[0]}', 'product_not_found')
+        elif parsed['customer_id'] and parsed['customer_id'] not in customer_ids:
+            outcome[client_uuid] = _rejected(client_uuid, 'Клиент не найден', 'customer_not_found')
+        else:
+            pending.append(parsed)
+
+    for start in range(0, len(pending), chunk_size):
+        outcome.update(_write_chunk(session, pending[start:start + chunk_size], products, cashier_id))
+
+    for client_uuid, indexes in positions.items():
+        if client_uuid in existing:
+            sale_id, receipt_number = existing[client_uuid]
+            first = {
+                'client_uuid': str(client_uuid),
+                'status': 'duplicate',
+                'sale_id': sale_id,
+                'receipt_number': receipt_number,
+            }
+        else:
+            first = outcome[client_uuid]
+        results[indexes[0]] = first
+        for index in indexes[1:]:
+            results[index] = {**first, 'status': 'duplicate'} if first['status'] != 'rejected' else first
+
+    summary = {'created': 0, 'duplicate': 0, 'rejected': 0}
+    for result in results:
+        summary[result['status']] += 1
+
+    return {'results': results, **summary}
@@ -0,0 +1,322 @@
+"""
+Горячий путь кассы: сканирование товара в текущий чек.
+
+scan_item укладывается в SCAN_QUERY_BUDGET SQL запросов:
+
+1. SELECT товара вместе с ценой, учётом, остатком по активным партиям,
+   текущим чеком смены и позицией этого товара в чеке
+2. UPDATE итогов чека приращением (Sale.apply_line_delta), заодно проверка,
+   что чек всё ещё pending. Для первого товара в чеке вместо него два
+   запроса: номер чека (sales.receipts) и INSERT чека
+3. UPDATE количества существующей позиции или INSERT новой
+
+Всё выполняется в одной транзакции: при ошибке ни чек, ни позиция не меняются.
+Бюджет проверяется командой benchmark_scan_item.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Sum, Count, Value
+from django.db.models.functions import Coalesce, Round
+
+from sales.models import CashierSession, Sale, SaleItem, round_money
+from sales.receipts import allocate_receipt_number
+
+SCAN_QUERY_BUDGET = 4
+
+# Если учёт остатков отключён, товар считается всегда доступным
+UNTRACKED_AVAILABLE = Decimal('999999')
+
+
+class ScanError(Exception):
+    """Ошибка сканирования, которую view отдаёт клиенту как есть"""
+
+    def __init__(self, message, code='error', status_code=400, data=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status_code = status_code
+        self.data = data
+
+
+class ScanResult:
+    """Состояние чека и позиции после сканирования (без повторного чтения из БД)"""
+
+    def __init__(self, sale, item, sale_created, item_created, items_count, total_quantity):
+        self.sale = sale
+        self.item = item
+        self.sale_created = sale_created
+        self.item_created = item_created
+        self.items_count = items_count
+        self.total_quantity = total_quantity
+
+    def compact_data(self):
+        """Итоги чека и изменённая позиция для ответа response=compact"""
+        return compact_sale_data(
+            self.sale, self.item, self.items_count, self.total_quantity, item_created=self.item_created
+        )
+
+
+def compact_sale_data(sale, item, items_count, total_quantity, item_created=False, item_removed=False):
+    """
+    Ответ response=compact: итоги и версия чека плюс одна изменённая позиция.
+
+    Размер не зависит от числа позиций в чеке. Касса применяет позицию
+    к локальной корзине и сверяет version: если версия больше ожидаемой
+    не на 1, чек менялся с другого устройства - нужно перечитать его целиком.
+    """
+    return {
+        'sale': {
+            'id': sale.id,
+            'receipt_number': sale.receipt_number,
+            'status': sale.status,
+            'cashier': sale.cashier_id,
+            'version': sale.version,
+            'subtotal': str(round_money(sale.subtotal)),
+            'discount_percent': str(round_money(sale.discount_percent)),
+            'discount_amount': str(round_money(sale.discount_amount)),
+            'tax_amount': str(round_money(sale.tax_amount)),
+            'total_amount': str(round_money(sale.total_amount)),
+            'items_count': items_count,
+            'total_quantity': str(total_quantity),
+        },
+        'item': {
+            'id': item.id,
+            'product': item.product_id,
+            'product_name': item.product.name,
+            'product_sku': item.product.sku,
+            'batch': item.batch_id,
+            'quantity': str(item.quantity),
+            'unit_price': str(round_money(item.unit_price)),
+            'discount_amount': str(round_money(item.discount_amount)),
+            'line_total': str(round_money(item.line_total)),
+            'created': item_created,
+            'removed': item_removed,
+        },
+    }
+
+
+def _pending_sale_field(pending_sales, field):
+    return Subquery(pending_sales.values(field)[:1])
+
+
+def _load_scan_state(session_id, product_id, batch_id):
+    """
+    Запрос №1: всё, что нужно для сканирования, одним SELECT по товару.
+
+    Возвращает Product (с pricing и inventory) с аннотациями о смене,
+    текущем чеке и позиции, либо None если товара нет.
+    """
+    from products.models import Product, ProductBatch
+
+    pending_sales = Sale.objects.filter(
+        session_id=session_id, status='pending'
+    ).order_by('-created_at', '-id')
+
+    sale_lines = SaleItem.objects.filter(
+        sale_id=OuterRef('pending_sale_id'), product_id=OuterRef('pk')
+    )
+    if batch_id:
+        same_line = sale_lines.filter(batch_id=batch_id).order_by('id')
+    else:
+        same_line = sale_lines.filter(batch__isnull=True).order_by('id')
+
+    all_lines = SaleItem.objects.filter(sale_id=OuterRef('pending_sale_id'))
+
+    available = (
+        ProductBatch.objects.filter(product_id=OuterRef('pk'), is_active=True)
+        .values('product_id')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    in_sale = sale_lines.values('product_id').annotate(total=Sum('quantity')).values('total')
+
+    annotations = {
+        'session_open': Exists(CashierSession.objects.filter(pk=session_id, status='open')),
+        'register_code': Subquery(
+            CashierSession.objects.filter(pk=session_id).values('cash_register__code')[:1]
+        ),
+        'pending_sale_id': _pending_sale_field(pending_sales, 'id'),
+        'pending_receipt_number': _pending_sale_field(pending_sales, 'receipt_number'),
+        'pending_cashier_id': _pending_sale_field(pending_sales, 'cashier_id'),
+        'pending_subtotal': _pending_sale_field(pending_sales, 'subtotal'),
+        'pending_discount_percent': _pending_sale_field(pending_sales, 'discount_percent'),
+        'pending_discount_amount': _pending_sale_field(pending_sales, 'discount_amount'),
+        'pending_tax_amount': _pending_sale_field(pending_sales, 'tax_amount'),
+        'pending_total_amount': _pending_sale_field(pending_sales, 'total_amount'),
+        'pending_version': _pending_sale_field(pending_sales, 'version'),
+        'pending_items_count': Subquery(
+            all_lines.values('sale_id').annotate(c=Count('id')).values('c')
+        ),
+        'pending_total_quantity': Subquery(
+            all_lines.values('sale_id').annotate(total=Sum('quantity')).values('total')
+        ),
+        'available_quantity': Coalesce(Subquery(available), Value(Decimal('0'))),
+        'quantity_in_sale': Coalesce(Subquery(in_sale), Value(Decimal('0'))),
+        'line_id': Subquery(same_line.values('id')[:1]),
+        'line_quantity': Subquery(same_line.values('quantity')[:1]),
+        'line_unit_price': Subquery(same_line.values('unit_price')[:1]),
+        'line_discount_amount': Subquery(same_line.values('discount_amount')[:1]),
+        'line_created_at': Subquery(same_line.values('created_at')[:1]),
+    }
+    if batch_id:
+        annotations['batch_ok'] = Exists(
+            ProductBatch.objects.filter(pk=batch_id, product_id=OuterRef('pk'))
+        )
+
+    return (
+        Product.objects.select_related('pricing', 'inventory')
+        .filter(pk=product_id)
+        .annotate(**annotations)
+        .first()
+    )
+
+
+def _available_quantity(product):
+    """Доступное количество с учётом настроек учёта (как в старом scan_item)"""
+    inventory = getattr(product, 'inventory', None)
+    if inventory is None:
+        return Decimal('0')
+    if not inventory.track_inventory:
+        return UNTRACKED_AVAILABLE
+    return Decimal(str(product.available_quantity))
+
+
+def _unit_price(product):
+    pricing = getattr(product, 'pricing', None)
+    if pricing is None:
+        return Decimal('0.00')
+    return pricing.sale_price or pricing.cost_price or Decimal('0.00')
+
+
+def scan_item(session_id, product_id, quantity=Decimal('1'), batch_id=None, cashier_id=None):
+    """
+    Добавить товар в текущий чек смены (или открыть новый чек).
+
+    Args:
+        session_id: ID открытой кассовой смены
+        product_id: ID товара
+        quantity (Decimal): Количество (> 0)
+        batch_id: ID партии (опционально, иначе партия выбирается при оплате по FEFO)
+        cashier_id: ID кассира для статистики (заполняется, если в чеке его ещё нет)
+
+    Returns:
+        ScanResult
+
+    Raises:
+        ScanError: смена закрыта, товар/партия не найдены, не хватает остатка
+    """
+    with transaction.atomic():
+        product = _load_scan_state(session_id, product_id, batch_id)
+
+        if product is None:
+            raise ScanError('Товар не найден', code='product_not_found', status_code=404)
+        if not product.session_open:
+            raise ScanError('Смена не найдена или закрыта', code='session_not_found', status_code=404)
+        if batch_id and not product.batch_ok:
+            raise ScanError('Партия не найдена', code='batch_not_found', status_code=404)
+
+        # Проверка остатка: учитываем все позиции этого товара в чеке
+        available_qty = _available_quantity(product)
+        current_qty_in_sale = Decimal(str(product.quantity_in_sale))
+        total_requested = current_qty_in_sale + quantity
+        if total_requested > available_qty:
+            raise ScanError(
+                f'Недостаточно товара на складе. Доступно: {available_qty}, запрошено: {total_requested}',
+                code='insufficient_stock',
+                data={
+                    'available': str(available_qty),
+                    'requested': str(total_requested),
+                    'current_in_sale': str(current_qty_in_sale),
+                },
+            )
+
+        # Цена существующей позиции не меняется, новая берётся из pricing
+        if product.line_id:
+            unit_price = product.line_unit_price
+            discount_amount = product.line_discount_amount
+            line_quantity = product.line_quantity + quantity
+        else:
+            unit_price = _unit_price(product)
+            discount_amount = Decimal('0.00')
+            line_quantity = quantity
+
+        line_total = round_money(line_quantity * unit_price - discount_amount)
+        delta = line_total
+        if product.line_id:
+            delta -= round_money(product.line_quantity * unit_price - discount_amount)
+
+        sale_created = product.pending_sale_id is None
+        if sale_created:
+            # Номер чека по кассе и новый чек сразу с итогами первой позиции
+            sale = Sale.objects.create(
+                session_id=session_id,
+                receipt_number=allocate_receipt_number(product.register_code),
+                status='pending',
+                cashier_id=cashier_id,
+                subtotal=delta,
+                total_amount=delta,
+                version=1,
+            )
+        else:
+            # Итоги приращением; условие status='pending' защищает
+            # от гонки с оплатой - если чек уже завершён, транзакция откатится
+            sale = _pending_sale(session_id, product)
+            if not sale.apply_line_delta(delta, cashier_id):
+                raise ScanError('Продажа уже завершена', code='sale_not_pending', status_code=409)
+
+        # Позиция
+        if product.line_id:
+            SaleItem.objects.filter(pk=product.line_id).update(
+                quantity=F('quantity') + quantity,
+                line_total=Round((F('quantity') + quantity) * F('unit_price') - F('discount_amount'), 2),
+            )
+            item = SaleItem(
+                id=product.line_id,
+                sale=sale,
+                product=product,
+                batch_id=batch_id,
+                quantity=line_quantity,
+                unit_price=unit_price,
+                discount_amount=discount_amount,
+                line_total=line_total,
+                created_at=product.line_created_at,
+            )
+        else:
+            item = SaleItem.objects.create(
+                sale=sale,
+                product=product,
+                batch_id=batch_id,
+                quantity=quantity,
+                unit_price=unit_price,
+            )
+
+    items_count = (product.pending_items_count or 0) + (0 if product.line_id else 1)
+    total_quantity = (product.pending_total_quantity or Decimal('0')) + quantity
+
+    return ScanResult(
+        sale=sale,
+        item=item,
+        sale_created=sale_created,
+        item_created=not product.line_id,
+        items_count=items_count,
+        total_quantity=total_quantity,
+    )
+
+
+def _pending_sale(session_id, product):
+    """Текущий чек смены из аннотаций запроса №1 (без отдельного SELECT)"""
+    return Sale(
+        id=product.pending_sale_id,
+        session_id=session_id,
+        receipt_number=product.pending_receipt_number,
+        status='pending',
+        cashier_id=product.pending_cashier_id,
+        subtotal=product.pending_subtotal,
+        discount_percent=product.pending_discount_percent,
+        discount_amount=product.pending_discount_amount,
+        tax_amount=product.pending_tax_amount,
+        total_amount=product.pending_total_amount,
+        version=product.pending_version,
+    )
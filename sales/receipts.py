@@ -0,0 +1,70 @@
+"""
+Номера чеков: <КОД КАССЫ>-<ГГГГММДД>-<00001>.
+
+Номер выдаётся одним запросом INSERT ... ON CONFLICT DO UPDATE ... RETURNING
+по строке ReceiptCounter (касса, день). Строка блокируется только до конца
+транзакции продажи и только для своей кассы, поэтому кассы не ждут друг друга,
+а откат продажи откатывает и номер (нумерация без пропусков).
+
+Работает на PostgreSQL и SQLite 3.35+.
+"""
+
+import re
+
+from django.db import connection
+from django.utils import timezone
+
+from sales.models import ReceiptCounter
+
+DEFAULT_PREFIX = 'POS'
+PREFIX_MAX_LENGTH = ReceiptCounter._meta.get_field('prefix').max_length
+
+
+def receipt_prefix(register_code):
+    """Префикс номера из кода кассы: только буквы и цифры, не длиннее 20 символов"""
+    prefix = re.sub(r'[^0-9A-Za-z]', '', register_code or '').upper()[:PREFIX_MAX_LENGTH]
+    return prefix or DEFAULT_PREFIX
+
+
+def format_receipt_number(prefix, day, number):
+    return f"{prefix}-{day:%Y%m%d}-{number:05d}"
+
+
+def allocate_receipt_numbers(register_code, count=1, day=None):
+    """
+    Зарезервировать блок из count номеров для кассы.
+
+    Args:
+        register_code (str): Код кассы (CashRegister.code)
+        count (int): Сколько номеров нужно
+        day (date): День нумерации (по умолчанию сегодня, локальное время)
+
+    Returns:
+        list[str]: Номера чеков по возрастанию
+    """
+    prefix = receipt_prefix(register_code)
+    day = day or timezone.localdate()
+    table = connection.ops.quote_name(ReceiptCounter._meta.db_table)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (prefix, day, last_number)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (prefix, day)
+            DO UPDATE SET last_number = {table}.last_number + EXCLUDED.last_number
+            RETURNING last_number
+            """,
+            [prefix, connection.ops.adapt_datefield_value(day), count]
+        )
+        last_number = cursor.fetchone()[0]
+
+    return [
+        format_receipt_number(prefix, day, number)
+        for number in range(last_number - count + 1, last_number + 1)
+    ]
+
+
+def allocate_receipt_number(register_code, day=None):
+    """Следующий номер чека для кассы"""
+    return allocate_receipt_numbers(register_code, 1, day)[0]
@@ -0,0 +1,264 @@
+"""
+Возврат по продаже - весь чек или выбранные позиции - одной транзакцией.
+
+Количество запросов не зависит от размера чека:
+
+1. SELECT ... FOR UPDATE строки продажи (параллельный возврат
+   того же чека ждёт здесь)
+2. SELECT позиций чека с уже возвращённым количеством
+3. SELECT суммы прошлых возвратов и платежей по способам оплаты
+   (при полном возврате - всегда, для дневного отчёта)
+4. UPDATE партий одним запросом (products.stock.return_to_batches)
+5. INSERT возврата, его позиций и платежей с отрицательной суммой
+6. UPDATE счётчиков смены продажи (CashierSession.record_sales)
+7. UPSERT сводки кассира за день продажи (sales.stats.record_cashier_sales)
+8. UPSERT дневного отчёта аналитики за день продажи (analytics.daily_report)
+9. UPDATE статуса продажи и резервов старых продаж (только если возвращено всё)
+
+Сумма возврата позиции - её доля в итоге чека (скидка на чек делится
+пропорционально). Последний возврат, после которого в чеке ничего не
+осталось, забирает остаток итога, поэтому сумма всех возвратов по чеку
+равна total_amount.
+"""
+
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import DecimalField, Min, Sum, Value
+from django.db.models.functions import Coalesce
+
+from analytics.daily_report import record_daily_report, refund_delta
+from sales.live import publish_sale_refunded
+from sales.models import CashierSession, Payment, Refund, RefundItem, Sale, SaleItem, round_money
+from sales.stats import record_cashier_sales, sale_stats_row
+
+
+class RefundError(Exception):
+    """Ошибка возврата, которую view отдаёт клиенту как есть"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _requested_quantities(items_data, sale_items):
+    """
+    {ID позиции: количество к возврату} из запроса или всё, что ещё не возвращено.
+
+    Raises:
+        RefundError: позиция не из этого чека или количество больше невозвращённого
+    """
+    if items_data is None:
+        return OrderedDict(
+            (item.pk, item.quantity - item.refunded_quantity)
+            for item in sale_items.values()
+            if item.quantity > item.refunded_quantity
+        )
+
+    requested = OrderedDict()
+    for item_data in items_data:
+        try:
+            item_id = int(item_data.get('item'))
+            quantity = Decimal(str(item_data.get('quantity')))
+        except (AttributeError, InvalidOperation, TypeError, ValueError):
+            raise RefundError('Укажите item и quantity для каждой позиции возврата')
+        if item_id not in sale_items:
+            raise RefundError(f'Позиция {item_id} не найдена в продаже', status_code=404)
+        if quantity <= 0:
+            raise RefundError('Количество должно быть больше 0')
+        requested[item_id] = requested.get(item_id, Decimal('0')) + quantity
+
+    for item_id, quantity in requested.items():
+        item = sale_items[item_id]
+        available = item.quantity - item.refunded_quantity
+        if quantity > available:
+            raise RefundError(
+                f'Нельзя вернуть больше, чем продано. {item.product.name}: доступно к возврату {available}, запрошено {quantity}'
+            )
+    return requested
+
+
+def _allocate_payments(sale, amount, payment_method=None):
+    """
+    {payment_method: сумма} для возврата денег.
+
+    По умолчанию - теми же способами, что и оплата, в порядке платежей,
+    не больше оплаченного способом за вычетом прошлых возвратов.
+    """
+    if amount <= 0:
+        return {}
+    if payment_method:
+        return {payment_method: amount}
+
+    paid = (
+        Payment.objects.filter(sale_id=sale.pk)
+        .values('payment_method')
+        .annotate(total=Sum('amount'), first_id=Min('id'))
+        .order_by('first_id')
+    )
+
+    allocation = OrderedDict()
+    remaining = amount
+    for row in paid:
+        if remaining <= 0:
+            break
+        part = min(remaining, row['total'])
+        if part > 0:
+            allocation[row['payment_method']] = part
+            remaining -= part
+
+    if remaining > 0:
+        # Оплачено меньше суммы возврата (например, вернули другим способом раньше)
+        method = next(iter(allocation), 'cash')
+        allocation[method] = allocation.get(method, Decimal('0.00')) + remaining
+    return allocation
+
+
+def refund_sale(sale_id, items_data=None, payment_method=None, cashier_id=None, reason=''):
+    """
+    Оформить возврат по завершённой продаже.
+
+    Args:
+        sale_id: ID продажи
+        items_data: [{'item': ID позиции, 'quantity': количество}] или None - вернуть всё,
+                    что ещё не возвращено
+        payment_method: вернуть деньги этим способом (по умолчанию - способами оплаты чека)
+        cashier_id: кто оформил возврат
+        reason: причина
+
+    Returns:
+        Refund
+
+    Raises:
+        RefundError: продажа не найдена или не завершена, неверные позиции
+    """
+    from analytics.signals import refresh_sales_analytics
+    from products.models import StockReservation
+    from products.stock import return_to_batches
+
+    if payment_method and payment_method not in dict(Payment.PAYMENT_METHOD_CHOICES):
+        raise RefundError(f'Неизвестный способ оплаты: {payment_method}')
+
+    with transaction.atomic():
+        sale = Sale.objects.select_for_update().filter(pk=sale_id).first()
+        if sale is None:
+            raise RefundError('Продажа не найдена', status_code=404)
+        if sale.status != 'completed':
+            raise RefundError('Можно вернуть только завершённую продажу')
+
+        sale_items = OrderedDict(
+            (item.pk, item)
+            for item in SaleItem.objects.filter(sale_id=sale.pk)
+            .select_related('product')
+            .annotate(refunded_quantity=Coalesce(
+                Sum('refund_items__quantity'),
+                Value(Decimal('0')),
+                output_field=DecimalField(max_digits=12, decimal_places=3)
+            ))
+            .order_by('id')
+        )
+
+        requested = _requested_quantities(items_data, sale_items)
+        if not requested:
+            raise RefundError('Нечего возвращать: все позиции уже возвращены')
+
+        fully_refunded = all(
+            item.quantity - item.refunded_quantity == requested.get(item_id, Decimal('0'))
+            for item_id, item in sale_items.items()
+        )
+
+        # Доля позиции в итоге чека (скидка на чек делится пропорционально)
+        ratio = sale.total_amount / sale.subtotal if sale.subtotal else Decimal('0')
+        refund_items = []
+        for item_id, quantity in requested.items():
+            item = sale_items[item_id]
+            line_share = item.line_total * quantity / item.quantity if item.quantity else Decimal('0')
+            refund_items.append(RefundItem(
+                sale_item=item,
+                batch_id=item.batch_id,
+                quantity=quantity,
+                amount=round_money(line_share * ratio),
+            ))
+
+        total_amount = sum((refund_item.amount for refund_item in refund_items), Decimal('0.00'))
+        already_refunded = Decimal('0.00')
+        net_payments = None
+        if fully_refunded:
+            already_refunded = sale.refunds.aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
+            remainder = sale.total_amount - already_refunded - total_amount
+            refund_items[-1].amount = max(refund_items[-1].amount + remainder, Decimal('0.00'))
+            # Сумма возврата - всегда сумма его позиций (с учётом ограничения выше)
+            total_amount = sum((refund_item.amount for refund_item in refund_items), Decimal('0.00'))
+            # Платежи чека за вычетом прошлых возвратов - до записи этого возврата
+            net_payments = dict(
+                Payment.objects.filter(sale_id=sale.pk)
+                .values('payment_method')
+                .annotate(total=Sum('amount'))
+                .values_list('payment_method', 'total')
+            )
+
+        payments = _allocate_payments(sale, total_amount, payment_method)
+
+        # Товар - в партии, из которых он был списан при оплате
+        return_to_batches([
+            (refund_item.batch_id, refund_item.quantity)
+            for refund_item in refund_items
+            if refund_item.batch_id
+        ])
+
+        refund = Refund.objects.create(
+            sale=sale,
+            session_id=sale.session_id,
+            cashier_id=cashier_id,
+            total_amount=total_amount,
+            reason=reason or '',
+        )
+        for refund_item in refund_items:
+            refund_item.refund = refund
+        RefundItem.objects.bulk_create(refund_items)
+        Payment.objects.bulk_create([
+            Payment(
+                sale=sale,
+                session_id=sale.session_id,
+                refund=refund,
+                payment_method=method,
+                amount=-amount,
+                notes=f'Возврат #{refund.pk}',
+            )
+            for method, amount in payments.items()
+        ])
+
+        quantity = sum((refund_item.quantity for refund_item in refund_items), Decimal('0'))
+        count = 1 if fully_refunded else 0
+        CashierSession.record_sales(
+            sale.session_id,
+            count=count,
+            amount=total_amount,
+            quantity=quantity,
+            payments=payments,
+            refund=True
+        )
+        record_cashier_sales([sale_stats_row(sale, payments, count=count, amount=total_amount)], refund=True)
+        record_daily_report([refund_delta(
+            sale,
+            total_amount,
+            quantity,
+            payments,
+            fully_refunded=fully_refunded,
+            refunded_before=already_refunded,
+            net_payments=net_payments
+        )])
+        publish_sale_refunded(sale, refund, payments, fully_refunded)
+
+        if fully_refunded:
+            # Резервы остались только у продаж, оплаченных до прямого списания
+            reservation_ids = [item.reservation_id for item in sale_items.values() if item.reservation_id]
+            if reservation_ids:
+                StockReservation.objects.filter(pk__in=reservation_ids).update(status='cancelled')
+            Sale.objects.filter(pk=sale.pk).update(status='refunded')
+
+        transaction.on_commit(lambda: refresh_sales_analytics([sale.pk]))
+
+    return refund
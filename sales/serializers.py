@@ -7,7 +7,7 @@ from decimal import Decimal
 from django.db import transaction
 from sales.models import (
     CashRegister, CashierSession, Sale, SaleItem,
-    Payment, CashMovement
+    Payment, CashMovement, Refund, RefundItem
 )
 
 
@@ -169,12 +169,16 @@ class PaymentSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'sale', 'session', 'payment_method', 'payment_method_display',
             'amount', 'received_amount', 'change_amount',
-            'card_last4', 'transaction_id', 'notes', 'created_at'
+            'card_last4', 'transaction_id', 'notes', 'refund', 'created_at'
         ]
-        read_only_fields = ['id', 'change_amount', 'created_at']
+        read_only_fields = ['id', 'change_amount', 'refund', 'created_at']
 
     def validate(self, data):
         """Валидация платежа"""
+        # Платёж возврата создаёт только sales.refunds (bulk_create в обход валидаторов)
+        if self.instance is not None and self.instance.refund_id:
+            raise serializers.ValidationError('Платёж возврата нельзя изменить')
+
         payment_method = data.get('payment_method')
         amount = data.get('amount', 0)
         received_amount = data.get('received_amount')
@@ -268,9 +272,9 @@ class SaleSerializer(serializers.ModelSerializer):
             'subtotal', 'discount_amount', 'discount_percent',
             'tax_amount', 'total_amount',
             'items_count', 'total_quantity',
-            'notes', 'created_at', 'completed_at'
+            'notes', 'client_uuid', 'version', 'created_at', 'completed_at'
         ]
-        read_only_fields = ['id', 'subtotal', 'total_amount', 'created_at', 'completed_at']
+        read_only_fields = ['id', 'subtotal', 'total_amount', 'client_uuid', 'version', 'created_at', 'completed_at']
 
     def get_customer_info(self, obj):
         """Получить информацию о покупателе"""
@@ -321,14 +325,37 @@ class SaleSerializer(serializers.ModelSerializer):
         return data
 
 
+class RefundItemSerializer(serializers.ModelSerializer):
+    """Сериализатор для позиций возврата"""
+
+    product = serializers.IntegerField(source='sale_item.product_id', read_only=True)
+
+    class Meta:
+        model = RefundItem
+        fields = ['id', 'sale_item', 'product', 'batch', 'quantity', 'amount']
+        read_only_fields = fields
+
+
+class RefundSerializer(serializers.ModelSerializer):
+    """Сериализатор для возвратов (только чтение, оформление - sales.refunds)"""
+
+    items = RefundItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Refund
+        fields = ['id', 'sale', 'session', 'cashier', 'total_amount', 'reason', 'items', 'created_at']
+        read_only_fields = fields
+
+
 class SaleDetailSerializer(SaleSerializer):
-    """Детальный сериализатор для продажи с позициями и платежами"""
+    """Детальный сериализатор для продажи с позициями, платежами и возвратами"""
 
     items = SaleItemSerializer(many=True, read_only=True)
     payments = PaymentSerializer(many=True, read_only=True)
+    refunds = RefundSerializer(many=True, read_only=True)
 
     class Meta(SaleSerializer.Meta):
-        fields = SaleSerializer.Meta.fields + ['items', 'payments']
+        fields = SaleSerializer.Meta.fields + ['items', 'payments', 'refunds']
 
 
 class SaleItemNestedSerializer(serializers.ModelSerializer):
@@ -390,6 +417,10 @@ class PaymentNestedSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         """Валидация платежа"""
+        # Платёж возврата создаёт только sales.refunds (bulk_create в обход валидаторов)
+        if self.instance is not None and self.instance.refund_id:
+            raise serializers.ValidationError('Платёж возврата нельзя изменить')
+
         payment_method = data.get('payment_method')
         amount = data.get('amount', 0)
         received_amount = data.get('received_amount')
@@ -442,6 +473,10 @@ class SaleCreateUpdateSerializer(serializers.ModelSerializer):
             'items', 'payments'
         ]
         read_only_fields = ['customer']
+        extra_kwargs = {
+            # Если номер не передан, он выдаётся по кассе смены (sales.receipts)
+            'receipt_number': {'required': False},
+        }
 
     def validate(self, data):
         """Валидация продажи"""
@@ -537,6 +572,12 @@ class SaleCreateUpdateSerializer(serializers.ModelSerializer):
                 validated_data['customer_name'] = customer_instance.full_name
                 validated_data['customer_phone'] = customer_instance.phone
 
+        if not validated_data.get('receipt_number'):
+            from sales.receipts import allocate_receipt_number
+            validated_data['receipt_number'] = allocate_receipt_number(
+                validated_data['session'].cash_register.code
+            )
+
         # Создаём продажу
         sale = Sale.objects.create(**validated_data)
 
@@ -583,6 +624,9 @@ class SaleCreateUpdateSerializer(serializers.ModelSerializer):
 
             # Пересчитываем суммы
             instance.calculate_totals()
+        elif validated_data.keys() & {'discount_percent', 'discount_amount', 'tax_amount'}:
+            # Изменились скидка или налог - итоги пересчитываются по позициям
+            instance.calculate_totals()
 
         # Обновляем платежи если переданы
         if payments_data is not None:
@@ -0,0 +1,317 @@
+"""
+Рейтинг кассиров (cashier-stats) и его дневная сводка CashierDailyStats.
+
+Рейтинг считается одним запросом:
+- по сводке, если период состоит из целых дней (date_from с начала дня,
+  date_to - конец дня или "сейчас"): строк там примерно столько же,
+  сколько смен, поэтому месяц для магазина с 50+ кассирами - миллисекунды;
+- иначе по продажам, с суммами по способам оплаты в подзапросах
+  (без отдельных запросов на каждого кассира).
+
+Сводка ведётся приращениями в транзакции оплаты/возврата
+(record_cashier_sales) и пересобирается командой rebuild_cashier_daily_stats.
+День продажи - локальная дата оплаты (completed_at), как у дневного отчёта
+аналитики: офлайн чек попадает в день, когда его пробили, а не загрузили.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from sales.models import CashierDailyStats, Payment, Refund, Sale, round_money
+
+CASHIER_FIELDS = (
+    'cashier__id', 'cashier__first_name', 'cashier__last_name', 'cashier__phone', 'cashier__role',
+)
+
+
+def record_cashier_sales(rows, refund=False):
+    """
+    Прибавить продажи к сводке одним INSERT ... ON CONFLICT DO UPDATE.
+
+    Args:
+        rows: [(day, cashier_id, session_id, sales_count, sales_amount, cash_amount, card_amount)] -
+              по строке на продажу или возврат; продажи без кассира пропускаются
+        refund: возврат - значения вычитаются
+    """
+    sign = -1 if refund else 1
+    totals = defaultdict(lambda: [0, Decimal('0.00'), Decimal('0.00'), Decimal('0.00')])
+    for day, cashier_id, session_id, count, amount, cash, card in rows:
+        if not cashier_id:
+            continue
+        total = totals[(day, int(cashier_id), session_id)]
+        total[0] += sign * count
+        total[1] += sign * Decimal(str(amount))
+        total[2] += sign * Decimal(str(cash))
+        total[3] += sign * Decimal(str(card))
+
+    if not totals:
+        return
+
+    table = connection.ops.quote_name(CashierDailyStats._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    params = []
+    for (day, cashier_id, session_id), (count, amount, cash, card) in totals.items():
+        params.extend([
+            connection.ops.adapt_datefield_value(day), cashier_id, session_id,
+            count, amount, cash, card, now,
+        ])
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(totals))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table}
+                (date, cashier_id, session_id, sales_count, sales_amount, cash_amount, card_amount, updated_at)
+            VALUES {values}
+            ON CONFLICT (date, cashier_id, session_id)
+            DO UPDATE SET
+                sales_count = {table}.sales_count + EXCLUDED.sales_count,
+                sales_amount = {table}.sales_amount + EXCLUDED.sales_amount,
+                cash_amount = {table}.cash_amount + EXCLUDED.cash_amount,
+                card_amount = {table}.card_amount + EXCLUDED.card_amount,
+                updated_at = EXCLUDED.updated_at
+            """,
+            params
+        )
+
+
+def sale_stats_row(sale, payment_totals, count=1, amount=None):
+    """
+    Строка для record_cashier_sales по продаже и её суммам по способам оплаты.
+
+    Для частичного возврата: count=0 и amount - сумма возврата.
+    """
+    return (
+        timezone.localdate(sale.completed_at),
+        sale.cashier_id,
+        sale.session_id,
+        count,
+        sale.total_amount if amount is None else amount,
+        payment_totals.get('cash', Decimal('0.00')),
+        payment_totals.get('card', Decimal('0.00')),
+    )
+
+
+def _day_bounds(day_from, day_to):
+    start = timezone.make_aware(datetime.combine(day_from, time.min))
+    end = timezone.make_aware(datetime.combine(day_to + timedelta(days=1), time.min))
+    return start, end
+
+
+def rebuild_cashier_daily_stats(day_from, day_to):
+    """
+    Пересобрать сводку за дни [day_from, day_to] по продажам, возвратам
+    и платежам (три группирующих запроса).
+
+    Returns:
+        int: количество строк сводки
+    """
+    from django.db.models.functions import TruncDate
+
+    start, end = _day_bounds(day_from, day_to)
+    tz = timezone.get_current_timezone()
+
+    sales = Sale.objects.filter(
+        status__in=('completed', 'refunded'),
+        cashier__isnull=False,
+        completed_at__gte=start,
+        completed_at__lt=end
+    ).annotate(day=TruncDate('completed_at', tzinfo=tz))
+
+    rows = {}
+
+    def row(day, cashier_id, session_id):
+        key = (day, cashier_id, session_id)
+        if key not in rows:
+            rows[key] = CashierDailyStats(date=day, cashier_id=cashier_id, session_id=session_id)
+        return rows[key]
+
+    for stat in sales.filter(status='completed').values('day', 'cashier_id', 'session_id').annotate(
+        sales_count=Count('id'),
+        sales_amount=Sum('total_amount')
+    ).order_by():
+        stats_row = row(stat['day'], stat['cashier_id'], stat['session_id'])
+        stats_row.sales_count = stat['sales_count']
+        stats_row.sales_amount = stat['sales_amount'] or Decimal('0.00')
+
+    # Частичные возвраты уменьшают продажи дня продажи
+    refunds = Refund.objects.filter(sale__in=sales.filter(status='completed').values('pk')).annotate(
+        day=TruncDate('sale__completed_at', tzinfo=tz)
+    )
+    for stat in refunds.values('day', 'sale__cashier_id', 'sale__session_id').annotate(
+        total=Sum('total_amount')
+    ).order_by():
+        stats_row = row(stat['day'], stat['sale__cashier_id'], stat['sale__session_id'])
+        stats_row.sales_amount -= stat['total'] or Decimal('0.00')
+
+    # Платежи и возвраты денег (отрицательные платежи), в т.ч. полностью возвращённых продаж
+    payments = Payment.objects.filter(sale__in=sales.values('pk')).annotate(
+        day=TruncDate('sale__completed_at', tzinfo=tz)
+    )
+    for stat in payments.values('day', 'sale__cashier_id', 'sale__session_id').annotate(
+        cash=Sum('amount', filter=Q(payment_method='cash')),
+        card=Sum('amount', filter=Q(payment_method='card'))
+    ).order_by():
+        stats_row = row(stat['day'], stat['sale__cashier_id'], stat['sale__session_id'])
+        stats_row.cash_amount = stat['cash'] or Decimal('0.00')
+        stats_row.card_amount = stat['card'] or Decimal('0.00')
+
+    with transaction.atomic():
+        CashierDailyStats.objects.filter(date__gte=day_from, date__lte=day_to).delete()
+        CashierDailyStats.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
+
+
+def _payment_total(method, start, end):
+    """Подзапрос: сумма платежей способа method (за вычетом возвратов) по кассиру группы за период"""
+    money = DecimalField(max_digits=14, decimal_places=2)
+    payments = (
+        Payment.objects.filter(
+            payment_method=method,
+            sale__cashier_id=OuterRef('cashier__id'),
+            sale__status__in=('completed', 'refunded'),
+            sale__completed_at__gte=start,
+            sale__completed_at__lte=end
+        )
+        .values('sale__cashier_id')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    return Coalesce(Subquery(payments, output_field=money), Value(Decimal('0.00')), output_field=money)
+
+
+def _refund_total(start, end):
+    """Подзапрос: частичные возвраты по завершённым продажам кассира группы за период"""
+    money = DecimalField(max_digits=14, decimal_places=2)
+    refunds = (
+        Refund.objects.filter(
+            sale__cashier_id=OuterRef('cashier__id'),
+            sale__status='completed',
+            sale__completed_at__gte=start,
+            sale__completed_at__lte=end
+        )
+        .values('sale__cashier_id')
+        .annotate(total=Sum('total_amount'))
+        .values('total')
+    )
+    return Coalesce(Subquery(refunds, output_field=money), Value(Decimal('0.00')), output_field=money)
+
+
+def _live_queryset(start, end):
+    """Продажи за период, сгруппированные по кассиру"""
+    money = DecimalField(max_digits=14, decimal_places=2)
+    completed = Q(status='completed')
+    # Полностью возвращённые продажи - только ради их платежей и возвратов денег
+    return Sale.objects.filter(
+        status__in=('completed', 'refunded'),
+        cashier__isnull=False,
+        completed_at__gte=start,
+        completed_at__lte=end
+    ).values(*CASHIER_FIELDS).annotate(
+        total_sales=Coalesce(Sum('total_amount', filter=completed), Value(Decimal('0.00')), output_field=money)
+        - _refund_total(start, end),
+        sales_count=Count('id', filter=completed),
+        sessions_count=Count('session_id', filter=completed, distinct=True),
+        cash_total=_payment_total('cash', start, end),
+        card_total=_payment_total('card', start, end),
+    ).order_by('-total_sales')
+
+
+def _rollup_queryset(day_from, day_to):
+    """Те же колонки, что у _live_queryset, но по сводке"""
+    money = DecimalField(max_digits=14, decimal_places=2)
+    return CashierDailyStats.objects.filter(
+        date__gte=day_from,
+        date__lte=day_to
+    ).values(*CASHIER_FIELDS).annotate(
+        # Раньше sales_count ниже: в фильтре - поле строки, а не сумма.
+        # После полного возврата в строке остаётся sales_count = 0
+        sessions_count=Count('session_id', filter=Q(sales_count__gt=0), distinct=True),
+        total_sales=Coalesce(Sum('sales_amount'), Value(Decimal('0.00')), output_field=money),
+        sales_count=Sum('sales_count'),
+        cash_total=Coalesce(Sum('cash_amount'), Value(Decimal('0.00')), output_field=money),
+        card_total=Coalesce(Sum('card_amount'), Value(Decimal('0.00')), output_field=money),
+    ).order_by('-total_sales')
+
+
+def _whole_days(date_from, date_to):
+    """
+    (первый день, последний день), если период - целые дни, иначе None.
+
+    date_to "сейчас" тоже подходит: сегодняшняя строка сводки уже актуальна.
+    """
+    local_from = timezone.localtime(date_from)
+    local_to = timezone.localtime(date_to)
+    if local_from.time() != time.min:
+        return None
+    is_day_end = local_to.time() >= time(23, 59, 59)
+    is_now = abs((timezone.now() - date_to).total_seconds()) < 60
+    if not (is_day_end or is_now):
+        return None
+    return local_from.date(), local_to.date()
+
+
+def cashier_leaderboard(date_from, date_to, limit=None):
+    """
+    Рейтинг кассиров за период одним запросом.
+
+    Returns:
+        list[dict]: по кассиру, в порядке убывания суммы продаж
+    """
+    days = _whole_days(date_from, date_to)
+    if days:
+        queryset = _rollup_queryset(*days)
+    else:
+        queryset = _live_queryset(date_from, date_to)
+
+    if limit:
+        queryset = queryset[:int(limit)]
+
+    return [
+        {
+            'id': stat['cashier__id'],
+            'full_name': f"{stat['cashier__last_name']} {stat['cashier__first_name']}".strip(),
+            'phone': stat['cashier__phone'],
+            'role': stat['cashier__role'],
+            'total_sales': str(stat['total_sales']),
+            'cash_sales': str(stat['cash_total']),
+            'card_sales': str(stat['card_total']),
+            'sales_count': stat['sales_count'],
+            'sessions_count': stat['sessions_count'],
+        }
+        for stat in queryset
+    ]
+
+
+def day_totals(day=None):
+    """
+    Итоги магазина за день по строке дневного отчёта (DailySalesReport).
+
+    Отчёт учитывает все завершённые продажи дня, в том числе без кассира,
+    и ведётся приращениями в транзакции оплаты/возврата
+    (analytics.daily_report), поэтому это один SELECT по первичному ключу.
+    Если ANALYTICS_DAILY_REPORT_INCREMENTAL выключен, строка обновляется
+    очередью analytics.queue и отстаёт на время пересчёта.
+
+    Returns:
+        dict: date, sales_count, sales_amount, cash_amount, card_amount
+    """
+    from analytics.models import DailySalesReport
+
+    day = day or timezone.localdate()
+    report = DailySalesReport.objects.filter(date=day).values(
+        'total_sales_count', 'total_sales', 'cash_sales', 'card_sales'
+    ).first() or {}
+    return {
+        'date': day.isoformat(),
+        'sales_count': report.get('total_sales_count', 0),
+        'sales_amount': str(round_money(report.get('total_sales') or Decimal('0.00'))),
+        'cash_amount': str(round_money(report.get('cash_sales') or Decimal('0.00'))),
+        'card_amount': str(round_money(report.get('card_sales') or Decimal('0.00'))),
+    }
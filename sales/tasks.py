@@ -0,0 +1,36 @@
+"""
+Celery tasks для продаж.
+"""
+
+import logging
+
+from celery import shared_task
+from django.conf import settings
+
+from core.schema_utils import iter_tenant_schemas
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def ensure_sales_partitions():
+    """
+    Создаёт месячные секции таблиц продаж на SALES_PARTITION_MONTHS_AHEAD месяцев вперёд.
+
+    Запускается каждый день в 00:15 (CELERY_BEAT_SCHEDULE). Магазины
+    без секционирования пропускаются.
+    """
+    from core.partitioning import ensure_partitions, is_supported
+
+    if not is_supported():
+        return {}
+
+    results = {}
+    for schema_name in iter_tenant_schemas():
+        try:
+            results[schema_name] = ensure_partitions(settings.SALES_PARTITION_MONTHS_AHEAD)
+        except Exception as e:
+            logger.error(f"Ошибка создания секций продаж в {schema_name}: {e}")
+            results[schema_name] = str(e)
+
+    return results
@@ -1,3 +1,589 @@
-from django.test import TestCase
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.partitioning import (
+    PARTITIONED_TABLES, add_months, detach_partitions, ensure_partitions, month_start, partition_sales_tables,
+    partitioned_tables,
+)
+from products.models import Product, ProductBatch, ProductInventory, ProductPricing, Unit
+from sales import drafts
+from sales.checkout import CheckoutError, checkout_sale
+from sales.models import (
+    CashRegister, CashierDailyStats, CashierSession, Payment, ReceiptCounter, Refund, Sale, SaleItem
+)
+from sales.offline import upload_sales
+from sales.pos import SCAN_QUERY_BUDGET, ScanError, scan_item
+from sales.receipts import allocate_receipt_number, allocate_receipt_numbers, receipt_prefix
+from sales.refunds import refund_sale
+from sales.stats import day_totals
+from sales.serializers import PaymentSerializer
+from sales.views import PaymentViewSet, SaleViewSet
+
+
+def make_product(unit, name, sale_price='100.00', quantity='10'):
+    product = Product.objects.create(name=name, slug=name.lower(), sku=name.upper(), unit=unit)
+    ProductPricing.objects.create(product=product, cost_price=Decimal('50.00'), sale_price=Decimal(sale_price))
+    ProductInventory.objects.create(product=product)
+    ProductBatch.objects.create(
+        product=product,
+        batch_number=f'{name}-1',
+        quantity=Decimal(quantity),
+        purchase_price=Decimal('50.00')
+    )
+    return product
+
+
+def open_session(code='R1'):
+    register = CashRegister.objects.create(name=f'Касса {code}', code=code)
+    return CashierSession.objects.create(cash_register=register, cashier_name='Тест', opening_cash=0)
+
+
+class ScanItemQueryCountTests(TestCase):
+    """scan_item укладывается в SCAN_QUERY_BUDGET запросов (sales/pos.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = Unit.objects.create(name='штука', short_name='шт')
+        cls.milk = make_product(unit, 'Milk')
+        cls.bread = make_product(unit, 'Bread', sale_price='30.00')
+        cls.session = open_session()
+
+    def scan(self, product, quantity='1'):
+        """Сканирование и число SQL запросов (без SAVEPOINT тестовой транзакции)"""
+        with CaptureQueriesContext(connection) as context:
+            result = scan_item(self.session.pk, product.pk, Decimal(quantity))
+        queries = [
+            query['sql'] for query in context.captured_queries
+            if 'SAVEPOINT' not in query['sql'].upper()
+        ]
+        return result, queries
+
+    def test_new_sale(self):
+        result, queries = self.scan(self.milk)
+
+        # SELECT товара, номер чека, INSERT чека, INSERT позиции
+        self.assertEqual(len(queries), SCAN_QUERY_BUDGET)
+        self.assertTrue(result.sale_created)
+        sale = Sale.objects.get(pk=result.sale.pk)
+        self.assertEqual(sale.status, 'pending')
+        self.assertEqual(sale.total_amount, Decimal('100.00'))
+        self.assertEqual(sale.receipt_number, result.sale.receipt_number)
+
+    def test_new_line(self):
+        first, _ = self.scan(self.milk)
+
+        result, queries = self.scan(self.bread, '2')
+
+        # SELECT товара, UPDATE итогов чека, INSERT позиции
+        self.assertEqual(len(queries), 3)
+        self.assertFalse(result.sale_created)
+        self.assertEqual(result.sale.pk, first.sale.pk)
+        self.assertEqual(SaleItem.objects.filter(sale_id=first.sale.pk).count(), 2)
+        self.assertEqual(Sale.objects.get(pk=first.sale.pk).total_amount, Decimal('160.00'))
+
+    def test_existing_line(self):
+        first, _ = self.scan(self.milk)
+
+        result, queries = self.scan(self.milk, '2')
+
+        # SELECT товара, UPDATE итогов чека, UPDATE количества позиции
+        self.assertEqual(len(queries), 3)
+        item = SaleItem.objects.get(sale_id=first.sale.pk)
+        self.assertEqual(item.quantity, Decimal('3'))
+        self.assertEqual(item.line_total, Decimal('300.00'))
+        self.assertEqual(Sale.objects.get(pk=first.sale.pk).total_amount, Decimal('300.00'))
+
+
+class ApplyLineDeltaTests(TestCase):
+    """Sale.apply_line_delta: итоги и версия из UPDATE ... RETURNING"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = open_session()
+
+    def create_sale(self, **fields):
+        return Sale.objects.create(
+            session=self.session,
+            receipt_number=allocate_receipt_number('R1'),
+            status='pending',
+            **fields
+        )
+
+    def test_stale_object_gets_row_values(self):
+        sale = self.create_sale(subtotal=Decimal('100.00'), total_amount=Decimal('100.00'), version=1)
+        stale = Sale.objects.get(pk=sale.pk)
+        Sale.objects.filter(pk=sale.pk).update(subtotal=Decimal('250.00'), total_amount=Decimal('250.00'), version=4)
+
+        self.assertTrue(stale.apply_line_delta(Decimal('50.00'), cashier_id=None))
+
+        sale.refresh_from_db()
+        self.assertEqual((stale.version, stale.subtotal, stale.total_amount), (5, Decimal('300.00'), Decimal('300.00')))
+        self.assertEqual((sale.version, sale.subtotal, sale.total_amount), (5, Decimal('300.00'), Decimal('300.00')))
+
+    def test_discount_and_tax(self):
+        sale = self.create_sale(
+            subtotal=Decimal('100.00'), discount_percent=Decimal('10.00'), discount_amount=Decimal('10.00'),
+            tax_amount=Decimal('5.00'), total_amount=Decimal('95.00')
+        )
+
+        self.assertTrue(sale.apply_line_delta(Decimal('33.33')))
+
+        self.assertEqual(sale.subtotal, Decimal('133.33'))
+        self.assertEqual(sale.discount_amount, Decimal('13.33'))
+        self.assertEqual(sale.total_amount, Decimal('125.00'))
+        sale.refresh_from_db()
+        self.assertEqual(sale.total_amount, Decimal('125.00'))
+
+    def test_completed_sale_not_changed(self):
+        sale = self.create_sale(subtotal=Decimal('100.00'), total_amount=Decimal('100.00'))
+        Sale.objects.filter(pk=sale.pk).update(status='completed')
+
+        self.assertFalse(sale.apply_line_delta(Decimal('10.00')))
+
+        sale.refresh_from_db()
+        self.assertEqual((sale.version, sale.total_amount), (0, Decimal('100.00')))
+
+
+class ReceiptNumberTests(TestCase):
+    """Префикс и нумерация чеков по кассе и дню (sales/receipts.py)"""
+
+    def test_keeps_letters_and_digits_uppercased(self):
+        self.assertEqual(receipt_prefix('kassa-1 / зал'), 'KASSA1')
+
+    def test_truncated_to_counter_field(self):
+        self.assertEqual(receipt_prefix('A' * 30), 'A' * 20)
+
+    def test_default_prefix(self):
+        self.assertEqual(receipt_prefix(''), 'POS')
+        self.assertEqual(receipt_prefix(None), 'POS')
+        self.assertEqual(receipt_prefix('№ --'), 'POS')
+
+    def test_number_format(self):
+        day = date(2025, 1, 31)
+        self.assertEqual(allocate_receipt_number('r-1', day=day), 'R1-20250131-00001')
+        self.assertEqual(
+            allocate_receipt_numbers('R1', 2, day=day),
+            ['R1-20250131-00002', 'R1-20250131-00003']
+        )
+
+    def test_sequence_per_register_and_day(self):
+        day = date(2025, 1, 31)
+        allocate_receipt_numbers('R1', 3, day=day)
+
+        self.assertEqual(allocate_receipt_number('R2', day=day), 'R2-20250131-00001')
+        self.assertEqual(allocate_receipt_number('R1', day=date(2025, 2, 1)), 'R1-20250201-00001')
+
+
+class ConcurrentReceiptNumberTests(TransactionTestCase):
+    """Параллельные кассы с одним кодом получают разные номера без пропусков"""
+
+    threads = 4
+    numbers_per_thread = 10
+
+    def test_concurrent_allocations_are_distinct_and_gapless(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite в памяти не ждёт блокировку таблицы из другого потока')
+
+        day = date(2025, 1, 31)
+        numbers = []
+        errors = []
+        lock = threading.Lock()
+        start = threading.Barrier(self.threads)
+
+        def worker():
+            allocated = []
+            try:
+                start.wait()
+                for _ in range(self.numbers_per_thread):
+                    with transaction.atomic():
+                        allocated.append(allocate_receipt_number('R1', day=day))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+            with lock:
+                numbers.extend(allocated)
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        total = self.threads * self.numbers_per_thread
+        self.assertEqual(len(set(numbers)), total)
+        self.assertEqual(
+            sorted(numbers),
+            [f'R1-20250131-{number:05d}' for number in range(1, total + 1)]
+        )
+        self.assertEqual(ReceiptCounter.objects.get(prefix='R1', day=day).last_number, total)
+
+    def test_rolled_back_sale_returns_its_number(self):
+        day = date(2025, 1, 31)
+        allocate_receipt_number('R1', day=day)
+
+        try:
+            with transaction.atomic():
+                allocate_receipt_number('R1', day=day)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertEqual(allocate_receipt_number('R1', day=day), 'R1-20250131-00002')
+
+
+class OfflineUploadTests(TestCase):
+    """Отклонённый чек пачки не влияет на остальные (sales/offline.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = Unit.objects.create(name='штука', short_name='шт')
+        cls.milk = make_product(unit, 'Milk', quantity='1')
+        cls.session = open_session()
+
+    def receipt(self, items=None, payments=None):
+        return {
+            'client_uuid': str(uuid.uuid4()),
+            'items': items if items is not None else [{'product_id': self.milk.pk, 'quantity': 1}],
+            'payments': payments if payments is not None else [{'payment_method': 'card', 'amount': '100.00'}],
+        }
+
+    def test_rejected_payment_returns_stock_to_chunk(self):
+        # Наличных получено меньше суммы платежа - CheckoutError после распределения по партиям
+        rejected = self.receipt(payments=[{'payment_method': 'cash', 'amount': '100.00', 'received_amount': '50'}])
+
+        result = upload_sales(self.session.pk, [rejected, self.receipt()])
+
+        self.assertEqual([row['status'] for row in result['results']], ['rejected', 'created'])
+        self.assertEqual(result['results'][0]['code'], 'invalid_payment')
+        self.assertEqual(self.milk.batches.get().quantity, Decimal('0'))
+
+    def test_malformed_receipts_rejected_individually(self):
+        sales_data = [
+            self.receipt(items=['milk']),
+            self.receipt(payments=[{'payment_method': 'card', 'amount': 'сто'}]),
+            self.receipt(payments=['card']),
+            self.receipt(),
+        ]
+
+        result = upload_sales(self.session.pk, sales_data)
+
+        self.assertEqual(
+            [row['status'] for row in result['results']],
+            ['rejected', 'rejected', 'rejected', 'created']
+        )
+        self.assertEqual(Sale.objects.filter(status='completed').count(), 1)
+
+    def test_unknown_payment_method_rejects_only_its_receipt(self):
+        sales_data = [
+            self.receipt(payments=[{'amount': '100.00'}]),
+            self.receipt(payments=[{'payment_method': 'bitcoin', 'amount': '100.00'}]),
+            self.receipt(),
+        ]
+
+        result = upload_sales(self.session.pk, sales_data)
+
+        self.assertEqual(
+            [row['status'] for row in result['results']],
+            ['rejected', 'rejected', 'created']
+        )
+        self.assertEqual(
+            [row.get('code') for row in result['results'][:2]],
+            ['invalid_payment', 'invalid_payment']
+        )
+        self.assertEqual(list(Payment.objects.values_list('payment_method', flat=True)), ['card'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CheckoutPaymentTests(TestCase):
+    """Проверка платежей при оплате (sales/checkout.py)"""
+
+    def test_unknown_payment_method_rolls_back(self):
+        unit = Unit.objects.create(name='штука', short_name='шт')
+        milk = make_product(unit, 'Milk')
+        sale = scan_item(open_session().pk, milk.pk, Decimal('1')).sale
+
+        with self.assertRaises(CheckoutError):
+            checkout_sale(sale.pk, [{'payment_method': 'bitcoin', 'amount': '100.00'}])
+
+        sale.refresh_from_db()
+        self.assertEqual(sale.status, 'pending')
+        self.assertFalse(Payment.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'pg_advisory_xact_lock есть только в PostgreSQL')
+class ConcurrentOfflineUploadTests(TransactionTestCase):
+    """Один чек, загруженный одновременно с двух смен, записывается один раз"""
+
+    def test_same_receipt_from_two_sessions(self):
+        unit = Unit.objects.create(name='штука', short_name='шт')
+        # Разные товары: загрузки не ждут друг друга на блокировке партий
+        products = [make_product(unit, 'Milk'), make_product(unit, 'Kefir')]
+        sessions = [open_session('R1'), open_session('R2')]
+        client_uuid = str(uuid.uuid4())
+        statuses = []
+        errors = []
+        start = threading.Barrier(len(sessions))
+
+        def worker(session, product):
+            receipt = {
+                'client_uuid': client_uuid,
+                'items': [{'product_id': product.pk, 'quantity': 1}],
+                'payments': [{'payment_method': 'card', 'amount': '100.00'}],
+            }
+            try:
+                start.wait()
+                statuses.append(upload_sales(session.pk, [receipt])['results'][0]['status'])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=worker, args=(session, product))
+            for session, product in zip(sessions, products)
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(statuses), ['created', 'duplicate'])
+        self.assertEqual(Sale.objects.filter(client_uuid=client_uuid).count(), 1)
+        self.assertEqual(
+            sorted(ProductBatch.objects.filter(product__in=products).values_list('quantity', flat=True)),
+            [Decimal('9'), Decimal('10')]
+        )
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Секционирование таблиц продаж есть только на PostgreSQL')
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PartitioningTests(TestCase):
+    """Помесячные секции таблиц продаж (core/partitioning.py); DDL откатывается вместе с тестом"""
+
+    def setUp(self):
+        unit = Unit.objects.create(name='штука', short_name='шт')
+        self.milk = make_product(unit, 'Milk')
+        self.session = open_session()
+        self.this_month = month_start(timezone.localdate())
+        self.legacy_sale = self.paid_sale()
+
+    def paid_sale(self, month=None):
+        result = scan_item(self.session.pk, self.milk.pk, Decimal('1'))
+        checkout_sale(result.sale.pk, [{'payment_method': 'card', 'amount': str(result.sale.total_amount)}])
+        if month is not None:
+            created_at = timezone.make_aware(datetime(month.year, month.month, 15))
+            Sale.objects.filter(pk=result.sale.pk).update(created_at=created_at)
+        return Sale.objects.get(pk=result.sale.pk)
+
+    def flush_deferred_checks(self):
+        # FK Django отложенные: ALTER TABLE в той же транзакции, что и вставки
+        # теста, PostgreSQL выполняет только после проверки этих FK
+        connection.check_constraints()
+
+    def convert(self, months_ahead):
+        self.flush_deferred_checks()
+        return partition_sales_tables(months_ahead=months_ahead)
+
+    def partition_of(self, table, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT tableoid::regclass::text FROM {table} WHERE id = %s', [pk])
+            return cursor.fetchone()[0]
+
+    def month_partitions(self, *offsets):
+        return [
+            f'{table}_p{add_months(self.this_month, offset):%Y%m}'
+            for table in PARTITIONED_TABLES
+            for offset in offsets
+        ]
+
+    def test_convert_and_insert_across_months(self):
+        self.assertEqual(ensure_partitions(), [])
+
+        self.assertEqual(self.convert(2), list(PARTITIONED_TABLES))
+        self.assertEqual(partitioned_tables(), set(PARTITIONED_TABLES))
+        self.assertEqual(self.convert(2), [])
+
+        # Старые строки и продажи текущего месяца - в секции _legacy
+        current = self.paid_sale()
+        next_month = self.paid_sale(add_months(self.this_month, 1))
+        far_future = self.paid_sale(add_months(self.this_month, 12))
+
+        self.assertEqual(self.partition_of('sales_sale', self.legacy_sale.pk), 'sales_sale_legacy')
+        self.assertEqual(self.partition_of('sales_sale', current.pk), 'sales_sale_legacy')
+        self.assertEqual(
+            self.partition_of('sales_sale', next_month.pk),
+            f'sales_sale_p{add_months(self.this_month, 1):%Y%m}'
+        )
+        self.assertEqual(self.partition_of('sales_sale', far_future.pk), 'sales_sale_default')
+        # Последовательность id родителя продолжает старую таблицу
+        self.assertGreater(current.pk, self.legacy_sale.pk)
+        self.assertEqual(Sale.objects.filter(status='completed').count(), 4)
+
+    def test_ensure_partitions_creates_future_months(self):
+        self.convert(1)
+
+        self.assertEqual(ensure_partitions(months_ahead=3), self.month_partitions(2, 3))
+        self.assertEqual(ensure_partitions(months_ahead=3), [])
+
+    def test_detach_partitions(self):
+        self.convert(1)
+        next_month = self.paid_sale(add_months(self.this_month, 1))
+        self.flush_deferred_checks()
+
+        detached = detach_partitions(add_months(self.this_month, 1))
+
+        self.assertEqual(detached, [f'{table}_legacy' for table in PARTITIONED_TABLES])
+        self.assertFalse(Sale.objects.filter(pk=self.legacy_sale.pk).exists())
+        self.assertTrue(Sale.objects.filter(pk=next_month.pk).exists())
+
+
+def tenant_request(method, path, data=None):
+    """Запрос сотрудника магазина в обход TenantByKeyMiddleware (схема уже текущая)"""
+    request = getattr(APIRequestFactory(), method)(path, data, format='json')
+    request.tenant = SimpleNamespace(is_active=True)
+    request.employee = SimpleNamespace(id=None)
+    request.schema_name = 'public'
+    force_authenticate(request, user=User(username='owner'))
+    return request
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RefundTests(TestCase):
+    """Возвраты (sales/refunds.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = Unit.objects.create(name='штука', short_name='шт')
+        cls.milk = make_product(unit, 'Milk')
+        cls.session = open_session()
+
+    def paid_sale(self, quantity='3'):
+        result = scan_item(self.session.pk, self.milk.pk, Decimal(quantity))
+        checkout_sale(result.sale.pk, [{'payment_method': 'card', 'amount': str(result.sale.total_amount)}])
+        return Sale.objects.get(pk=result.sale.pk)
+
+    def test_full_refund_total_is_sum_of_items(self):
+        sale = self.paid_sale()
+        item = sale.items.get()
+        refund_sale(sale.pk, [{'item': item.pk, 'quantity': '1'}])
+        # Прошлые возвраты насчитали больше суммы чека (например, ручная правка)
+        Refund.objects.filter(sale=sale).update(total_amount=Decimal('350.00'))
+
+        refund = refund_sale(sale.pk)
+
+        items_total = refund.items.aggregate(total=Sum('amount'))['total']
+        self.assertEqual(items_total, Decimal('0.00'))
+        self.assertEqual(refund.total_amount, items_total)
+
+    def test_destroy_refunded_sale_returns_400(self):
+        sale = self.paid_sale()
+        refund_sale(sale.pk)
+
+        request = tenant_request('delete', f'/api/sales/sales/{sale.pk}/')
+        response = SaleViewSet.as_view({'delete': 'destroy'})(request, pk=sale.pk)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+        self.assertTrue(Sale.objects.filter(pk=sale.pk).exists())
+
+    def test_refund_payment_is_read_only(self):
+        sale = self.paid_sale()
+        refund_sale(sale.pk)
+        payment = Payment.objects.get(refund__sale=sale)
+        view = PaymentViewSet.as_view({'patch': 'partial_update', 'delete': 'destroy'})
+
+        patch = tenant_request('patch', f'/api/sales/payments/{payment.pk}/', {'amount': '0.00'})
+        delete = tenant_request('delete', f'/api/sales/payments/{payment.pk}/')
+
+        self.assertEqual(view(patch, pk=payment.pk).status_code, 400)
+        self.assertEqual(view(delete, pk=payment.pk).status_code, 400)
+        self.assertEqual(Payment.objects.get(pk=payment.pk).amount, -sale.total_amount)
+
+    def test_serializer_rejects_refund_payment_update(self):
+        sale = self.paid_sale()
+        refund_sale(sale.pk)
+        payment = Payment.objects.get(refund__sale=sale)
+
+        serializer = PaymentSerializer(payment, data={'notes': 'правка'}, partial=True)
+
+        self.assertFalse(serializer.is_valid())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DraftCheckoutTests(TestCase):
+    """Оплата черновика из кеша (sales/drafts.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = Unit.objects.create(name='штука', short_name='шт')
+        cls.milk = make_product(unit, 'Milk')
+        cls.session = open_session()
+
+    def test_invalid_payment_method_keeps_cart(self):
+        drafts.scan('public', self.session.pk, self.milk.pk)
+
+        for payments in ([{'amount': '100.00'}], [{'payment_method': 'bitcoin', 'amount': '100.00'}]):
+            with self.assertRaises(ScanError) as raised:
+                drafts.checkout('public', self.session.pk, payments)
+            self.assertEqual(raised.exception.code, 'invalid_payment')
+
+        self.assertFalse(Sale.objects.exists())
+        self.assertIsNotNone(drafts.get_cart('public', self.session.pk))
+
+        sale_id = drafts.checkout('public', self.session.pk, [{'payment_method': 'cash', 'amount': '100.00'}])
+        self.assertEqual(Sale.objects.get(pk=sale_id).status, 'completed')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DayTotalsTests(TestCase):
+    """Итоги дня живой ленты и день сводки кассиров (sales/stats.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = Unit.objects.create(name='штука', short_name='шт')
+        cls.milk = make_product(unit, 'Milk')
+        cls.session = open_session()
+
+    def test_includes_sales_without_cashier(self):
+        result = scan_item(self.session.pk, self.milk.pk, Decimal('2'))
+        checkout_sale(result.sale.pk, [{'payment_method': 'cash', 'amount': '200.00'}])
+        refund_sale(result.sale.pk, [{'item': result.sale.items.get().pk, 'quantity': '1'}])
+
+        totals = day_totals()
+
+        self.assertEqual(totals['date'], timezone.localdate().isoformat())
+        self.assertEqual(totals['sales_count'], 1)
+        self.assertEqual(totals['sales_amount'], '100.00')
+        self.assertEqual(totals['cash_amount'], '100.00')
+        self.assertFalse(CashierDailyStats.objects.exists())
+
+    def test_offline_sale_counted_on_completed_day(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        completed_at = timezone.localtime().replace(hour=12) - timedelta(days=1)
+
+        upload_sales(self.session.pk, [{
+            'client_uuid': str(uuid.uuid4()),
+            'items': [{'product_id': self.milk.pk, 'quantity': 1}],
+            'payments': [{'payment_method': 'card', 'amount': '100.00'}],
+            'completed_at': completed_at.isoformat(),
+        }], cashier_id=7)
+
+        self.assertEqual(day_totals(yesterday)['sales_count'], 1)
+        self.assertEqual(day_totals()['sales_count'], 0)
+        stats = CashierDailyStats.objects.get()
+        self.assertEqual((stats.date, stats.cashier_id, stats.sales_count), (yesterday, 7, 1))
@@ -5,8 +5,9 @@ ViewSets для sales app.
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Sum, Count
 from django.utils import timezone
 
@@ -20,6 +21,9 @@ from sales.serializers import (
     SaleDetailSerializer, SaleCreateUpdateSerializer,
     SaleItemSerializer, PaymentSerializer, CashMovementSerializer
 )
+from sales.live import EventStreamRenderer
+from core.idempotency import idempotent
+from core.pagination import CursorOrPageNumberPagination
 from core.permissions import IsTenantUser
 
 
@@ -231,38 +235,22 @@ class CashierSessionViewSet(viewsets.ModelViewSet):
         """Получить отчёт по смене"""
         session = self.get_object()
 
-        # Статистика по продажам
-        sales_stats = session.sales.filter(status='completed').aggregate(
-            total_sales=Sum('total_amount'),
-            total_items=Sum('items__quantity'),
-            count=Count('id')
-        )
-
-        # Статистика по платежам
-        payment_stats = session.payments.filter(
-            sale__status='completed'
-        ).values('payment_method').annotate(
-            total=Sum('amount'),
-            count=Count('id')
-        )
-
-        # Движения наличности
-        cash_movements = session.cash_movements.aggregate(
-            cash_in=Sum('amount', filter=models.Q(movement_type='cash_in')),
-            cash_out=Sum('amount', filter=models.Q(movement_type='cash_out'))
-        )
-
+        # Счётчики смены ведутся при оплате, возврате и движении наличности
         report = {
             'session': CashierSessionSerializer(session).data,
             'sales': {
-                'total_amount': sales_stats['total_sales'] or 0,
-                'total_items': sales_stats['total_items'] or 0,
-                'count': sales_stats['count'] or 0,
+                'total_amount': session.sales_amount,
+                'total_items': session.items_quantity,
+                'count': session.sales_count,
             },
-            'payments': list(payment_stats),
+            'refunds': {
+                'total_amount': session.refunds_amount,
+                'count': session.refunds_count,
+            },
+            'payments': session.payment_totals(),
             'cash_movements': {
-                'cash_in': cash_movements['cash_in'] or 0,
-                'cash_out': cash_movements['cash_out'] or 0,
+                'cash_in': session.cash_in_amount,
+                'cash_out': session.cash_out_amount,
             }
         }
 
@@ -281,19 +269,17 @@ class CashierSessionViewSet(viewsets.ModelViewSet):
         - limit: количество топ кассиров (опционально, по умолчанию все)
         """
         from datetime import datetime
-        from django.db.models import Sum, Count, Q, DecimalField
-        from django.db.models.functions import Coalesce
         from django.utils import timezone
-        from users.models import Employee
+        from sales.stats import cashier_leaderboard
 
         # Параметры фильтрации по дате
         date_from = request.query_params.get('date_from')
         date_to = request.query_params.get('date_to')
         limit = request.query_params.get('limit')
 
-        # Дефолтные даты: начало месяца - сегодня
+        # Дефолтные даты: начало месяца (по местному времени) - сегодня
         if not date_from:
-            date_from = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            date_from = timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         else:
             # Поддержка формата YYYY-MM-DD и YYYY-MM-DDTHH:MM:SS
             if 'T' not in date_from:
@@ -312,64 +298,8 @@ class CashierSessionViewSet(viewsets.ModelViewSet):
             else:
                 date_to = timezone.make_aware(datetime.fromisoformat(date_to))
 
-        # Получаем статистику по продажам напрямую из Sale.cashier
-        from sales.models import Sale, Payment
-
-        cashier_stats = Sale.objects.filter(
-            created_at__gte=date_from,
-            created_at__lte=date_to,
-            status='completed',
-            cashier__isnull=False
-        ).values(
-            'cashier__id',
-            'cashier__first_name',
-            'cashier__last_name',
-            'cashier__phone',
-            'cashier__role'
-        ).annotate(
-            total_sales=Coalesce(Sum('total_amount'), 0, output_field=DecimalField()),
-            sales_count=Count('id')
-        ).order_by('-total_sales')
-
-        # Получаем статистику по способам оплаты для каждого кассира
-        cashiers_list = []
-        for stat in cashier_stats:
-            cashier_id = stat['cashier__id']
-
-            # Статистика по оплатам
-            payment_stats = Payment.objects.filter(
-                sale__cashier_id=cashier_id,
-                sale__created_at__gte=date_from,
-                sale__created_at__lte=date_to,
-                sale__status='completed'
-            ).aggregate(
-                cash_total=Coalesce(Sum('amount', filter=Q(payment_method='cash')), 0, output_field=DecimalField()),
-                card_total=Coalesce(Sum('amount', filter=Q(payment_method='card')), 0, output_field=DecimalField())
-            )
-
-            # Подсчет смен (уникальных сессий, в которых кассир работал)
-            sessions_count = Sale.objects.filter(
-                cashier_id=cashier_id,
-                created_at__gte=date_from,
-                created_at__lte=date_to,
-                status='completed'
-            ).values('session').distinct().count()
-
-            cashiers_list.append({
-                'id': cashier_id,
-                'full_name': f"{stat['cashier__last_name']} {stat['cashier__first_name']}".strip(),
-                'phone': stat['cashier__phone'],
-                'role': stat['cashier__role'],
-                'total_sales': str(stat['total_sales']),
-                'cash_sales': str(payment_stats['cash_total']),
-                'card_sales': str(payment_stats['card_total']),
-                'sales_count': stat['sales_count'],
-                'sessions_count': sessions_count
-            })
-
-        # Ограничиваем количество если указан limit
-        if limit:
-            cashiers_list = cashiers_list[:int(limit)]
+        # Один запрос: по дневной сводке (целые дни) или по продажам
+        cashiers_list = cashier_leaderboard(date_from, date_to, limit=limit)
 
         return Response({
             'status': 'success',
@@ -407,6 +337,7 @@ class SaleViewSet(viewsets.ModelViewSet):
     search_fields = ['receipt_number', 'customer_name', 'customer_phone']
     ordering_fields = ['created_at', 'completed_at', 'total_amount']
     ordering = ['-created_at']
+    pagination_class = CursorOrPageNumberPagination  # ?pagination=cursor для больших списков
 
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия"""
@@ -416,25 +347,69 @@ class SaleViewSet(viewsets.ModelViewSet):
             return SaleDetailSerializer
         return SaleSerializer
 
+    def destroy(self, request, *args, **kwargs):
+        """Удалить продажу (продажу с возвратами удалить нельзя - on_delete=PROTECT)"""
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except models.ProtectedError:
+            return Response(
+                {'error': 'Нельзя удалить продажу: по ней оформлен возврат'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    @staticmethod
+    def _sale_detail_data(sale_id):
+        """Полный чек для ответа после изменения позиций (свежие данные, без N+1)"""
+        sale = Sale.objects.select_related(
+            'session__cash_register', 'session__cashier', 'cashier', 'customer'
+        ).prefetch_related(
+            'items__product', 'items__batch', 'payments', 'refunds__items__sale_item'
+        ).get(pk=sale_id)
+        return SaleDetailSerializer(sale).data
+
+    @staticmethod
+    def _response_mode(request):
+        """full или compact - из тела запроса или query параметра response"""
+        return request.data.get('response') or request.query_params.get('response', 'full')
+
+    @staticmethod
+    def _compact_data(sale, item, item_created=False, item_removed=False):
+        """Ответ response=compact после изменения позиции (один агрегат вместо чтения всего чека)"""
+        from decimal import Decimal
+        from sales.pos import compact_sale_data
+
+        totals = SaleItem.objects.filter(sale_id=sale.pk).aggregate(
+            items_count=Count('id'),
+            total_quantity=Sum('quantity')
+        )
+        return compact_sale_data(
+            sale, item, totals['items_count'], totals['total_quantity'] or Decimal('0'),
+            item_created=item_created, item_removed=item_removed
+        )
+
     @action(detail=False, methods=['post'])
+    @idempotent
     def scan_item(self, request):
         """
         Сканирование товара на кассе.
         Создаёт новую продажу (черновик) или добавляет товар в текущую незавершённую продажу.
 
+        Выполняется не более чем за 4 SQL запроса (sales.pos.scan_item).
+
         Body:
         - session: ID кассовой смены
         - product: ID товара
         - quantity: количество (по умолчанию 1)
         - batch: ID партии (опционально)
+        - response: full (по умолчанию, весь чек) или compact (итоги чека и позиция)
         """
-        from products.models import Product, ProductBatch
-        from decimal import Decimal
+        from decimal import Decimal, InvalidOperation
+        from sales.pos import ScanError, scan_item
 
         session_id = request.data.get('session')
         product_id = request.data.get('product')
-        quantity = Decimal(str(request.data.get('quantity', 1)))
-        batch_id = request.data.get('batch')
+        batch_id = request.data.get('batch') or None
+        response_mode = self._response_mode(request)
 
         if not session_id or not product_id:
             return Response(
@@ -443,39 +418,15 @@ class SaleViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            session = CashierSession.objects.get(id=session_id, status='open')
-        except CashierSession.DoesNotExist:
-            return Response(
-                {'error': 'Смена не найдена или закрыта'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        try:
-            product = Product.objects.select_related('pricing').get(id=product_id)
-        except Product.DoesNotExist:
+            quantity = Decimal(str(request.data.get('quantity', 1)))
+        except (InvalidOperation, ValueError, TypeError):
+            quantity = None
+        if quantity is None or quantity <= 0:
             return Response(
-                {'error': 'Товар не найден'},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': 'Количество должно быть больше 0'},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        batch = None
-        if batch_id:
-            try:
-                batch = ProductBatch.objects.get(id=batch_id, product=product)
-            except ProductBatch.DoesNotExist:
-                return Response(
-                    {'error': 'Партия не найдена'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-        else:
-            # Автоматический выбор партии (FEFO - First Expired, First Out)
-            # Выбираем партию с самым ранним сроком годности и достаточным количеством
-            batch = ProductBatch.objects.filter(
-                product=product,
-                quantity__gte=quantity,
-                is_active=True
-            ).order_by('expiry_date', 'received_at').first()
-
         # Получаем кассира из request.data (для общего аккаунта) или request.employee
         cashier_id = request.data.get('cashier')
         if not cashier_id:
@@ -483,96 +434,119 @@ class SaleViewSet(viewsets.ModelViewSet):
             cashier = getattr(request, 'employee', None)
             cashier_id = cashier.id if cashier else None
 
-        # Ищем текущую незавершённую продажу этой смены
-        sale = Sale.objects.filter(
-            session=session,
-            status='pending'
-        ).order_by('-created_at').first()
-
-        # Если нет незавершённой продажи - создаём новую
-        if not sale:
-            # Генерируем номер чека
-            from django.utils import timezone
-            receipt_number = f"CHECK-{timezone.now().strftime('%Y%m%d%H%M%S')}"
-
-            sale = Sale.objects.create(
-                session=session,
-                receipt_number=receipt_number,
-                status='pending',
-                cashier_id=cashier_id  # Заполняем ID кассира для статистики
-            )
+        try:
+            result = scan_item(session_id, product_id, quantity, batch_id=batch_id, cashier_id=cashier_id)
+        except ScanError as e:
+            if e.data is not None:
+                return Response({
+                    'status': 'error',
+                    'code': e.code,
+                    'message': e.message,
+                    'data': e.data
+                }, status=e.status_code)
+            return Response({'error': e.message}, status=e.status_code)
+
+        if response_mode == 'compact':
+            data = result.compact_data()
         else:
-            # Если продажа существует, но cashier не заполнен - заполняем
-            if not sale.cashier_id and cashier_id:
-                sale.cashier_id = cashier_id
-                sale.save(update_fields=['cashier_id'])
+            data = self._sale_detail_data(result.sale.pk)
 
-        # ПРОВЕРКА НАЛИЧИЯ ТОВАРА
-        # Получаем доступное количество из inventory
-        available_qty = Decimal('0')
-        if hasattr(product, 'inventory') and product.inventory:
-            if product.inventory.track_inventory:
-                available_qty = Decimal(str(product.inventory.quantity or 0))
-            else:
-                # Если учет не ведется - считаем что товар всегда доступен
-                available_qty = Decimal('999999')  # Очень большое число
-        else:
-            # Если нет inventory - считаем что товара нет
-            available_qty = Decimal('0')
+        return Response({
+            'status': 'success',
+            'message': 'Товар добавлен',
+            'data': data
+        }, status=status.HTTP_200_OK)
 
-        # Проверяем, сколько уже добавлено в текущую продажу
-        existing_item = SaleItem.objects.filter(
-            sale=sale,
-            product=product,
-            batch=batch
-        ).first()
+    @action(detail=False, methods=['post'], url_path='bulk-upload')
+    def bulk_upload(self, request):
+        """
+        Загрузка чеков, пробитых кассой без связи (sales.offline).
 
-        current_qty_in_sale = existing_item.quantity if existing_item else Decimal('0')
-        total_requested = current_qty_in_sale + quantity
+        Чеки записываются пачками с bulk_create, повторная загрузка
+        того же client_uuid возвращает уже созданную продажу.
 
-        if total_requested > available_qty:
-            return Response({
-                'status': 'error',
-                'code': 'insufficient_stock',
-                'message': f'Недостаточно товара на складе. Доступно: {available_qty}, запрошено: {total_requested}',
-                'data': {
-                    'available': str(available_qty),
-                    'requested': str(total_requested),
-                    'current_in_sale': str(current_qty_in_sale)
-                }
-            }, status=status.HTTP_400_BAD_REQUEST)
+        Body:
+        - session: ID кассовой смены
+        - cashier: ID кассира (опционально)
+        - sales: [{"client_uuid": "...", "items": [{"product_id": 1, "quantity": 2, "unit_price": 5000}],
+                   "payments": [{"payment_method": "cash", "amount": 10000}],
+                   "customer_id": 5, "discount_percent": 0, "completed_at": "2025-01-17T10:15:00+05:00"}]
+        """
+        from sales.offline import OfflineSaleError, upload_sales
 
-        # Получаем цену товара из pricing
-        unit_price = Decimal('0.00')
-        if hasattr(product, 'pricing') and product.pricing:
-            unit_price = product.pricing.sale_price or product.pricing.cost_price or Decimal('0.00')
+        session_id = request.data.get('session')
+        sales_data = request.data.get('sales')
 
-        if existing_item:
-            # Увеличиваем количество существующей позиции
-            existing_item.quantity += quantity
-            existing_item.save()
-            sale_item = existing_item
-        else:
-            # Создаём новую позицию
-            sale_item = SaleItem.objects.create(
-                sale=sale,
-                product=product,
-                batch=batch,
-                quantity=quantity,
-                unit_price=unit_price
+        if not session_id or not isinstance(sales_data, list):
+            return Response(
+                {'error': 'Укажите session и список sales'},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Пересчитываем суммы
-        sale.calculate_totals()
+        cashier_id = request.data.get('cashier')
+        if not cashier_id:
+            cashier = getattr(request, 'employee', None)
+            cashier_id = cashier.id if cashier else None
+
+        try:
+            data = upload_sales(session_id, sales_data, cashier_id=cashier_id)
+        except OfflineSaleError as e:
+            status_code = status.HTTP_404_NOT_FOUND if e.code == 'session_not_found' else status.HTTP_400_BAD_REQUEST
+            return Response({'error': e.message}, status=status_code)
 
-        serializer = SaleDetailSerializer(sale)
         return Response({
             'status': 'success',
-            'message': 'Товар добавлен',
-            'data': serializer.data
-        }, status=status.HTTP_200_OK)
+            'message': f'Загружено чеков: {data["created"]}, повторов: {data["duplicate"]}, отклонено: {data["rejected"]}',
+            'data': data
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Потоковая выгрузка продаж, позиций или платежей (sales.export).
+
+        GET /api/sales/sales/export/?dataset=items&output=jsonl&date_from=2025-01-01&date_to=2025-01-31
+
+        Параметры:
+        - dataset: sales (по умолчанию), items или payments
+        - output: csv (по умолчанию) или jsonl
+        - date_from, date_to: период по дате продажи (YYYY-MM-DD или YYYY-MM-DDTHH:MM:SS)
+        - status: статусы продаж через запятую (например completed,refunded)
+        - session: ID кассовой смены (опционально)
+        """
+        from django.http import StreamingHttpResponse
+        from sales.export import EXPORT_FORMATS, ExportError, export_queryset, parse_date_bound, stream_export
+
+        dataset = request.query_params.get('dataset', 'sales')
+        export_format = request.query_params.get('output', 'csv')
+        statuses = [value for value in request.query_params.get('status', '').split(',') if value]
+
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f'Неизвестный формат: {export_format}. Доступно: {", ".join(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            date_from = parse_date_bound(request.query_params.get('date_from'))
+            date_to = parse_date_bound(request.query_params.get('date_to'), end=True)
+            headers, queryset = export_queryset(
+                dataset, date_from, date_to, statuses,
+                session_id=request.query_params.get('session')
+            )
+        except ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            stream_export(request.schema_name, headers, queryset, export_format),
+            content_type=EXPORT_FORMATS[export_format]
+        )
+        filename = f'{dataset}_{timezone.localdate():%Y%m%d}.{export_format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def add_item(self, request, pk=None):
         """
         Добавить товар в существующую продажу.
@@ -581,6 +555,7 @@ class SaleViewSet(viewsets.ModelViewSet):
         - product: ID товара
         - quantity: количество
         - batch: ID партии (опционально)
+        - response: full (по умолчанию, весь чек) или compact (итоги чека и позиция)
         """
         from products.models import Product, ProductBatch
         from decimal import Decimal
@@ -659,32 +634,44 @@ class SaleViewSet(viewsets.ModelViewSet):
         if hasattr(product, 'pricing') and product.pricing:
             unit_price = product.pricing.sale_price or product.pricing.cost_price or Decimal('0.00')
 
-        # Добавляем позицию
-        SaleItem.objects.create(
-            sale=sale,
-            product=product,
-            batch=batch,
-            quantity=quantity,
-            unit_price=unit_price
-        )
+        with transaction.atomic():
+            # Добавляем позицию
+            item = SaleItem.objects.create(
+                sale=sale,
+                product=product,
+                batch=batch,
+                quantity=quantity,
+                unit_price=unit_price
+            )
 
-        # Пересчитываем суммы
-        sale.calculate_totals()
+            # Итоги приращением, без пересчёта всех позиций
+            if not sale.apply_line_delta(item.line_total):
+                transaction.set_rollback(True)
+                return Response(
+                    {'error': 'Можно добавлять товары только в незавершённую продажу'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        if self._response_mode(request) == 'compact':
+            data = self._compact_data(sale, item, item_created=True)
+        else:
+            data = self._sale_detail_data(sale.pk)
 
-        serializer = SaleDetailSerializer(sale)
         return Response({
             'status': 'success',
             'message': 'Товар добавлен',
-            'data': serializer.data
+            'data': data
         })
 
     @action(detail=True, methods=['delete'])
+    @idempotent
     def remove_item(self, request, pk=None):
         """
         Удалить товар из продажи.
 
         Body:
         - item_id: ID позиции (SaleItem)
+        - response: full (по умолчанию, весь чек) или compact (итоги чека и удалённая позиция)
         """
         sale = self.get_object()
 
@@ -702,26 +689,39 @@ class SaleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            item = sale.items.get(id=item_id)
+        with transaction.atomic():
+            item = SaleItem.objects.select_related('product').filter(sale=sale, id=item_id).first()
+            if item is None:
+                return Response(
+                    {'error': 'Товар не найден в этой продаже'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            removed_id = item.pk
             item.delete()
+            # delete() обнуляет pk, а компактный ответ возвращает ID удалённой позиции
+            item.pk = removed_id
 
-            # Пересчитываем суммы
-            sale.calculate_totals()
+            # Итоги приращением, без пересчёта всех позиций
+            if not sale.apply_line_delta(-item.line_total):
+                transaction.set_rollback(True)
+                return Response(
+                    {'error': 'Можно удалять товары только из незавершённой продажи'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-            serializer = SaleDetailSerializer(sale)
-            return Response({
-                'status': 'success',
-                'message': 'Товар удалён',
-                'data': serializer.data
-            })
-        except SaleItem.DoesNotExist:
-            return Response(
-                {'error': 'Товар не найден в этой продаже'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+        if self._response_mode(request) == 'compact':
+            data = self._compact_data(sale, item, item_removed=True)
+        else:
+            data = self._sale_detail_data(sale.pk)
+
+        return Response({
+            'status': 'success',
+            'message': 'Товар удалён',
+            'data': data
+        })
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def checkout(self, request, pk=None):
         """
         Завершить продажу (оформить оплату).
@@ -731,7 +731,8 @@ class SaleViewSet(viewsets.ModelViewSet):
         - cashier_id: ID кассира (опционально, если не был указан в scan_item)
         - customer_id: ID клиента (опционально)
         """
-        from decimal import Decimal
+        from products.stock import InsufficientStockError
+        from sales.checkout import CheckoutError, checkout_sale
 
         sale = self.get_object()
 
@@ -741,87 +742,36 @@ class SaleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Проверяем что есть товары
-        if not sale.items.exists():
-            return Response(
-                {'error': 'Нельзя завершить продажу без товаров'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Обновляем cashier_id если передан и ещё не заполнен
         cashier_id = request.data.get('cashier_id') or request.data.get('cashier')
-        if cashier_id and not sale.cashier_id:
-            sale.cashier_id = cashier_id
-            sale.save(update_fields=['cashier_id'])
-
-        # Обновляем customer_id если передан
         customer_id = request.data.get('customer_id') or request.data.get('customer')
-        if customer_id and not sale.customer_id:
-            sale.customer_id = customer_id
-            sale.save(update_fields=['customer_id'])
-
-        payments_data = request.data.get('payments', [])
 
-        if not payments_data:
-            return Response(
-                {'error': 'Укажите способ оплаты'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Создаём платежи
-        total_paid = Decimal('0.00')
-        for payment_data in payments_data:
-            payment_method = payment_data.get('payment_method')
-            amount = Decimal(str(payment_data.get('amount', 0)))
-            received_amount = payment_data.get('received_amount')
-
-            if received_amount:
-                received_amount = Decimal(str(received_amount))
-
-            # Валидация для наличных
-            if payment_method == 'cash' and received_amount:
-                if received_amount < amount:
-                    return Response(
-                        {'error': 'Полученная сумма не может быть меньше суммы платежа'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-            Payment.objects.create(
-                sale=sale,
-                session=sale.session,
-                payment_method=payment_method,
-                amount=amount,
-                received_amount=received_amount,
-                card_last4=payment_data.get('card_last4'),
-                transaction_id=payment_data.get('transaction_id'),
-                notes=payment_data.get('notes', '')
-            )
-
-            total_paid += amount
-
-        # Проверяем что оплачено достаточно
-        if total_paid < sale.total_amount:
-            return Response(
-                {'error': f'Недостаточно оплачено. Нужно: {sale.total_amount}, Оплачено: {total_paid}'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Завершаем продажу
+        # Блокировка продажи, списание, резервы, платежи и статус - одна транзакция:
+        # при любой ошибке ничего не сохраняется (sales.checkout)
         try:
-            sale.complete_sale()
-            serializer = SaleDetailSerializer(sale)
-            return Response({
-                'status': 'success',
-                'message': 'Продажа завершена',
-                'data': serializer.data
-            })
+            checkout_sale(
+                sale.pk,
+                request.data.get('payments', []),
+                cashier_id=cashier_id,
+                customer_id=customer_id
+            )
+        except CheckoutError as e:
+            return Response({'error': e.message}, status=e.status_code)
+        except InsufficientStockError as e:
+            return Response({'error': str(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        return Response({
+            'status': 'success',
+            'message': 'Продажа завершена',
+            'data': self._sale_detail_data(sale.pk)
+        })
+
     @action(detail=True, methods=['post'])
+    @idempotent
     def complete(self, request, pk=None):
         """Завершить продажу (legacy метод, используйте checkout)"""
         sale = self.get_object()
@@ -843,8 +793,7 @@ class SaleViewSet(viewsets.ModelViewSet):
 
         try:
             sale.complete_sale()
-            serializer = SaleDetailSerializer(sale)
-            return Response(serializer.data)
+            return Response(self._sale_detail_data(sale.pk))
         except Exception as e:
             return Response(
                 {'error': str(e)},
@@ -852,6 +801,7 @@ class SaleViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def cancel(self, request, pk=None):
         """Отменить продажу"""
         sale = self.get_object()
@@ -875,33 +825,48 @@ class SaleViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def refund(self, request, pk=None):
-        """Оформить возврат"""
+        """
+        Оформить возврат - весь чек или выбранные позиции (sales.refunds).
+
+        Товар возвращается в партии списания, деньги - платежами
+        с отрицательной суммой, счётчики смены уменьшаются, всё одной транзакцией.
+
+        Body (всё опционально, без items - возврат всего, что ещё не возвращено):
+        - items: [{"item": ID позиции, "quantity": 1}]
+        - payment_method: способ возврата денег (по умолчанию - способами оплаты чека)
+        - reason: причина возврата
+        - cashier: ID кассира
+        """
+        from sales.refunds import RefundError, refund_sale
+
         sale = self.get_object()
 
-        if sale.status != 'completed':
+        cashier_id = request.data.get('cashier')
+        if not cashier_id:
+            cashier = getattr(request, 'employee', None)
+            cashier_id = cashier.id if cashier else None
+
+        items_data = request.data.get('items')
+        if items_data is not None and not isinstance(items_data, list):
             return Response(
-                {'error': 'Можно вернуть только завершённую продажу'},
+                {'error': 'items должен быть списком'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        sale.status = 'refunded'
-        sale.save()
-
-        # Освобождаем резервирования и возвращаем товар на склад (prefetch для оптимизации)
-        items = sale.items.select_related('reservation', 'batch').all()
-        for item in items:
-            if item.reservation:
-                item.reservation.status = 'cancelled'
-                item.reservation.save()
-
-                # Возвращаем количество в партию
-                if item.batch:
-                    item.batch.quantity += item.quantity
-                    item.batch.save()
+        try:
+            refund_sale(
+                sale.pk,
+                items_data=items_data,
+                payment_method=request.data.get('payment_method'),
+                cashier_id=cashier_id,
+                reason=request.data.get('reason', '')
+            )
+        except RefundError as e:
+            return Response({'error': e.message}, status=e.status_code)
 
-        serializer = SaleDetailSerializer(sale)
-        return Response(serializer.data)
+        return Response(self._sale_detail_data(sale.pk))
 
     @action(detail=False, methods=['get'])
     def current(self, request):
@@ -965,6 +930,208 @@ class SaleViewSet(viewsets.ModelViewSet):
         serializer = SaleSerializer(sales, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def live(self, request):
+        """
+        Живая лента продаж магазина (Server-Sent Events, sales.live).
+
+        GET /api/sales/sales/live/ с Accept: text/event-stream и теми же
+        заголовками Authorization / X-Tenant-Key, что у остального API.
+
+        События: totals (итоги дня при подключении), sale.completed,
+        sale.refunded, sales.uploaded - каждое с новыми итогами дня.
+        Работает только под ASGI.
+        """
+        from django.http import StreamingHttpResponse
+        from sales.live import live_stream
+        from sales.stats import day_totals
+
+        response = StreamingHttpResponse(
+            live_stream(request.schema_name, day_totals()),
+            content_type='text/event-stream; charset=utf-8'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # nginx не должен буферизовать поток
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class DraftCartViewSet(viewsets.ViewSet):
+    """
+    Черновик чека в кеше (sales.drafts), pk - ID кассовой смены.
+
+    Сканирование и удаление товаров не пишут в БД,
+    продажа создаётся только при оплате (checkout).
+    """
+
+    permission_classes = [IsTenantUser]
+
+    def _response(self, cart):
+        return Response({
+            'status': 'success',
+            'data': cart.data()
+        })
+
+    def _error(self, e):
+        if e.data is not None:
+            return Response({
+                'status': 'error',
+                'code': e.code,
+                'message': e.message,
+                'data': e.data
+            }, status=e.status_code)
+        return Response({'error': e.message}, status=e.status_code)
+
+    def _quantity(self, request, default=1):
+        from decimal import Decimal, InvalidOperation
+
+        try:
+            quantity = Decimal(str(request.data.get('quantity', default)))
+            # NaN и бесконечность не сравниваются/не хранятся
+            return quantity if quantity.is_finite() and quantity > 0 else None
+        except (InvalidOperation, ValueError, TypeError):
+            return None
+
+    def retrieve(self, request, pk=None):
+        """Текущий черновик смены"""
+        from sales import drafts
+        from sales.pos import ScanError
+
+        try:
+            cart = drafts.get_cart(request.schema_name, pk)
+        except ScanError as e:
+            return self._error(e)
+        if cart is None:
+            return Response(
+                {'error': 'Черновик не найден'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return self._response(cart)
+
+    def destroy(self, request, pk=None):
+        """Отменить черновик"""
+        from sales import drafts
+        from sales.pos import ScanError
+
+        try:
+            drafts.clear(request.schema_name, pk)
+        except ScanError as e:
+            return self._error(e)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    @idempotent
+    def scan(self, request, pk=None):
+        """
+        Добавить товар в черновик.
+
+        Body:
+        - product: ID товара
+        - quantity: количество (по умолчанию 1)
+        - batch: ID партии (опционально)
+        """
+        from sales import drafts
+        from sales.pos import ScanError
+
+        product_id = request.data.get('product')
+        if not product_id:
+            return Response(
+                {'error': 'Укажите product'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        quantity = self._quantity(request)
+        if quantity is None:
+            return Response(
+                {'error': 'Количество должно быть больше 0'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cashier_id = request.data.get('cashier')
+        if not cashier_id:
+            cashier = getattr(request, 'employee', None)
+            cashier_id = cashier.id if cashier else None
+
+        try:
+            cart = drafts.scan(
+                request.schema_name, pk, product_id, quantity,
+                batch_id=request.data.get('batch') or None,
+                cashier_id=cashier_id
+            )
+        except ScanError as e:
+            return self._error(e)
+        return self._response(cart)
+
+    @action(detail=True, methods=['post'], url_path='remove-item')
+    @idempotent
+    def remove_item(self, request, pk=None):
+        """
+        Убрать товар из черновика.
+
+        Body:
+        - product: ID товара
+        - batch: ID партии (если товар сканировали с партией)
+        - quantity: сколько убрать (по умолчанию позицию целиком)
+        """
+        from sales import drafts
+        from sales.pos import ScanError
+
+        product_id = request.data.get('product')
+        if not product_id:
+            return Response(
+                {'error': 'Укажите product'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        quantity = None
+        if request.data.get('quantity') is not None:
+            quantity = self._quantity(request)
+            if quantity is None:
+                return Response(
+                    {'error': 'Количество должно быть больше 0'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        try:
+            cart = drafts.remove(
+                request.schema_name, pk, product_id,
+                batch_id=request.data.get('batch') or None,
+                quantity=quantity
+            )
+        except ScanError as e:
+            return self._error(e)
+        return self._response(cart)
+
+    @action(detail=True, methods=['post'])
+    @idempotent
+    def checkout(self, request, pk=None):
+        """
+        Оплатить черновик: продажа, позиции, платежи и списание - одна транзакция.
+
+        Body:
+        - payments: [{"payment_method": "cash", "amount": 150000, "received_amount": 200000}]
+        - cashier_id: ID кассира (опционально)
+        - customer_id: ID клиента (опционально)
+        """
+        from sales import drafts
+        from sales.pos import ScanError
+
+        try:
+            sale_id = drafts.checkout(
+                request.schema_name, pk,
+                request.data.get('payments', []),
+                cashier_id=request.data.get('cashier_id') or request.data.get('cashier'),
+                customer_id=request.data.get('customer_id') or request.data.get('customer')
+            )
+        except ScanError as e:
+            return self._error(e)
+
+        return Response({
+            'status': 'success',
+            'message': 'Продажа завершена',
+            'data': SaleViewSet._sale_detail_data(sale_id)
+        })
+
 
 class SaleItemViewSet(viewsets.ModelViewSet):
     """ViewSet для позиций продажи"""
@@ -977,6 +1144,16 @@ class SaleItemViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at']
     ordering = ['created_at']
 
+    def destroy(self, request, *args, **kwargs):
+        """Удалить позицию (возвращённую позицию удалить нельзя - on_delete=PROTECT)"""
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except models.ProtectedError:
+            return Response(
+                {'error': 'Нельзя удалить позицию: по ней оформлен возврат'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
 
 class PaymentViewSet(viewsets.ModelViewSet):
     """ViewSet для платежей"""
@@ -989,6 +1166,24 @@ class PaymentViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at', 'amount']
     ordering = ['-created_at']
 
+    def update(self, request, *args, **kwargs):
+        """Изменить платёж (платёж возврата уже учтён в счётчиках смены и отчётах - только через возврат)"""
+        if self.get_object().refund_id:
+            return Response(
+                {'error': 'Платёж возврата нельзя изменить'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return super().update(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        """Удалить платёж (платёж возврата удалить нельзя)"""
+        if self.get_object().refund_id:
+            return Response(
+                {'error': 'Платёж возврата нельзя удалить'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return super().destroy(request, *args, **kwargs)
+
 
 class CashMovementViewSet(viewsets.ModelViewSet):
     """ViewSet для движения наличности"""
@@ -6,6 +6,7 @@ Usage:
     python manage.py migrate_tenant_schemas --store test_shop
 """
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.core.management import call_command
 from django.db import connection
@@ -85,6 +86,14 @@ class Command(BaseCommand):
                 self.stdout.write('  Создание таблиц...')
                 call_command('migrate', verbosity=1, interactive=False, run_syncdb=True)
 
+                # Секции таблиц продаж (core.partitioning) - после миграций,
+                # чтобы перевод шёл по актуальной структуре таблиц
+                from core.partitioning import is_supported, partition_sales_tables
+                if settings.SALES_PARTITIONING and is_supported():
+                    converted = partition_sales_tables(settings.SALES_PARTITION_MONTHS_AHEAD)
+                    if converted:
+                        self.stdout.write(f'  ✓ Секционированы: {", ".join(converted)}')
+
                 success_count += 1
                 self.stdout.write(self.style.SUCCESS(
                     f'✅ Миграции применены к {store.name}'